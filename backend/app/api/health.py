@@ -1,7 +1,22 @@
 from fastapi import APIRouter
 
+from app.services.retriever import get_retrieval_cache_stats
+from app.services.embedding_cache import get_embedding_cache
+from app.services.embeddings import get_query_coalescer_stats
+from app.vectorstore.store_manager import get_store_cache_stats
+
 router = APIRouter()
 
 @router.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@router.get("/health/cache")
+def cache_stats():
+    embedding_cache = get_embedding_cache()
+    return {
+        "stores": get_store_cache_stats(),
+        "retrieval": get_retrieval_cache_stats(),
+        "embeddings": embedding_cache.stats() if embedding_cache else None,
+        "query_coalescer": get_query_coalescer_stats(),
+    }
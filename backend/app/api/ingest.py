@@ -3,8 +3,14 @@ import logging
 
 from app.services.file_loader import extract_text_from_file
 from app.services.chunker import chunk_text
-from app.services.embeddings import embed_texts
-from app.vectorstore.store_manager import get_store_for_document
+from app.services.embeddings import embed_texts, EmbeddingError, EmbeddingRejectedError
+from app.vectorstore.faiss_store import EmbeddingMismatchError
+from app.vectorstore.store_manager import (
+    get_store_for_document,
+    reset_store_for_document,
+    sync_unified_store,
+    sync_bm25_for_store,
+)
 from app.registry.document_registry import register_document
 from app.core.session_manager import session_manager
 
@@ -74,14 +80,21 @@ async def ingest_file(
     # 3. Batch Embedding Generation
     # --------------------------------------------------
     try:
-        embeddings = []
-        batch_size = 100  # Safe batch size
-
-        for i in range(0, len(all_chunks), batch_size):
-            batch = all_chunks[i:i + batch_size]
-            batch_embeddings = embed_texts(batch)
-            embeddings.extend(batch_embeddings)
+        # Batched, concurrent and retried by the embedding client
+        embeddings = embed_texts(all_chunks)
 
+    except EmbeddingRejectedError as e:
+        logger.error(f"Embedding rejected: {e}")
+        raise HTTPException(
+            status_code=422,
+            detail="Embedding provider rejected the document's text; the document was not indexed."
+        )
+    except EmbeddingError as e:
+        logger.error(f"Embedding failed: {e}")
+        raise HTTPException(
+            status_code=502,
+            detail="Embedding provider failed; the document was not indexed. Please retry."
+        )
     except Exception as e:
         logger.error(f"Embedding failed: {e}")
         raise HTTPException(
@@ -93,12 +106,26 @@ async def ingest_file(
     # 4. Vector Store Management
     # --------------------------------------------------
     try:
-        store = get_store_for_document(file.filename)
-        store.add(
+        try:
+            store = get_store_for_document(file.filename)
+        except EmbeddingMismatchError as e:
+            # Its old vectors cannot be searched with the current
+            # embeddings; this upload replaces the whole store
+            logger.warning(f"{e}; replacing it with this upload")
+            store = reset_store_for_document(file.filename)
+        # Re-uploading a file replaces its chunks instead of piling up
+        replaced = store.replace_document(
+            file.filename,
             embeddings=embeddings,
             metadatas=all_metadata,
         )
         store.save()
+        if replaced:
+            # Tombstones may start a dense compaction that renumbers the
+            # store's ids; sync the unified index and BM25 against its result
+            store.wait_for_compaction()
+        sync_unified_store(store)
+        sync_bm25_for_store(store)
     except Exception as e:
         logger.error(f"Vector store error: {e}")
         raise HTTPException(
@@ -123,7 +150,8 @@ async def ingest_file(
     session_manager.add_active_document(session_id, file.filename)
 
     logger.info(
-        f"Document '{file.filename}' ingested and activated for session {session_id}"
+        f"Document '{file.filename}' ingested ({replaced} old chunks replaced) "
+        f"and activated for session {session_id}"
     )
 
     # --------------------------------------------------
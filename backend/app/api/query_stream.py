@@ -5,6 +5,8 @@ from typing import Any
 
 from app.schemas.rag import QueryRequest
 from app.core.conversation_engine import ConversationEngine
+from app.services.embeddings import EmbeddingError
+from app.vectorstore.faiss_store import EmbeddingMismatchError
 
 router = APIRouter(prefix="/rag")
 
@@ -40,21 +42,30 @@ def query_rag_stream(req: QueryRequest):
 
     def event_generator():
 
-        for event in engine.stream(
-            session_id=req.session_id,
-            query=req.query,
-            compare_mode=req.compare_mode,
-            document_ids=req.document_ids,
-            top_k=req.top_k,
-            use_human_feedback=req.use_human_feedback,
-        ):
-
-            if event.get("type") == "error":
-                yield f"data: {json.dumps(event)}\n\n"
-                yield "data: [DONE]\n\n"
-                return
-
-            yield f"data: {json.dumps(make_json_safe(event))}\n\n"
+        try:
+            for event in engine.stream(
+                session_id=req.session_id,
+                query=req.query,
+                compare_mode=req.compare_mode,
+                document_ids=req.document_ids,
+                top_k=req.top_k,
+                use_human_feedback=req.use_human_feedback,
+            ):
+
+                if event.get("type") == "error":
+                    yield f"data: {json.dumps(event)}\n\n"
+                    yield "data: [DONE]\n\n"
+                    return
+
+                yield f"data: {json.dumps(make_json_safe(event))}\n\n"
+
+        except EmbeddingError:
+            event = {"type": "error", "value": "Embedding service unavailable, please retry"}
+            yield f"data: {json.dumps(event)}\n\n"
+
+        except EmbeddingMismatchError:
+            event = {"type": "error", "value": "Document was indexed with a different embedding model, please re-upload it"}
+            yield f"data: {json.dumps(event)}\n\n"
 
         yield "data: [DONE]\n\n"
 
@@ -7,11 +7,44 @@ LLM_PROVIDER = "groq"
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-EMBEDDING_PROVIDER = "gemini"
+# Embedding backend: "gemini" (API), "local" (in-process static model,
+# see LOCAL_EMBEDDING_MODEL_PATH) or "hashing" (deterministic, for tests
+# and benchmarks). Stores record the provider and dimension they were
+# built with and refuse to load under another.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "models/gemini-embedding-001")
-EMBED_DIM = 768  # Crucial: Must be 768 for your current FAISS setup
+EMBED_DIM = int(os.getenv("EMBED_DIM", 768))  # Crucial: must match the dimension existing stores were built with
+
+# Directory of the local model: embeddings.npy (vocab x dim token
+# vectors, leading dimensions first) and vocab.txt (one token per row)
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv(
+    "LOCAL_EMBEDDING_MODEL_PATH",
+    os.path.join(os.getcwd(), "models", "static-embedding")
+)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Embeddings are cached on disk (SQLite) by hash of model, task, dim and
+# text; least recently used vectors are evicted past the size budget
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.getcwd(), "embedding_cache", "embeddings.sqlite3")
+)
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 512))  # 0 disables
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32").lower()  # or float16
+
+# Embedding API client: batches in flight at once, request rate limit
+# (requests / second, 0 = unlimited) and retries on 429 / 5xx
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+EMBEDDING_RATE_LIMIT_RPS = float(os.getenv("EMBEDDING_RATE_LIMIT_RPS", 10))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 5))
+EMBEDDING_BACKOFF_S = float(os.getenv("EMBEDDING_BACKOFF_S", 0.5))
+
+# Concurrent embed_query calls arriving within this window (ms) share one
+# provider request of up to EMBEDDING_COALESCE_MAX_BATCH queries;
+# identical in-flight queries are embedded once. 0 disables.
+EMBEDDING_COALESCE_WINDOW_MS = float(os.getenv("EMBEDDING_COALESCE_WINDOW_MS", 3))
+EMBEDDING_COALESCE_MAX_BATCH = int(os.getenv("EMBEDDING_COALESCE_MAX_BATCH", 100))
+
 # =====================================================
 # 🔹 CHUNKING & RETRIEVAL CONFIG
 # =====================================================
@@ -19,6 +52,31 @@ CHUNK_SIZE = 500
 CHUNK_OVERLAP = 100
 TOP_K = 5
 
+# How retrieve() merges lexical (BM25) and vector candidates:
+# "weighted" sums weighted normalized scores, "rrf" reciprocal rank fusion
+HYBRID_FUSION_MODES = ("weighted", "rrf")
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "weighted").lower()
+if HYBRID_FUSION not in HYBRID_FUSION_MODES:
+    raise ValueError(
+        f"HYBRID_FUSION must be one of {', '.join(HYBRID_FUSION_MODES)}, got {HYBRID_FUSION!r}"
+    )
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+
+# Per-store searches run on a shared thread pool; stores that have not
+# answered RETRIEVAL_DEADLINE_MS after the fan-out are skipped (0 = wait)
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", 8))
+RETRIEVAL_DEADLINE_MS = int(os.getenv("RETRIEVAL_DEADLINE_MS", 2000))
+
+# Repeated retrievals (same normalized query, documents and k, stores
+# unchanged) are served from an in-process LRU cache; 0 disables it
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", 512))
+RETRIEVAL_CACHE_TTL_S = float(os.getenv("RETRIEVAL_CACHE_TTL_S", 300))
+
+# BM25 text analysis (index and query time); changing either rebuilds
+# the BM25 indexes on next use
+BM25_STOPWORDS = os.getenv("BM25_STOPWORDS", "true").lower() == "true"
+BM25_STEMMING = os.getenv("BM25_STEMMING", "true").lower() == "true"
+
 # =====================================================
 # 🔹 SETTINGS
 # =====================================================
@@ -36,6 +94,61 @@ VECTORSTORE_BASE_DIR = os.getenv(
     os.path.join(os.getcwd(), "vectorstores")
 )
 
+# Budget for FAISS stores kept loaded between requests (LRU evicted):
+# private (non-mapped) bytes, and a store count, since every loaded
+# store holds a few file descriptors (chunk columns, raw vectors, BM25).
+# 0 stores = as many as the process file descriptor limit allows.
+VECTORSTORE_CACHE_MAX_MB = int(os.getenv("VECTORSTORE_CACHE_MAX_MB", 1024))
+VECTORSTORE_CACHE_MAX_STORES = int(os.getenv("VECTORSTORE_CACHE_MAX_STORES", 0))
+
+# "per_document": one index per document (default)
+# "unified": additionally keep every document in one sharded index so
+#            multi-document queries run a single filtered search
+VECTORSTORE_LAYOUT = os.getenv("VECTORSTORE_LAYOUT", "per_document").lower()
+VECTORSTORE_UNIFIED_SHARDS = int(os.getenv("VECTORSTORE_UNIFIED_SHARDS", 4))
+
+# Per-document index type: "auto" picks flat / hnsw / ivf from chunk count
+VECTORSTORE_INDEX_TYPE = os.getenv("VECTORSTORE_INDEX_TYPE", "auto").lower()
+VECTORSTORE_HNSW_MIN_CHUNKS = int(os.getenv("VECTORSTORE_HNSW_MIN_CHUNKS", 10_000))
+VECTORSTORE_IVF_MIN_CHUNKS = int(os.getenv("VECTORSTORE_IVF_MIN_CHUNKS", 200_000))
+
+# Query-time accuracy/latency knobs for approximate indexes
+VECTORSTORE_IVF_NPROBE = int(os.getenv("VECTORSTORE_IVF_NPROBE", 16))
+VECTORSTORE_HNSW_EF_SEARCH = int(os.getenv("VECTORSTORE_HNSW_EF_SEARCH", 64))
+
+# Similarity for new stores: "l2" or "cosine" (normalized vectors in an
+# inner-product index, hits carry true cosine scores)
+VECTORSTORE_METRIC = os.getenv("VECTORSTORE_METRIC", "l2").lower()
+
+# Vector compression for new stores: "none", "fp16", "sq8" or "pq"
+# (existing stores keep the mode recorded in their store.json)
+VECTORSTORE_COMPRESSION = os.getenv("VECTORSTORE_COMPRESSION", "none").lower()
+VECTORSTORE_PQ_M = int(os.getenv("VECTORSTORE_PQ_M", 96))  # bytes per vector
+# Re-score compressed candidates exactly against the raw vectors on disk
+VECTORSTORE_RESCORE = os.getenv("VECTORSTORE_RESCORE", "true").lower() == "true"
+VECTORSTORE_RESCORE_FACTOR = int(os.getenv("VECTORSTORE_RESCORE_FACTOR", 4))
+
+# Matryoshka two-stage search for new stores: the index holds only the
+# leading VECTORSTORE_FIRST_PASS_DIM dimensions of each vector (0 = all
+# of them) and its top k * VECTORSTORE_FIRST_PASS_FACTOR candidates are
+# re-scored against the full raw vectors. Only meaningful for
+# Matryoshka-trained models such as gemini-embedding-001.
+VECTORSTORE_FIRST_PASS_DIM = int(os.getenv("VECTORSTORE_FIRST_PASS_DIM", 0))
+VECTORSTORE_FIRST_PASS_FACTOR = int(os.getenv("VECTORSTORE_FIRST_PASS_FACTOR", 8))
+
+# Map saved flat / IVF indexes read-only instead of copying them into
+# each worker, so uvicorn workers share one copy in the OS page cache
+VECTORSTORE_MMAP = os.getenv("VECTORSTORE_MMAP", "true").lower() == "true"
+
+# Saves append new vectors as delta segments next to the base index; a
+# background compaction merges them once they exceed either limit
+# (chunk count, or fraction of the base index)
+VECTORSTORE_DELTA_MAX_CHUNKS = int(os.getenv("VECTORSTORE_DELTA_MAX_CHUNKS", 50_000))
+VECTORSTORE_DELTA_MAX_RATIO = float(os.getenv("VECTORSTORE_DELTA_MAX_RATIO", 0.25))
+# Deleted / replaced chunks are tombstoned; past this fraction of the
+# store, compaction rebuilds it densely from the live chunks
+VECTORSTORE_TOMBSTONE_MAX_RATIO = float(os.getenv("VECTORSTORE_TOMBSTONE_MAX_RATIO", 0.2))
+
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
 # =====================================================
@@ -1,6 +1,5 @@
 from typing import List, Dict, Generator, Optional
 import re
-import math
 
 from app.core.llms import summarizer_llm
 from app.core.session_manager import session_manager
@@ -10,6 +9,8 @@ from app.services.retriever import (
     retrieve_context,
     retrieve_for_comparison,
     align_sections_hybrid,
+    chunk_vectors,
+    cosine_similarities,
 )
 
 from app.services.generator import (
@@ -91,24 +92,39 @@ def dynamic_thresholds(chunk_count: int):
 # SEMANTIC RE-RANK
 # ==========================================================
 
-def semantic_rerank(query: str, chunks: List[Dict]) -> List[Dict]:
+def _needs_query_embedding(chunks: List[Dict]) -> bool:
+    # Cosine stores already scored their chunks against the query
+    return any("similarity" not in c for c in chunks)
+
+
+def semantic_rerank(
+    query: str,
+    chunks: List[Dict],
+    query_embedding: Optional[List[float]] = None,
+) -> List[Dict]:
+    """
+    Orders chunks by cosine similarity to the query. query_embedding,
+    when given, is the query's vector already embedded by the caller.
+    """
     if not chunks:
         return []
 
-    query_embedding = embed_query(query)
-    texts = [c.get("text", "") for c in chunks]
-    chunk_embeddings = embed_texts(texts)
+    if not _needs_query_embedding(chunks):
+        for chunk in chunks:
+            chunk["_semantic_score"] = chunk["similarity"]
+    else:
+        if query_embedding is None:
+            query_embedding = embed_query(query)
+
+        # Vectors stored at ingest; only chunks without one are embedded
+        chunk_embeddings = chunk_vectors(chunks)
+        if chunk_embeddings is None:
+            chunk_embeddings = embed_texts([c.get("text", "") for c in chunks])
 
-    def cosine(a, b):
-        dot = sum(x*y for x, y in zip(a, b))
-        na = math.sqrt(sum(x*x for x in a))
-        nb = math.sqrt(sum(x*x for x in b))
-        if na == 0 or nb == 0:
-            return 0.0
-        return dot / (na * nb)
+        scores = cosine_similarities(query_embedding, chunk_embeddings)
 
-    for chunk, emb in zip(chunks, chunk_embeddings):
-        chunk["_semantic_score"] = round(cosine(query_embedding, emb), 4)
+        for chunk, score in zip(chunks, scores):
+            chunk["_semantic_score"] = round(float(score), 4)
 
     chunks.sort(key=lambda c: c["_semantic_score"], reverse=True)
     return chunks
@@ -226,9 +242,17 @@ class ConversationEngine:
                 top_k=top_k,
             )
 
-            for doc_id in grouped:
-                filtered = filter_chunks(grouped[doc_id])
-                grouped[doc_id] = semantic_rerank(rewritten_query, filtered)
+            filtered = {doc_id: filter_chunks(chunks) for doc_id, chunks in grouped.items()}
+
+            # Embedded once for every document, not once per document
+            query_embedding = (
+                embed_query(rewritten_query)
+                if any(_needs_query_embedding(chunks) for chunks in filtered.values())
+                else None
+            )
+
+            for doc_id, chunks in filtered.items():
+                grouped[doc_id] = semantic_rerank(rewritten_query, chunks, query_embedding)
 
             if not any(grouped.values()):
                 yield {
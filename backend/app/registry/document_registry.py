@@ -27,12 +27,12 @@ def register_document(
 ):
     registry = _load_registry()
 
-    if document_id not in registry:
-        registry[document_id] = {
-            "document_id": document_id,
-            "pages": pages,
-            "chunks": chunks,
-        }
+    # Re-uploads replace the document, so their counts win
+    registry[document_id] = {
+        "document_id": document_id,
+        "pages": pages,
+        "chunks": chunks,
+    }
 
     _save_registry(registry)
 
@@ -4,6 +4,8 @@ import json
 
 from app.schemas.session import ChatRequest
 from app.core.conversation_engine import ConversationEngine
+from app.services.embeddings import EmbeddingError
+from app.vectorstore.faiss_store import EmbeddingMismatchError
 
 router = APIRouter(prefix="/chat", tags=["agentic-chat-stream"])
 
@@ -31,15 +33,24 @@ def chat_stream(payload: ChatRequest):
 
     def sse_generator():
 
-        for event in engine.stream(
-            session_id=payload.session_id,
-            query=payload.user_text,
-            compare_mode=False,
-            document_ids=None,
-            top_k=5,
-            use_human_feedback=True,
-        ):
-            yield f"data: {json.dumps(make_json_safe(event))}\n\n"
+        try:
+            for event in engine.stream(
+                session_id=payload.session_id,
+                query=payload.user_text,
+                compare_mode=False,
+                document_ids=None,
+                top_k=5,
+                use_human_feedback=True,
+            ):
+                yield f"data: {json.dumps(make_json_safe(event))}\n\n"
+
+        except EmbeddingError:
+            event = {"type": "error", "value": "Embedding service unavailable, please retry"}
+            yield f"data: {json.dumps(event)}\n\n"
+
+        except EmbeddingMismatchError:
+            event = {"type": "error", "value": "Document was indexed with a different embedding model, please re-upload it"}
+            yield f"data: {json.dumps(event)}\n\n"
 
         yield "data: [DONE]\n\n"
 
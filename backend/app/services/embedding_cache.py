@@ -0,0 +1,202 @@
+# backend/app/services/embedding_cache.py
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import (
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_MB,
+    EMBEDDING_CACHE_DTYPE,
+)
+
+
+# LRU stamps of hits are written in batches: at most this many rows or
+# this many seconds old, and before every insert / eviction pass
+TOUCH_FLUSH_ROWS = 1024
+TOUCH_FLUSH_S = 30.0
+
+
+def cache_key(model: str, task_type: str, dim: int, dtype: str, text: str) -> bytes:
+    """Content hash identifying one embedding request and its stored dtype."""
+    payload = f"{model}\0{task_type}\0{dim}\0{dtype}\0".encode("utf-8") + text.encode("utf-8")
+    return hashlib.sha256(payload).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache in one SQLite file, shared by every
+    worker process (WAL mode).
+
+    Vectors are stored as raw float32 or float16 bytes under the
+    content hash of (model, task type, dimension, dtype, text). Once the
+    cache holds more than max_bytes of vectors, the least recently used
+    rows are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int, dtype: str = "float32"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+        # Bytes of vectors stored; exact after each eviction pass, then
+        # grown by this process's inserts
+        self._size = self._stored()[1]
+
+        # key -> last_used of hits not yet written back
+        self._touched: Dict[bytes, int] = {}
+        self._touched_since = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List[bytes], dim: int) -> Dict[bytes, np.ndarray]:
+        """
+        Cached dim-long vectors (float32) for the keys found. Rows of
+        another length are treated as misses and overwritten on put.
+        """
+        found: Dict[bytes, np.ndarray] = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time_ns()
+        nbytes = dim * self.dtype.itemsize
+
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    if len(blob) == nbytes:
+                        found[key] = np.frombuffer(blob, dtype=self.dtype).astype("float32")
+
+            for key in found:
+                self._touched[key] = now
+            if (
+                len(self._touched) >= TOUCH_FLUSH_ROWS
+                or time.monotonic() - self._touched_since >= TOUCH_FLUSH_S
+            ):
+                self._flush_touched()
+                self._conn.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+
+        return found
+
+    def put_many(self, items: Dict[bytes, List[float]]):
+        if not items:
+            return
+
+        now = time.time_ns()
+        rows = [
+            (key, np.asarray(vector, dtype=self.dtype).tobytes(), now)
+            for key, vector in items.items()
+        ]
+
+        with self._lock:
+            # Stamps first, so eviction sees recent hits and does not
+            # re-stamp rows replaced below
+            self._flush_touched()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._size += sum(len(row[1]) for row in rows)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """Writes pending LRU stamps of hits. Caller holds the lock and commits."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(stamp, key) for key, stamp in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touched_since = time.monotonic()
+
+    def _stored(self):
+        return self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+
+    def _evict(self):
+        """Drops least recently used rows over the size budget. Caller holds the lock."""
+        count, size = self._stored()
+        self._size = size
+        if size <= self.max_bytes or not count:
+            return
+
+        # Rows of one model are the same size; evict down to 90% of the budget
+        excess = count - int(count * self.max_bytes * 0.9 / size)
+        self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            (excess,),
+        )
+        self._size = self._stored()[1]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, size = self._stored()
+        return {
+            "entries": count,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "dtype": self.dtype.name,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache, or None when disabled (EMBEDDING_CACHE_MAX_MB=0)."""
+    global _CACHE
+
+    if EMBEDDING_CACHE_MAX_MB <= 0:
+        return None
+
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = EmbeddingCache(
+                EMBEDDING_CACHE_PATH,
+                max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+                dtype=EMBEDDING_CACHE_DTYPE,
+            )
+        return _CACHE
@@ -0,0 +1,393 @@
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Type
+
+import numpy as np
+
+from app.core.config import (
+    EMBEDDING_PROVIDER,
+    EMBEDDING_MODEL_NAME,
+    EMBED_DIM,
+    LOCAL_EMBEDDING_MODEL_PATH,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_RATE_LIMIT_RPS,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_BACKOFF_S,
+)
+
+# ==================================================
+# EMBEDDING PROVIDERS
+# ==================================================
+
+BATCH_SIZE = 100
+
+# HTTP statuses worth retrying (quota, transient server errors)
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Invalid argument: some text of the batch is rejected (e.g. too long)
+INVALID_ARGUMENT_STATUS = 400
+
+# Lowercased runs of letters / digits, shared by the local providers
+_TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+
+class EmbeddingError(RuntimeError):
+    """
+    The embedding provider failed for some inputs. Raised instead of
+    substituting zero vectors, which would be indexed and searched as
+    if they were real.
+    """
+
+
+class EmbeddingRejectedError(EmbeddingError):
+    """
+    The provider rejected the input itself (invalid argument, e.g. a
+    text that is too long); retrying the same texts cannot succeed.
+    """
+
+
+class EmbeddingProvider:
+    """
+    Turns texts into EMBED_DIM vectors. Subclasses implement embed();
+    task_type is "RETRIEVAL_DOCUMENT" or "RETRIEVAL_QUERY" and may be
+    ignored by symmetric models.
+    """
+
+    name = ""
+    # Worth keeping in the persistent embedding cache (slow or paid calls)
+    cacheable = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.model = self.model_name()
+
+    @classmethod
+    def model_name(cls) -> str:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.name}/{self.model}"
+
+
+# ==================================================
+# GEMINI (REMOTE API)
+# ==================================================
+
+class _TokenBucket:
+    """Allows `rate` requests per second on average, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def _status_of(error: Exception) -> Optional[int]:
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_transient(error: Exception) -> bool:
+    """Quota / server errors, and connection failures or timeouts (no status)."""
+    status = _status_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, httpx.TransportError)
+
+
+class GeminiProvider(EmbeddingProvider):
+    """
+    gemini-embedding-001 over the API. Batches of one call run
+    concurrently under a shared rate limit, with retries on quota,
+    server and connection errors.
+    """
+
+    name = "gemini"
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self._client = None
+        self._bucket = _TokenBucket(EMBEDDING_RATE_LIMIT_RPS, burst=EMBEDDING_CONCURRENCY)
+        # Batches of one call run concurrently, bounded across all callers
+        self._pool = ThreadPoolExecutor(
+            max_workers=EMBEDDING_CONCURRENCY,
+            thread_name_prefix="embedding",
+        )
+
+    @classmethod
+    def model_name(cls) -> str:
+        return EMBEDDING_MODEL_NAME
+
+    def _get_client(self):
+        if self._client is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise EmbeddingError("GEMINI_API_KEY is not set")
+            from google import genai
+            self._client = genai.Client(api_key=api_key)
+        return self._client
+
+    def _request(self, client, batch: List[str], task_type: str) -> List[List[float]]:
+        """One embed_content call; raises if any vector is missing."""
+        from google.genai import types
+
+        if task_type == "RETRIEVAL_DOCUMENT":
+            config = types.EmbedContentConfig(
+                task_type=task_type,
+                output_dimensionality=self.dim,
+                title="Document Chunks",
+            )
+        else:
+            config = types.EmbedContentConfig(
+                task_type=task_type,
+                output_dimensionality=self.dim,
+            )
+
+        response = client.models.embed_content(
+            model=self.model,
+            contents=batch,
+            config=config,
+        )
+
+        if not response.embeddings or len(response.embeddings) != len(batch):
+            raise ValueError("Embedding count mismatch")
+
+        return [e.values for e in response.embeddings]
+
+    def _embed_batch(self, client, batch: List[str], task_type: str) -> List[List[float]]:
+        """
+        Embeds one batch under the rate limit. Quota, server, connection
+        and timeout errors are retried with exponential backoff. Any
+        other failure is raised at once: an invalid-argument (400)
+        response as EmbeddingRejectedError, since a rejected text fails
+        the whole request (as auth or model errors fail every text).
+        """
+        for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+            self._bucket.acquire()
+            try:
+                return self._request(client, batch, task_type)
+            except Exception as e:
+                if _is_transient(e):
+                    if attempt == EMBEDDING_MAX_RETRIES:
+                        raise EmbeddingError(
+                            f"Embedding provider still failing after {attempt + 1} attempts: {e}"
+                        ) from e
+                    # Full jitter keeps concurrent batches from retrying in lockstep
+                    time.sleep(random.uniform(0, EMBEDDING_BACKOFF_S * 2 ** attempt))
+                    continue
+
+                if _status_of(e) == INVALID_ARGUMENT_STATUS:
+                    raise EmbeddingRejectedError(f"Embedding provider rejected the input: {e}") from e
+                raise EmbeddingError(f"Embedding provider request failed: {e}") from e
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Embeds texts in BATCH_SIZE batches, EMBEDDING_CONCURRENCY at a time."""
+        client = self._get_client()
+        batches = [texts[i : i + BATCH_SIZE] for i in range(0, len(texts), BATCH_SIZE)]
+
+        if len(batches) == 1:
+            return self._embed_batch(client, batches[0], task_type)
+
+        all_embeddings = []
+        for vectors in self._pool.map(
+            lambda batch: self._embed_batch(client, batch, task_type), batches
+        ):
+            all_embeddings.extend(vectors)
+
+        return all_embeddings
+
+
+# ==================================================
+# LOCAL STATIC MODEL (IN-PROCESS CPU)
+# ==================================================
+
+class LocalStaticProvider(EmbeddingProvider):
+    """
+    In-process static embedding model: a text is the normalized mean of
+    its tokens' vectors. The token matrix is loaded once and a whole
+    batch is pooled with a single gather + segment sum, so embedding a
+    query costs microseconds instead of a network round trip.
+
+    Models with more than EMBED_DIM dimensions are truncated to the
+    leading ones (PCA / Matryoshka-ordered models keep most of their
+    quality that way). Out-of-vocabulary tokens are ignored.
+    """
+
+    name = "local"
+    cacheable = False
+
+    def __init__(self, dim: int, model_dir: str = LOCAL_EMBEDDING_MODEL_PATH):
+        super().__init__(dim)
+
+        matrix_path = os.path.join(model_dir, "embeddings.npy")
+        vocab_path = os.path.join(model_dir, "vocab.txt")
+        if not (os.path.exists(matrix_path) and os.path.exists(vocab_path)):
+            raise EmbeddingError(
+                f"Local embedding model not found in {model_dir} "
+                "(expected embeddings.npy and vocab.txt)"
+            )
+
+        matrix = np.load(matrix_path, mmap_mode="r")
+        if matrix.ndim != 2 or matrix.shape[1] < dim:
+            raise EmbeddingError(
+                f"Local embedding model has shape {matrix.shape}, needs at least {dim} dimensions"
+            )
+        # Contiguous float32 copy of the leading dims: gathers stay cache friendly
+        self.matrix = np.ascontiguousarray(matrix[:, :dim], dtype="float32")
+
+        with open(vocab_path, "r", encoding="utf-8") as f:
+            vocab = [line.rstrip("\n") for line in f]
+        if len(vocab) != len(self.matrix):
+            raise EmbeddingError(
+                f"Local embedding model has {len(self.matrix)} vectors for {len(vocab)} tokens"
+            )
+        self.vocab: Dict[str, int] = {token: i for i, token in enumerate(vocab)}
+
+    @classmethod
+    def model_name(cls) -> str:
+        return os.path.basename(os.path.normpath(LOCAL_EMBEDDING_MODEL_PATH))
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        rows: List[int] = []
+        counts = np.zeros(len(texts), dtype="int64")
+
+        for i, text in enumerate(texts):
+            ids = [
+                self.vocab[token]
+                for token in _TOKEN_RE.findall(text.lower())
+                if token in self.vocab
+            ]
+            rows.extend(ids)
+            counts[i] = len(ids)
+
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        present = counts > 0
+        if rows:
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+            out[present] = np.add.reduceat(self.matrix[rows], starts, axis=0)
+
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out.tolist()
+
+
+# ==================================================
+# HASHING (DETERMINISTIC, TESTS / BENCHMARKS)
+# ==================================================
+
+@lru_cache(maxsize=200_000)
+def _feature_slot(feature: str, dim: int):
+    """Stable (bucket, sign) of a feature; Python's hash() is salted per process."""
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dim, 1.0 if (h >> 63) & 1 else -1.0
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    Signed feature hashing of words and word bigrams into EMBED_DIM
+    buckets, L2-normalized. Identical text always gives the identical
+    vector and texts sharing words score higher, with no model and no
+    network: meant for tests and benchmarks, not for real retrieval.
+    """
+
+    name = "hashing"
+    cacheable = False
+
+    @classmethod
+    def model_name(cls) -> str:
+        return "blake2b-uni-bigram-v1"
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+
+        for i, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                bucket, sign = _feature_slot(feature, self.dim)
+                out[i, bucket] += sign
+
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out.tolist()
+
+
+# ==================================================
+# SELECTION
+# ==================================================
+
+PROVIDERS: Dict[str, Type[EmbeddingProvider]] = {
+    GeminiProvider.name: GeminiProvider,
+    LocalStaticProvider.name: LocalStaticProvider,
+    HashingProvider.name: HashingProvider,
+}
+
+_PROVIDER: Optional[EmbeddingProvider] = None
+_PROVIDER_LOCK = threading.Lock()
+
+
+def _provider_class() -> Type[EmbeddingProvider]:
+    cls = PROVIDERS.get(EMBEDDING_PROVIDER)
+    if cls is None:
+        raise ValueError(
+            f"Unknown embedding provider '{EMBEDDING_PROVIDER}' "
+            f"(expected one of: {', '.join(PROVIDERS)})"
+        )
+    return cls
+
+
+def get_provider() -> EmbeddingProvider:
+    """Process-wide provider selected by EMBEDDING_PROVIDER, created once."""
+    global _PROVIDER
+
+    with _PROVIDER_LOCK:
+        if _PROVIDER is None:
+            _PROVIDER = _provider_class()(EMBED_DIM)
+        return _PROVIDER
+
+
+def embedding_signature() -> Dict:
+    """
+    What vector stores record about the embeddings they hold. Derived
+    from config alone, so checking a store never loads a model.
+    """
+    return {
+        "provider": EMBEDDING_PROVIDER,
+        "model": _provider_class().model_name(),
+        "dim": EMBED_DIM,
+    }
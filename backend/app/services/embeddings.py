@@ -1,26 +1,69 @@
-from typing import List
-import os
-from google import genai
-from google.genai import types  # Import types for configuration
+from typing import Dict, List, Optional
+
+from app.core.config import (
+    EMBED_DIM,
+    EMBEDDING_COALESCE_WINDOW_MS,
+    EMBEDDING_COALESCE_MAX_BATCH,
+)
+from app.services.embedding_cache import cache_key, get_embedding_cache
+from app.services.embedding_providers import (  # noqa: F401 (re-exported)
+    EmbeddingError,
+    EmbeddingRejectedError,
+    get_provider,
+)
+from app.services.query_coalescer import QueryCoalescer
 
 # ==================================================
 # EMBEDDING CONFIG
 # ==================================================
 
-# Match your existing Vector Store (768)
-EMBED_DIM = 768
-BATCH_SIZE = 100
-_client = None
+# The provider (gemini / local / hashing) is selected by
+# EMBEDDING_PROVIDER in app/core/config.py; see embedding_providers.py.
 
 
-def _get_client():
-    global _client
-    if _client is None:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise RuntimeError("GEMINI_API_KEY is not set")
-        _client = genai.Client(api_key=api_key)
-    return _client
+def _embed_cached(texts: List[str], task_type: str) -> List[List[float]]:
+    """
+    Embeddings of texts, served from the persistent cache where
+    possible; only misses (each distinct text once) go to the provider.
+    In-process providers are cheaper to run than to look up.
+    """
+    provider = get_provider()
+    cache = get_embedding_cache() if provider.cacheable else None
+    if cache is None:
+        return provider.embed(texts, task_type)
+
+    keys = [
+        cache_key(provider.cache_namespace, task_type, provider.dim, cache.dtype.name, t)
+        for t in texts
+    ]
+    found = {key: vector.tolist() for key, vector in cache.get_many(keys, provider.dim).items()}
+
+    # Distinct misses, in first-seen order
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+
+    if missing:
+        fresh = dict(zip(missing.keys(), provider.embed(list(missing.values()), task_type)))
+        cache.put_many(fresh)
+        found.update(fresh)
+
+    return [found[key] for key in keys]
+
+
+# Concurrent embed_query calls share batched provider requests
+_QUERY_COALESCER = QueryCoalescer(
+    lambda queries: _embed_cached(queries, "RETRIEVAL_QUERY"),
+    window_s=EMBEDDING_COALESCE_WINDOW_MS / 1000,
+    max_batch=EMBEDDING_COALESCE_MAX_BATCH,
+)
+
+
+def get_query_coalescer_stats() -> Optional[Dict]:
+    if EMBEDDING_COALESCE_WINDOW_MS <= 0:
+        return None
+    return _QUERY_COALESCER.stats()
 
 
 # ==================================================
@@ -29,71 +72,27 @@ def _get_client():
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
     """
-    Converts text chunks into 768-dim vectors using gemini-embedding-001.
-    FAIL-SAFE: Returns zero-vectors if embedding provider fails.
+    Converts text chunks into EMBED_DIM vectors with the configured
+    provider. Cached vectors are reused; only uncached texts are sent.
+    Raises EmbeddingError if the provider fails.
     """
     if not texts:
         return []
 
-    try:
-        client = _get_client()
-        all_embeddings = []
-
-        for i in range(0, len(texts), BATCH_SIZE):
-            batch = texts[i : i + BATCH_SIZE]
-
-            response = client.models.embed_content(
-                model="models/gemini-embedding-001",
-                contents=batch,
-                config=types.EmbedContentConfig(
-                    task_type="RETRIEVAL_DOCUMENT",
-                    output_dimensionality=EMBED_DIM,  # Forces 768
-                    title="Document Chunks",
-                ),
-            )
-
-            if response.embeddings:
-                batch_vectors = [e.values for e in response.embeddings]
-                all_embeddings.extend(batch_vectors)
-
-        # If Gemini returned fewer embeddings than inputs, pad safely
-        if len(all_embeddings) < len(texts):
-            missing = len(texts) - len(all_embeddings)
-            all_embeddings.extend([[0.0] * EMBED_DIM for _ in range(missing)])
-
-        return all_embeddings
-
-    except Exception:
-        # 🔹 HARD FAIL-SAFE
-        # Never crash ingestion or retrieval
-        return [[0.0] * EMBED_DIM for _ in texts]
+    return _embed_cached(texts, "RETRIEVAL_DOCUMENT")
 
 
 def embed_query(query: str) -> List[float]:
     """
-    Converts a search query into a 768-dim vector.
-    FAIL-SAFE: Returns zero-vector if embedding provider fails.
+    Converts a search query into an EMBED_DIM vector. Remote providers
+    see concurrent calls coalesced into one batched request.
+    Raises EmbeddingError if the provider fails.
     """
     if not query:
         return [0.0] * EMBED_DIM
 
-    try:
-        client = _get_client()
-
-        response = client.models.embed_content(
-            model="models/gemini-embedding-001",
-            contents=[query],
-            config=types.EmbedContentConfig(
-                task_type="RETRIEVAL_QUERY",
-                output_dimensionality=EMBED_DIM,  # Forces 768
-            ),
-        )
-
-        if not response.embeddings:
-            raise RuntimeError("No embeddings returned")
+    # In-process providers answer faster than the coalescing window
+    if EMBEDDING_COALESCE_WINDOW_MS <= 0 or not get_provider().cacheable:
+        return _embed_cached([query], "RETRIEVAL_QUERY")[0]
 
-        return response.embeddings[0].values
-
-    except Exception:
-        # 🔹 HARD FAIL-SAFE
-        return [0.0] * EMBED_DIM
+    return _QUERY_COALESCER.embed(query)
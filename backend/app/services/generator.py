@@ -210,16 +210,16 @@ def stream_aligned_comparison_answer(
         if len(doc_keys) < 2:
             continue
 
-        doc_a, doc_b = doc_keys[0], doc_keys[1]
+        # Sections may span any number of documents: A, B, C, ...
+        doc_texts = "\n\n".join(
+            f"Document {chr(ord('A') + i)}:\n{section[doc]['text']}"
+            for i, doc in enumerate(doc_keys)
+        )
 
         block = f"""
 Section {section['section_id']} (Similarity: {section['similarity']})
 
-Document A:
-{section[doc_a]['text']}
-
-Document B:
-{section[doc_b]['text']}
+{doc_texts}
 """
         section_blocks.append(block.strip())
 
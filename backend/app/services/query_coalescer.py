@@ -0,0 +1,107 @@
+# backend/app/services/query_coalescer.py
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+
+class QueryCoalescer:
+    """
+    Micro-batches concurrent single-text embedding requests.
+
+    The first caller to find no batch forming becomes its leader: it
+    waits up to window_s (less once max_batch texts are queued), then
+    embeds up to max_batch queued texts in ONE embed_batch call on its
+    own thread and hands each waiter its vector. Texts queued past
+    max_batch form the next batch, led by a new thread. Identical texts that are queued
+    or already being embedded share a single result. A failure of the
+    batch call is raised to every waiter of that batch.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        window_s: float,
+        max_batch: int,
+    ):
+        self.embed_batch = embed_batch
+        self.window_s = window_s
+        self.max_batch = max(1, max_batch)
+
+        self._lock = threading.Lock()
+        # text -> result, for the batch still collecting
+        self._pending: Dict[str, Future] = {}
+        # text -> result, for batches being embedded
+        self._inflight: Dict[str, Future] = {}
+        self._full = threading.Event()
+
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.texts = 0
+
+    def embed(self, text: str) -> List[float]:
+        lead = False
+
+        with self._lock:
+            self.requests += 1
+            future = self._pending.get(text) or self._inflight.get(text)
+            if future is not None:
+                self.deduplicated += 1
+            else:
+                future = Future()
+                self._pending[text] = future
+                lead = len(self._pending) == 1
+                if len(self._pending) >= self.max_batch:
+                    self._full.set()
+
+        if lead:
+            self._flush()
+
+        return future.result()
+
+    def _flush(self):
+        """Run by a batch's leader: collect, embed once, route results."""
+        self._full.wait(self.window_s)
+
+        with self._lock:
+            texts = list(self._pending)[:self.max_batch]
+            batch = {text: self._pending.pop(text) for text in texts}
+            if len(self._pending) >= self.max_batch:
+                self._full.set()
+            else:
+                self._full.clear()
+            # Callers only lead an empty queue: the rest needs a leader
+            lead_next = bool(self._pending)
+            self._inflight.update(batch)
+            self.batches += 1
+            self.texts += len(batch)
+
+        if lead_next:
+            threading.Thread(target=self._flush, name="query-coalescer", daemon=True).start()
+
+        try:
+            vectors = self.embed_batch(texts)
+        except BaseException as e:
+            for future in batch.values():
+                future.set_exception(e)
+        else:
+            for text, vector in zip(texts, vectors):
+                batch[text].set_result(vector)
+        finally:
+            with self._lock:
+                for text, future in batch.items():
+                    if self._inflight.get(text) is future:
+                        del self._inflight[text]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "window_ms": self.window_s * 1000,
+                "max_batch": self.max_batch,
+                "requests": self.requests,
+                "deduplicated": self.deduplicated,
+                "batches": self.batches,
+                "texts_embedded": self.texts,
+                "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            }
@@ -1,16 +1,39 @@
 # backend/app/services/retriever.py
 
-from typing import List, Dict, Optional
+import logging
+from typing import List, Dict, Optional, Tuple
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import math
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
+import numpy as np
+
+from app.core.config import (
+    HYBRID_FUSION,
+    HYBRID_RRF_K,
+    RETRIEVAL_WORKERS,
+    RETRIEVAL_DEADLINE_MS,
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_CACHE_TTL_S,
+)
 from app.services.embeddings import embed_query, embed_texts
+from app.services.retrieval_cache import RetrievalCache
+from app.vectorstore.faiss_store import FAISSStore
+from app.utils.text_analyzer import analyze
 from app.vectorstore.store_manager import (
     get_store_for_document,
+    get_store_by_key,
     list_all_document_stores,
+    document_store_dirs,
+    store_dir_for_document,
+    pin_stores,
     get_bm25_for_store,
+    get_lexical_stats,
+    get_unified_store,
+    store_key,
 )
+
+logger = logging.getLogger(__name__)
+
 TOP_DOCS = 3
 MAX_CHUNKS_PER_DOC = 2
 
@@ -22,73 +45,207 @@ BM25_WEIGHT_CONCEPTUAL = 0.6
 
 RERANK_CONFIDENCE_THRESHOLD = 0.75
 
+# Upper bound on candidates pulled from the unified index per query
+UNIFIED_MAX_CANDIDATES = 256
+
+# Shared by every request: FAISS and numpy release the GIL, so stores
+# are searched concurrently without paying for a pool per call
+_SEARCH_POOL = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_WORKERS,
+    thread_name_prefix="retrieval",
+)
+
+_RESULT_CACHE = RetrievalCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL_S)
+
 
 # ==================================================
 # 🔹 COSINE SIMILARITY
 # ==================================================
 
-def _cosine_similarity(a: List[float], b: List[float]) -> float:
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(x * x for x in b))
-    if norm_a == 0.0 or norm_b == 0.0:
-        return 0.0
-    return dot / (norm_a * norm_b)
+def _unit_rows(vectors) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(vectors, dtype="float32"))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return matrix / norms
+
+
+def cosine_similarity_matrix(a, b) -> np.ndarray:
+    """Pairwise cosine similarities of the rows of a and b (zero rows score 0)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype="float32")
+    return _unit_rows(a) @ _unit_rows(b).T
+
+
+def cosine_similarities(query, vectors) -> np.ndarray:
+    """Cosine similarity of one query vector against each row of vectors."""
+    return cosine_similarity_matrix([query], vectors)[0]
+
+
+# ==================================================
+# 🔹 CHUNK VECTOR HANDLES
+# ==================================================
+
+def _vector_ref(store: FAISSStore, chunk_id: int) -> List:
+    """JSON-safe handle to a hit's stored vector: [store key, id epoch, chunk id]."""
+    return [store_key(store), store.epoch, chunk_id]
+
+
+def chunk_vectors(chunks: List[Dict]) -> Optional[np.ndarray]:
+    """
+    Stored vectors of chunks (one row each), read through their
+    "_vector_ref" handles with one lookup per store. None if a chunk
+    has no handle or its store renumbered chunk ids since retrieval.
+    """
+    refs = [c.get("_vector_ref") for c in chunks]
+    if not refs or any(ref is None for ref in refs):
+        return None
+
+    # (store key, epoch) -> positions in chunks
+    groups: Dict[tuple, List[int]] = defaultdict(list)
+    for pos, (key, epoch, _) in enumerate(refs):
+        groups[(key, epoch)].append(pos)
+
+    vectors = None
+    for (key, epoch), positions in groups.items():
+        store = get_store_by_key(key)
+        if store.epoch != epoch:
+            return None
+
+        rows = store.get_vectors_by_ids([refs[p][2] for p in positions])
+        if vectors is None:
+            vectors = np.empty((len(chunks), rows.shape[1]), dtype="float32")
+        vectors[positions] = rows
+
+    return vectors
 
 
 # ==================================================
 # 🔹 HYBRID SECTION ALIGNMENT
 # ==================================================
 
+def _linear_assignment(cost: np.ndarray) -> np.ndarray:
+    """
+    Minimum-cost one-to-one assignment (Hungarian algorithm with
+    potentials, O(n^2 m)). Returns the column of each row, -1 for rows
+    left unassigned when there are more rows than columns.
+    """
+    n, m = cost.shape
+    if n > m:
+        cols_of_rows = np.full(n, -1, dtype="int64")
+        rows_of_cols = _linear_assignment(cost.T)
+        cols_of_rows[rows_of_cols] = np.arange(m)
+        return cols_of_rows
+
+    # 1-based rows/columns; column 0 is the virtual start column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype="int64")   # row holding each column
+    way = np.zeros(m + 1, dtype="int64")
+
+    for row in range(1, n + 1):
+        owner[0] = row
+        col = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        # Dijkstra-like search for an augmenting path from row
+        while owner[col] != 0:
+            used[col] = True
+            current = owner[col]
+
+            slack = cost[current - 1] - u[current] - v[1:]
+            better = ~used[1:] & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = col
+
+            candidates = np.where(used[1:], np.inf, min_slack[1:])
+            next_col = int(candidates.argmin()) + 1
+            delta = candidates[next_col - 1]
+
+            used_cols = np.flatnonzero(used)
+            u[owner[used_cols]] += delta
+            v[used_cols] -= delta
+            min_slack[1:][~used[1:]] -= delta
+
+            col = next_col
+
+        # Flip the path
+        while col:
+            prev = way[col]
+            owner[col] = owner[prev]
+            col = prev
+
+    cols_of_rows = np.full(n, -1, dtype="int64")
+    assigned = np.flatnonzero(owner[1:])
+    cols_of_rows[owner[1:][assigned] - 1] = assigned
+    return cols_of_rows
+
+
+def _context_vectors(contexts: List[Dict]) -> np.ndarray:
+    """
+    Vectors of retrieved chunks, read from their stores. Only contexts
+    without a usable vector handle are embedded.
+    """
+    vectors = chunk_vectors(contexts)
+    if vectors is not None:
+        return vectors
+    return np.asarray(embed_texts([c.get("text", "") for c in contexts]), dtype="float32")
+
+
 def align_sections_hybrid(
     grouped_contexts: Dict[str, List[Dict]]
 ) -> List[Dict]:
     """
     Hybrid alignment:
-    1. Compute embeddings per chunk
-    2. Pair chunks via cosine similarity
+    1. Take chunk vectors from the document stores
+    2. Pair chunks of every document with the first one (one-to-one,
+       maximizing total cosine similarity)
     3. LLM will later refine structured diff
+
+    Each section holds the first document's chunk and the chunks
+    matched to it; "similarity" is the mean similarity of those pairs.
     """
 
-    doc_ids = list(grouped_contexts.keys())
+    doc_ids = [d for d, contexts in grouped_contexts.items() if contexts]
     if len(doc_ids) < 2:
         return []
 
-    # Currently aligning first two documents only
-    doc_a, doc_b = doc_ids[0], doc_ids[1]
-
-    contexts_a = grouped_contexts.get(doc_a, [])
-    contexts_b = grouped_contexts.get(doc_b, [])
+    vectors = [_context_vectors(grouped_contexts[d]) for d in doc_ids]
+    offsets = np.cumsum([0] + [len(v) for v in vectors])
 
-    if not contexts_a or not contexts_b:
-        return []
+    # One matrix product for every document pair
+    similarity = cosine_similarity_matrix(np.concatenate(vectors), np.concatenate(vectors))
 
-    texts_a = [c.get("text", "") for c in contexts_a]
-    texts_b = [c.get("text", "") for c in contexts_b]
+    pivot = doc_ids[0]
+    pivot_rows = slice(offsets[0], offsets[1])
 
-    embeddings_a = embed_texts(texts_a)
-    embeddings_b = embed_texts(texts_b)
+    # doc -> matched chunk index for each pivot chunk (-1 = none)
+    matches = {}
+    for i, doc_id in enumerate(doc_ids[1:], start=1):
+        block = similarity[pivot_rows, offsets[i]:offsets[i + 1]]
+        matches[doc_id] = (_linear_assignment(-block), block)
 
     aligned_sections = []
 
-    for idx_a, emb_a in enumerate(embeddings_a):
-        best_idx = None
-        best_score = -1.0
+    for idx in range(len(grouped_contexts[pivot])):
+        section = {pivot: grouped_contexts[pivot][idx]}
+        scores = []
 
-        for idx_b, emb_b in enumerate(embeddings_b):
-            score = _cosine_similarity(emb_a, emb_b)
+        for doc_id, (cols, block) in matches.items():
+            col = cols[idx]
+            if col < 0:
+                continue
+            section[doc_id] = grouped_contexts[doc_id][col]
+            scores.append(float(block[idx, col]))
 
-            if score > best_score:
-                best_score = score
-                best_idx = idx_b
+        if not scores:
+            continue
 
-        if best_idx is not None:
-            aligned_sections.append({
-                "section_id": len(aligned_sections) + 1,
-                doc_a: contexts_a[idx_a],
-                doc_b: contexts_b[best_idx],
-                "similarity": round(best_score, 4),
-            })
+        aligned_sections.append({
+            "section_id": len(aligned_sections) + 1,
+            **section,
+            "similarity": round(sum(scores) / len(scores), 4),
+        })
 
     return aligned_sections
 
@@ -123,6 +280,45 @@ def _should_rerank(contexts: List[Dict]) -> bool:
     return avg_conf < RERANK_CONFIDENCE_THRESHOLD
 
 
+# --------------------------------------------------
+# RESULT CACHE
+# --------------------------------------------------
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _cache_key(
+    kind: str,
+    query: str,
+    stores: List[FAISSStore],
+    k: int,
+) -> tuple:
+    """
+    Identifies a retrieval by its inputs and the state of the stores it
+    reads: any append, delete or compaction changes the stamps.
+    """
+    stamps = sorted(
+        (store_key(s), s.epoch, s.ntotal, s.deleted_count)
+        for s in stores
+    )
+    return (
+        kind,
+        _normalize_query(query),
+        k,
+        tuple(stamps),
+    )
+
+
+def _copy_chunks(chunks: List[Dict]) -> List[Dict]:
+    # Callers enrich returned chunks in place; cached ones stay intact
+    return [dict(c) for c in chunks]
+
+
+def get_retrieval_cache_stats() -> Dict:
+    return _RESULT_CACHE.stats()
+
+
 # --------------------------------------------------
 # DOCUMENT-SCOPED RETRIEVAL (STRICT)
 # --------------------------------------------------
@@ -131,10 +327,23 @@ def retrieve_context(
     query: str,
     top_k: int,
     document_id: str,
+    *,
+    query_embedding: Optional[List[float]] = None,
 ) -> List[Dict]:
+    """
+    query_embedding, when given, is the embedding of query (callers
+    searching many documents embed it once).
+    """
 
     store = get_store_for_document(document_id)
-    query_embedding = embed_query(query)
+
+    cache_key = _cache_key("context", query, [store], top_k)
+    cached = _RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return _copy_chunks(cached)
+
+    if query_embedding is None:
+        query_embedding = embed_query(query)
 
     results = store.search(query_embedding, k=top_k)
 
@@ -149,11 +358,18 @@ def retrieve_context(
             "confidence": r.get("confidence", 0.0),
             "document_id": document_id,
             "agent": "retrieval_agent",
+            "_vector_ref": _vector_ref(store, r.get("id")),
         }
 
+        if "similarity" in r:
+            # Cosine stores: true query/chunk cosine, reused by reranking
+            context["similarity"] = r["similarity"]
+
         if context["text"]:
             contexts.append(context)
 
+    _RESULT_CACHE.put(cache_key, _copy_chunks(contexts))
+
     return contexts
 
 
@@ -170,16 +386,19 @@ def retrieve_for_comparison(
 
     grouped_contexts: Dict[str, List[Dict]] = {}
 
-    with ThreadPoolExecutor(
-        max_workers=min(len(document_ids), 4)
-    ) as executor:
+    if not document_ids:
+        return grouped_contexts
 
+    query_embedding = embed_query(query)
+
+    with pin_stores(store_dir_for_document(d) for d in document_ids):
         futures = {
-            executor.submit(
+            _SEARCH_POOL.submit(
                 retrieve_context,
                 query,
                 top_k,
                 doc_id,
+                query_embedding=query_embedding,
             ): doc_id
             for doc_id in document_ids
         }
@@ -194,6 +413,115 @@ def retrieve_for_comparison(
     return grouped_contexts
 
 
+# --------------------------------------------------
+# UNIFIED INDEX SEARCH
+# --------------------------------------------------
+
+def _unified_semantic_hits(
+    stores: List[FAISSStore],
+    query_embedding: List[float],
+    k: int,
+) -> Dict[str, List[Dict]]:
+    """
+    Runs ONE filtered search over the unified index for every
+    store it fully covers and returns up to k hits per store_dir. Stores missing
+    from the result (layout disabled, not yet synced) are searched
+    individually by the caller.
+    """
+    unified = get_unified_store()
+    if unified is None:
+        return {}
+
+    covered = {
+        store_key(s): s
+        for s in stores
+        if unified.indexed_count(store_key(s)) == s.ntotal
+        and unified.indexed_epoch(store_key(s)) == s.epoch
+    }
+    if not covered:
+        return {}
+
+    hits: Dict[str, List[Dict]] = {s.store_dir: [] for s in covered.values()}
+    limit = min(k * len(covered), UNIFIED_MAX_CANDIDATES)
+
+    for key, chunk_id, score in unified.search(query_embedding, limit, list(covered)):
+        store = covered[key]
+        if len(hits[store.store_dir]) >= k:
+            continue
+        hit = store.make_hit(chunk_id, score)
+        if hit is not None:
+            hits[store.store_dir].append(hit)
+
+    return hits
+
+
+# --------------------------------------------------
+# HYBRID FUSION
+# --------------------------------------------------
+
+def _ranks(scores: np.ndarray) -> np.ndarray:
+    """1-based rank of each score, highest first."""
+    ranks = np.empty(len(scores), dtype="int64")
+    ranks[np.argsort(-scores, kind="stable")] = np.arange(1, len(scores) + 1)
+    return ranks
+
+
+def _fuse_scores(
+    semantic: np.ndarray,
+    lexical: np.ndarray,
+    semantic_weight: float,
+    bm25_weight: float,
+) -> np.ndarray:
+    """
+    Final scores of the candidates of every searched store together:
+    semantic holds hit confidences, lexical raw BM25 scores (0 = no
+    query term). Ranks and the BM25 maximum are taken over all of
+    them, so fused scores of different stores compare.
+    """
+    if HYBRID_FUSION == "rrf":
+        fused = semantic_weight / (HYBRID_RRF_K + _ranks(semantic))
+        fused += np.where(
+            lexical > 0, bm25_weight / (HYBRID_RRF_K + _ranks(lexical)), 0.0
+        )
+        # Rank 1 on both sides scores 1, like the weighted mode
+        return fused * (HYBRID_RRF_K + 1) / (semantic_weight + bm25_weight)
+
+    max_bm25 = float(lexical.max()) if len(lexical) else 0.0
+    normalized = lexical / max_bm25 if max_bm25 > 0 else np.zeros(len(lexical))
+    return semantic_weight * semantic + bm25_weight * normalized
+
+
+def _hybrid_candidates(
+    store: FAISSStore,
+    semantic_hits: Optional[List[Dict]],
+    query_embedding: List[float],
+    query_tokens: List[str],
+    k: int,
+    stats,
+):
+    """
+    Union of the vector hits and the k best BM25 matches of a store.
+    Lexical-only candidates get exact vector scores, so both sides are
+    known for every candidate. semantic_hits of None are searched here.
+    Returns (hits, BM25 scores).
+    """
+    if semantic_hits is None:
+        semantic_hits = store.search(query_embedding, k=k)
+
+    # Only chunks containing a query term are scored, with corpus-wide
+    # IDF so scores of different stores are comparable
+    lexical = get_bm25_for_store(store).score_query(
+        query_tokens, exclude=store.deleted_ids(), stats=stats
+    )
+    lexical_ids, _ = lexical.top_k(k)
+
+    seen = {hit["id"] for hit in semantic_hits}
+    missing = [i for i in lexical_ids.tolist() if i not in seen]
+
+    hits = semantic_hits + store.score_chunks(query_embedding, missing)
+    return hits, lexical.lookup([hit["id"] for hit in hits])
+
+
 # --------------------------------------------------
 # AGENTIC RETRIEVAL ENTRYPOINT
 # --------------------------------------------------
@@ -203,20 +531,84 @@ def retrieve(
     k: int = 5,
     document_ids: Optional[List[str]] = None,
 ) -> List[Dict]:
+    """
+    Candidates are the vector hits plus the BM25 top-k of each store,
+    fused as configured by HYBRID_FUSION. Stores are searched in
+    parallel; stores still running after RETRIEVAL_DEADLINE_MS are
+    skipped, logged as a warning and listed in every returned chunk's
+    "_skipped_stores" (the warning also covers an empty result).
+
+    Results are cached per (normalized query, documents, k, store
+    versions); hybrid results also depend on the corpus-wide BM25
+    statistics, which are part of their key. The key is built from
+    what is already known in this process, so a cache hit does no BM25
+    work; on a miss each store's BM25 index catches up inside the
+    deadline-bounded fan-out.
+    """
+    store_dirs = (
+        [store_dir_for_document(d_id) for d_id in document_ids]
+        if document_ids else document_store_dirs()
+    )
+    # Loading the last store of the query must not evict the first
+    with pin_stores(store_dirs):
+        return _retrieve(query, k, document_ids)
 
-    if document_ids and len(document_ids) == 1:
-        return retrieve_context(query, k, document_ids[0])
 
+def _retrieve(
+    query: str,
+    k: int,
+    document_ids: Optional[List[str]],
+) -> List[Dict]:
     if document_ids:
         stores = [get_store_for_document(d_id) for d_id in document_ids]
     else:
         stores = list_all_document_stores()
-        
+
     if not stores:
         return []
 
+    single = document_ids is not None and len(document_ids) == 1
+    cache_key = _cache_key("retrieve", query, stores, k)
+
+    if not single:
+        lexical_stats = get_lexical_stats()
+        cache_key += (lexical_stats.n_docs, lexical_stats.total_len)
+
+    cached = _RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return _copy_chunks(cached)
+
+    skipped_stores: List[str] = []
+    if single:
+        chunks = retrieve_context(query, k, document_ids[0])
+    else:
+        chunks, skipped_stores = _retrieve_hybrid(query, k, stores, lexical_stats)
+
+    if skipped_stores:
+        logger.warning(
+            f"Retrieval skipped {len(skipped_stores)} of {len(stores)} stores "
+            f"past the {RETRIEVAL_DEADLINE_MS} ms deadline: {', '.join(skipped_stores)}"
+        )
+    else:
+        if not single:
+            # Stored under the statistics the fan-out caught up to, which
+            # the next identical query will see
+            cache_key = cache_key[:-2] + (lexical_stats.n_docs, lexical_stats.total_len)
+        # Partial results (stores past the deadline) are not reused
+        _RESULT_CACHE.put(cache_key, _copy_chunks(chunks))
+
+    return chunks
+
+
+def _retrieve_hybrid(
+    query: str,
+    k: int,
+    stores: List[FAISSStore],
+    lexical_stats,
+) -> Tuple[List[Dict], List[str]]:
+    """Returns (chunks, keys of the stores skipped past the deadline)."""
     query_embedding = embed_query(query)
-    query_tokens = query.lower().split()
+    query_tokens = analyze(query)
 
     if _is_conceptual_query(query):
         semantic_weight = SEMANTIC_WEIGHT_CONCEPTUAL
@@ -228,39 +620,68 @@ def retrieve(
     doc_chunks: Dict[str, List[Dict]] = defaultdict(list)
     doc_scores: Dict[str, float] = {}
 
-    for store in stores:
-        semantic_hits = store.search(query_embedding, k=k)
-        if not semantic_hits:
+    unified_hits = _unified_semantic_hits(stores, query_embedding, k)
+
+    futures = {
+        _SEARCH_POOL.submit(
+            _hybrid_candidates,
+            store,
+            unified_hits.get(store.store_dir),
+            query_embedding,
+            query_tokens,
+            k,
+            lexical_stats,
+        ): store
+        for store in stores
+    }
+
+    done, pending = wait(
+        futures,
+        timeout=RETRIEVAL_DEADLINE_MS / 1000 if RETRIEVAL_DEADLINE_MS > 0 else None,
+    )
+
+    skipped_stores = sorted(store_key(futures[f]) for f in pending)
+    for future in pending:
+        # Not started yet: drop it; running ones finish unobserved
+        future.cancel()
+
+    candidates = []
+
+    # Store order, not completion order, so ties break the same way
+    for future, store in futures.items():
+        if future not in done:
             continue
-
-        bm25 = get_bm25_for_store(store)
-        bm25_scores = bm25.get_scores(query_tokens)
-        max_bm25 = float(bm25_scores.max()) if len(bm25_scores) > 0 else 1.0
+        hits, bm25_scores = future.result()
+        if hits:
+            candidates.append((store, hits, bm25_scores))
+
+    # Fused once over the union of all stores' candidates, then
+    # split back per store in the same order
+    fused = _fuse_scores(
+        np.array([hit.get("confidence", 0.0) for _, hits, _ in candidates for hit in hits]),
+        np.concatenate([scores for _, _, scores in candidates]) if candidates else np.empty(0),
+        semantic_weight,
+        bm25_weight,
+    ).tolist()
+    offset = 0
+
+    for store, hits, _ in candidates:
+        final_scores = fused[offset : offset + len(hits)]
+        offset += len(hits)
 
         store_id = store.store_dir
 
-        for hit in semantic_hits:
-            idx = hit["id"]
-
-            bm25_score = (
-                bm25_scores[idx] / max_bm25
-                if idx < len(bm25_scores)
-                else 0.0
-            )
-
-            final_score = (
-                semantic_weight * hit.get("confidence", 0.0)
-                + bm25_weight * bm25_score
-            )
-
+        for hit, final_score in zip(hits, final_scores):
             if "skill" in query.lower():
                 if "skill" in hit.get("text", "").lower():
                     final_score += 0.2
 
-            enriched = dict(hit)
+            # hits are built per search, so they can be enriched in place
+            enriched = hit
             enriched["final_score"] = round(final_score, 4)
             enriched["_doc_id"] = store_id
             enriched["agent"] = "retrieval_agent"
+            enriched["_vector_ref"] = _vector_ref(store, hit["id"])
 
             doc_chunks[store_id].append(enriched)
 
@@ -298,5 +719,6 @@ def retrieve(
 
     for c in final_chunks:
         c["_suggest_rerank"] = suggest_rerank
+        c["_skipped_stores"] = skipped_stores
 
-    return final_chunks[:k]
+    return final_chunks[:k], skipped_stores
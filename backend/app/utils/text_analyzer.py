@@ -0,0 +1,75 @@
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from app.core.config import BM25_STOPWORDS, BM25_STEMMING
+
+# ==================================================
+# TEXT ANALYZER (BM25 INDEXING + QUERIES)
+# ==================================================
+
+# Runs of letters / digits; "skills," -> "skills", "don't" stays whole
+_TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because
+been before being below between both but by can could did do does doing
+down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most
+my myself no nor not of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up
+very was we were what when where which while who whom why will with would
+you your yours yourself yourselves
+""".split())
+
+# Recorded with every BM25 index; indexes built with another analyzer
+# are rebuilt instead of being queried with mismatched terms.
+ANALYZER_SIGNATURE = "regex-v1" + ("+stop" if BM25_STOPWORDS else "") + ("+stem" if BM25_STEMMING else "")
+
+
+def stem(token: str) -> str:
+    """
+    Light English suffix stripping (plurals, -ing, -ed, -ly). Only
+    needs to map variants of a word to the same term, consistently.
+    """
+    if token.endswith("'s"):
+        token = token[:-2]
+
+    if len(token) <= 3 or not token.isalpha():
+        return token
+
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(("sses", "xes", "ches", "shes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        token = token[:-1]
+
+    for suffix in ("ing", "ed", "ly"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            # "running" -> "run", "stopped" -> "stop"
+            if len(token) > 3 and token[-1] == token[-2] and token[-1] not in "lsz":
+                token = token[:-1]
+            break
+
+    return token
+
+
+@lru_cache(maxsize=200_000)
+def normalize_term(token: str) -> Optional[str]:
+    """Index term for a lowercased token, or None for stopwords (memoized)."""
+    if BM25_STOPWORDS and token in STOPWORDS:
+        return None
+    return stem(token) if BM25_STEMMING else token
+
+
+def analyze(text: str) -> List[str]:
+    """Terms of text, used identically for chunks and queries."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        term = normalize_term(token)
+        if term:
+            terms.append(term)
+    return terms
@@ -0,0 +1,615 @@
+import os
+import json
+import threading
+from typing import List, Dict, Optional, Tuple, NamedTuple
+
+import numpy as np
+
+from app.vectorstore.chunk_store import _write_at
+from app.utils.text_analyzer import analyze, ANALYZER_SIGNATURE
+
+
+# Merge all postings segments into one past this many
+MAX_SEGMENTS = 8
+
+_DOCLEN_DTYPE = np.dtype("<i4")
+
+
+class _Segment(NamedTuple):
+    """
+    Term-major CSR postings of chunks [start, start + count):
+    postings of term t are docs[indptr[t]:indptr[t + 1]] with term
+    frequencies tfs[...]. indptr only covers the terms known when the
+    segment was built.
+    """
+    start: int
+    count: int
+    indptr: np.ndarray
+    docs: np.ndarray
+    tfs: np.ndarray
+
+
+class SparseScores(NamedTuple):
+    """
+    BM25 scores of the chunks matching at least one query term; every
+    other chunk scores 0. ids are sorted.
+    """
+    ids: np.ndarray
+    scores: np.ndarray
+
+    def lookup(self, ids) -> np.ndarray:
+        """Scores of arbitrary chunk ids (0 for chunks with no match)."""
+        ids = np.asarray(ids, dtype="int64")
+        out = np.zeros(len(ids))
+        if not len(self.ids) or not len(ids):
+            return out
+        pos = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        found = self.ids[pos] == ids
+        out[found] = self.scores[pos[found]]
+        return out
+
+    def top_k(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) of the k best matching chunks, best first."""
+        if k <= 0 or not len(self.ids):
+            return np.empty(0, dtype="int64"), np.empty(0)
+        if k < len(self.ids):
+            part = np.argpartition(-self.scores, k - 1)[:k]
+        else:
+            part = np.arange(len(self.ids))
+        order = part[np.argsort(-self.scores[part], kind="stable")]
+        return self.ids[order], self.scores[order]
+
+    def max(self) -> float:
+        return float(self.scores.max()) if len(self.scores) else 0.0
+
+
+class _State(NamedTuple):
+    """
+    Postings plus the statistics derived from them. n_docs counts
+    every indexed chunk id; n_live, total_len, df, idf and avgdl leave
+    out tombstoned chunks.
+    """
+    segments: List[_Segment]
+    doclens: np.ndarray
+    n_docs: int
+    n_live: int
+    total_len: int
+    df: np.ndarray
+    idf: np.ndarray
+    avgdl: float
+
+
+def _okapi_idf(n_docs: int, df: np.ndarray, epsilon: float) -> np.ndarray:
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    if len(idf):
+        # BM25Okapi floors negative idf at epsilon * mean idf
+        idf[idf < 0] = epsilon * idf.mean()
+    return idf
+
+
+class BM25Index:
+    """
+    Persistent BM25 (Okapi) index of one vector store's chunks, saved
+    in <store_dir>/bm25/ next to index.faiss:
+
+        index.json         vocabulary, segment list, chunk count
+        doclen.i32         token count per chunk (appended)
+        seg_<start>.*.npy  term-major CSR postings per segment
+
+    Arrays are read through mmap, so loading decodes only the
+    vocabulary. Appending chunks adds a new postings segment; document
+    frequencies and IDF are derived from the segments on load. Scores
+    match rank_bm25.BM25Okapi (same k1, b, epsilon floor).
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        self.dir = os.path.join(store_dir, "bm25")
+        self.manifest_path = os.path.join(self.dir, "index.json")
+        self.doclen_path = os.path.join(self.dir, "doclen.i32")
+
+        self.terms: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self.epoch = 0
+        self.analyzer = ANALYZER_SIGNATURE
+
+        # Saved (start, count) segments and chunk count, for re-mapping
+        self._saved_segments: List[Tuple[int, int]] = []
+        self._saved_docs = 0
+        # Tombstoned chunk ids of the store, left out of the statistics
+        self._dead = np.empty(0, dtype="int64")
+
+        manifest = self._read_manifest()
+        if manifest:
+            self.terms = manifest["terms"]
+            self.vocab = {t: i for i, t in enumerate(self.terms)}
+            self.epoch = manifest.get("epoch", 0)
+            self.analyzer = manifest.get("analyzer", "lower_split")
+            self._saved_segments = [(s["start"], s["count"]) for s in manifest["segments"]]
+            self._saved_docs = manifest["n_docs"]
+            self._dead = np.asarray(manifest.get("dead", []), dtype="int64")
+
+        # Segments not yet written to disk (chunk start ids)
+        self._unsaved: List[int] = []
+
+        self._write_lock = threading.Lock()
+        # None once close() released the maps
+        self._mapped: Optional[_State] = None
+        self._state = self._open_saved()
+
+    # -------------------------
+    # Paths / loading
+    # -------------------------
+
+    def _segment_path(self, start: int, part: str) -> str:
+        return os.path.join(self.dir, f"seg_{start:012d}.{part}.npy")
+
+    def _load_segment(self, start: int, count: int) -> _Segment:
+        arrays = [
+            np.load(self._segment_path(start, part), mmap_mode="r")
+            for part in ("indptr", "docs", "tfs")
+        ]
+        return _Segment(start, count, *arrays)
+
+    def _open_saved(self) -> _State:
+        """State mapped from the saved segments and chunk lengths."""
+        n_docs = self._saved_docs
+        doclens = (
+            np.memmap(self.doclen_path, dtype=_DOCLEN_DTYPE, mode="r", shape=(n_docs,))
+            if n_docs else np.empty(0, dtype=_DOCLEN_DTYPE)
+        )
+        return self._make_state(
+            [self._load_segment(start, count) for start, count in self._saved_segments],
+            doclens,
+        )
+
+    @property
+    def _state(self) -> _State:
+        state = self._mapped
+        if state is None:
+            # Re-mapped on first use after close()
+            state = self._mapped = self._open_saved()
+        return state
+
+    @_state.setter
+    def _state(self, state: _State):
+        self._mapped = state
+
+    def close(self) -> bool:
+        """
+        Releases the postings maps and their file descriptors. Scoring
+        already running finishes on the state it holds; the next use
+        maps the files again. Refused (False) while postings are
+        unsaved or being written.
+        """
+        if not self._write_lock.acquire(blocking=False):
+            return False
+        try:
+            state = self._mapped
+            if self._unsaved or (state is not None and state.n_docs != self._saved_docs):
+                return False
+            self._mapped = None
+            return True
+        finally:
+            self._write_lock.release()
+
+    def memory_bytes(self) -> int:
+        """
+        Private memory: unsaved postings and lengths plus the derived
+        statistics. Saved postings are mapped and not counted (0 while
+        closed).
+        """
+        state = self._mapped
+        if state is None:
+            return 0
+        arrays = [state.doclens, state.df, state.idf] + [
+            a for seg in state.segments for a in (seg.indptr, seg.docs, seg.tfs)
+        ]
+        return sum(a.nbytes for a in arrays if not isinstance(a, np.memmap))
+
+    def _read_manifest(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def exists(store_dir: str) -> bool:
+        return os.path.exists(os.path.join(store_dir, "bm25", "index.json"))
+
+    # -------------------------
+    # Statistics
+    # -------------------------
+
+    def _make_state(self, segments: List[_Segment], doclens: np.ndarray) -> _State:
+        n_docs = len(doclens)
+        n_terms = len(self.terms)
+        dead = self._dead[self._dead < n_docs]
+
+        df = np.zeros(n_terms, dtype="int64")
+        for seg in segments:
+            counts = np.diff(seg.indptr)
+            df[:len(counts)] += counts
+            if len(dead):
+                # Tombstoned chunks drop out of the document frequencies
+                in_dead = np.isin(seg.docs, dead)
+                if in_dead.any():
+                    terms = np.repeat(np.arange(len(counts)), counts)[in_dead]
+                    df[:len(counts)] -= np.bincount(terms, minlength=len(counts))
+
+        n_live = n_docs - len(dead)
+        total_len = int(doclens.sum()) - int(np.asarray(doclens[dead]).sum()) if n_docs else 0
+        if n_live:
+            idf = _okapi_idf(n_live, df, self.epsilon)
+            avgdl = total_len / n_live
+        else:
+            idf = np.zeros(n_terms)
+            avgdl = 0.0
+
+        return _State(segments, doclens, n_docs, n_live, total_len, df, idf, avgdl)
+
+    def set_dead(self, dead: np.ndarray) -> bool:
+        """
+        Leaves the tombstoned chunk ids (sorted) out of the statistics,
+        so deleted text no longer weighs on IDF or average length.
+        Scoring excludes them separately (score_query's exclude).
+        Returns whether the set changed.
+        """
+        dead = np.asarray(dead, dtype="int64")
+        with self._write_lock:
+            if np.array_equal(dead, self._dead):
+                return False
+            self._dead = dead
+            state = self._state
+            self._state = self._make_state(state.segments, state.doclens)
+            return True
+
+    @property
+    def n_docs(self) -> int:
+        return self._state.n_docs
+
+    # -------------------------
+    # Indexing
+    # -------------------------
+
+    def _build_segment(self, start: int, texts: List[str]) -> Tuple[_Segment, np.ndarray]:
+        doc_ids: List[int] = []
+        term_ids: List[int] = []
+        doclens = np.empty(len(texts), dtype=_DOCLEN_DTYPE)
+
+        for i, text in enumerate(texts):
+            tokens = analyze(text)
+            doclens[i] = len(tokens)
+            for token in tokens:
+                tid = self.vocab.get(token)
+                if tid is None:
+                    tid = self.vocab[token] = len(self.terms)
+                    self.terms.append(token)
+                term_ids.append(tid)
+            doc_ids.extend([start + i] * len(tokens))
+
+        n_terms = len(self.terms)
+        if term_ids:
+            # (term, doc) pairs sorted term-major, with their counts
+            keys = np.asarray(term_ids, dtype="int64") * (start + len(texts)) + np.asarray(doc_ids, dtype="int64")
+            keys, tfs = np.unique(keys, return_counts=True)
+            terms, docs = np.divmod(keys, start + len(texts))
+        else:
+            terms = docs = tfs = np.empty(0, dtype="int64")
+
+        indptr = np.zeros(n_terms + 1, dtype="int64")
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=indptr[1:])
+
+        segment = _Segment(
+            start,
+            len(texts),
+            indptr,
+            docs.astype("int32"),
+            tfs.astype("int32"),
+        )
+        return segment, doclens
+
+    def append(self, texts: List[str]):
+        """Indexes the next chunks (ids n_docs onwards), in memory until save()."""
+        if not texts:
+            return
+
+        with self._write_lock:
+            state = self._state
+            segment, doclens = self._build_segment(state.n_docs, texts)
+            self._unsaved.append(segment.start)
+            self._state = self._make_state(
+                state.segments + [segment],
+                np.concatenate([state.doclens, doclens]),
+            )
+
+    def reset(self, epoch: int):
+        """Drops every posting (the store renumbered its chunk ids)."""
+        with self._write_lock:
+            self.terms = []
+            self.vocab = {}
+            self.epoch = epoch
+            self.analyzer = ANALYZER_SIGNATURE
+            self._dead = np.empty(0, dtype="int64")
+            self._unsaved = []
+            self._saved_docs = 0
+            self._saved_segments = []
+            self._state = self._make_state([], np.empty(0, dtype=_DOCLEN_DTYPE))
+
+    def _merge_segments(self, segments: List[_Segment]) -> _Segment:
+        n_terms = len(self.terms)
+        counts = np.zeros(n_terms, dtype="int64")
+        for seg in segments:
+            c = np.diff(seg.indptr)
+            counts[:len(c)] += c
+
+        indptr = np.zeros(n_terms + 1, dtype="int64")
+        np.cumsum(counts, out=indptr[1:])
+        docs = np.empty(indptr[-1], dtype="int32")
+        tfs = np.empty(indptr[-1], dtype="int32")
+
+        # Segments cover increasing doc ranges, so appending each one's
+        # postings per term keeps every posting list sorted by doc
+        fill = indptr[:-1].copy()
+        for seg in segments:
+            seg_counts = np.diff(seg.indptr)
+            seg_terms = np.repeat(np.arange(len(seg_counts)), seg_counts)
+            offsets = np.arange(len(seg_terms)) - np.repeat(seg.indptr[:-1], seg_counts)
+            positions = fill[seg_terms] + offsets
+            docs[positions] = seg.docs
+            tfs[positions] = seg.tfs
+            fill[:len(seg_counts)] += seg_counts
+
+        return _Segment(
+            segments[0].start,
+            sum(s.count for s in segments),
+            indptr,
+            docs,
+            tfs,
+        )
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+
+    def save(self):
+        """
+        Writes postings appended since the last save (as new segments)
+        and the vocabulary. index.json is replaced last: rows and
+        segments it does not list are ignored on load.
+        """
+        with self._write_lock:
+            state = self._state
+            os.makedirs(self.dir, exist_ok=True)
+
+            segments = state.segments
+            written = set(self._unsaved)
+
+            if len(segments) > MAX_SEGMENTS:
+                merged = self._merge_segments(segments)
+                segments = [merged]
+                written = {merged.start}
+
+            for seg in segments:
+                if seg.start not in written:
+                    continue
+                for part, array in (("indptr", seg.indptr), ("docs", seg.docs), ("tfs", seg.tfs)):
+                    path = self._segment_path(seg.start, part)
+                    with open(path + ".tmp", "wb") as f:
+                        np.save(f, np.ascontiguousarray(array))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(path + ".tmp", path)
+
+            if state.n_docs > self._saved_docs:
+                new_lens = np.asarray(state.doclens[self._saved_docs:], dtype=_DOCLEN_DTYPE)
+                _write_at(
+                    self.doclen_path,
+                    self._saved_docs * _DOCLEN_DTYPE.itemsize,
+                    new_lens.tobytes(),
+                )
+            elif state.n_docs == 0 and os.path.exists(self.doclen_path):
+                os.remove(self.doclen_path)
+
+            manifest = {
+                "analyzer": self.analyzer,
+                "epoch": self.epoch,
+                "k1": self.k1,
+                "b": self.b,
+                "epsilon": self.epsilon,
+                "n_docs": state.n_docs,
+                "dead": self._dead.tolist(),
+                "segments": [{"start": s.start, "count": s.count} for s in segments],
+                "terms": self.terms,
+            }
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.manifest_path)
+
+            # Segment files no longer listed (merged away)
+            listed = {s.start for s in segments}
+            for name in os.listdir(self.dir):
+                if name.startswith("seg_") and int(name[4:16]) not in listed:
+                    os.remove(os.path.join(self.dir, name))
+
+            # Re-map what was written so memory holds no private copies
+            self._unsaved = []
+            self._saved_docs = state.n_docs
+            self._saved_segments = [(s.start, s.count) for s in segments]
+            self._state = self._open_saved()
+
+    # -------------------------
+    # Scoring
+    # -------------------------
+
+    def score_query(
+        self,
+        query_tokens: List[str],
+        exclude: Optional[np.ndarray] = None,
+        stats: Optional["LexicalStats"] = None,
+    ) -> SparseScores:
+        """
+        Scores only the chunks in the postings of the query terms, so
+        the cost follows those postings rather than the corpus size.
+        Chunk ids in exclude (sorted, e.g. tombstones) are dropped.
+
+        With stats, IDF and average length come from the whole corpus
+        instead of this store, so scores of different stores compare.
+        """
+        state = self._state
+        avgdl = stats.avgdl if stats is not None else state.avgdl
+        if not state.n_docs or not avgdl:
+            return SparseScores(np.empty(0, dtype="int64"), np.empty(0))
+
+        all_docs = []
+        all_scores = []
+
+        # Repeated query terms count once per occurrence, as in BM25Okapi
+        for token in query_tokens:
+            tid = self.vocab.get(token)
+            if tid is None or tid >= len(state.idf):
+                continue
+            idf = stats.idf(token) if stats is not None else state.idf[tid]
+
+            for seg in state.segments:
+                if tid + 1 >= len(seg.indptr):
+                    continue
+                lo, hi = seg.indptr[tid], seg.indptr[tid + 1]
+                if lo == hi:
+                    continue
+                docs = seg.docs[lo:hi]
+                tf = seg.tfs[lo:hi].astype("float64")
+                dl = state.doclens[docs]
+                all_docs.append(docs)
+                all_scores.append(idf * (
+                    tf * (self.k1 + 1)
+                    / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+                ))
+
+        if not all_docs:
+            return SparseScores(np.empty(0, dtype="int64"), np.empty(0))
+
+        ids, inverse = np.unique(
+            np.concatenate(all_docs).astype("int64"), return_inverse=True
+        )
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores), minlength=len(ids))
+
+        if exclude is not None and len(exclude):
+            keep = ~np.isin(ids, exclude, assume_unique=True)
+            ids, scores = ids[keep], scores[keep]
+
+        return SparseScores(ids, scores)
+
+    def top_k(
+        self,
+        query_tokens: List[str],
+        k: int,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) of the k best lexical matches, best first."""
+        return self.score_query(query_tokens, exclude).top_k(k)
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """BM25 score of every chunk for the query (BM25Okapi.get_scores)."""
+        sparse = self.score_query(query_tokens)
+        scores = np.zeros(self.n_docs)
+        scores[sparse.ids] = sparse.scores
+        return scores
+
+
+class LexicalStats:
+    """
+    Corpus-wide BM25 statistics (document frequencies, chunk count and
+    average length) summed over many stores' BM25 indexes, so every
+    store scores with the same IDF. update() applies only what changed
+    in a store since its last update.
+    """
+
+    def __init__(self, epsilon: float = 0.25):
+        self.epsilon = epsilon
+        self.df: Dict[str, int] = {}
+        self.n_docs = 0
+        self.total_len = 0
+
+        # key -> (terms list, df, live chunks, total_len) last counted
+        self._stores: Dict[str, Tuple[List[str], np.ndarray, int, int]] = {}
+        self._floor: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.n_docs if self.n_docs else 0.0
+
+    def _add(self, terms: List[str], counts: np.ndarray, sign: int):
+        df = self.df
+        for tid in np.flatnonzero(counts).tolist():
+            term = terms[tid]
+            value = df.get(term, 0) + sign * int(counts[tid])
+            if value:
+                df[term] = value
+            else:
+                df.pop(term, None)
+
+    def update(self, key: str, bm25: BM25Index):
+        """Counts the current contents of bm25 for store key."""
+        state = bm25._state
+        terms = bm25.terms
+
+        with self._lock:
+            old = self._stores.get(key)
+            if old is not None and old[0] is terms and old[1] is state.df:
+                return
+
+            if old is not None and old[0] is terms:
+                # Same vocabulary, grown or tombstoned: add the difference only
+                diff = state.df.copy()
+                diff[:len(old[1])] -= old[1]
+                self._add(terms, diff, 1)
+            else:
+                if old is not None:
+                    self._add(old[0], old[1], -1)
+                self._add(terms, state.df, 1)
+
+            old_docs, old_len = (old[2], old[3]) if old is not None else (0, 0)
+            self.n_docs += state.n_live - old_docs
+            self.total_len += state.total_len - old_len
+
+            self._stores[key] = (terms, state.df, state.n_live, state.total_len)
+            self._floor = None
+
+    def remove(self, key: str):
+        with self._lock:
+            old = self._stores.pop(key, None)
+            if old is None:
+                return
+            self._add(old[0], old[1], -1)
+            self.n_docs -= old[2]
+            self.total_len -= old[3]
+            self._floor = None
+
+    def idf(self, term: str) -> float:
+        """BM25Okapi IDF of term over the whole corpus."""
+        df = self.df.get(term, 0)
+        value = float(np.log(self.n_docs - df + 0.5) - np.log(df + 0.5))
+        if value >= 0:
+            return value
+
+        floor = self._floor
+        if floor is None:
+            with self._lock:
+                dfs = np.fromiter(self.df.values(), dtype="float64", count=len(self.df))
+                idf = np.log(self.n_docs - dfs + 0.5) - np.log(dfs + 0.5)
+                floor = self._floor = self.epsilon * float(idf.mean())
+        return floor
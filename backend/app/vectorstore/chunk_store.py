@@ -0,0 +1,256 @@
+import os
+import json
+import mmap
+from typing import List, Dict, Optional, Iterable, Tuple
+
+import numpy as np
+
+
+# Row i spans [ends[i - 1], ends[i]) in each blob; two uint64 columns
+# (text end, metadata end) per row in chunks.idx.
+_OFFSET_DTYPE = np.dtype("<u8")
+_ROW_BYTES = 2 * _OFFSET_DTYPE.itemsize
+
+
+def _map_file(path: str) -> Optional[mmap.mmap]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _write_at(path: str, position: int, data: bytes):
+    """Writes data at position, dropping anything after it."""
+    with open(path, "ab"):
+        pass
+    with open(path, "r+b") as f:
+        f.seek(position)
+        f.truncate()
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ChunkStore:
+    """
+    Chunk texts and metadata of one vector store, kept on disk as
+    columns and read through mmap:
+
+        chunks.idx   two uint64 end offsets per row (text, metadata)
+        chunks.text  UTF-8 texts, back to back
+        chunks.meta  compact JSON metadata (without text), back to back
+
+    Loading maps the files without decoding anything; only the rows a
+    search returns are decoded. New rows stay in memory until flush(),
+    which appends them and rewrites nothing else.
+    """
+
+    def __init__(self, store_dir: str, limit: Optional[int] = None):
+        self.idx_path = os.path.join(store_dir, "chunks.idx")
+        self.text_path = os.path.join(store_dir, "chunks.text")
+        self.meta_path = os.path.join(store_dir, "chunks.meta")
+
+        # Rows past `limit` belong to an interrupted save and are ignored
+        self._limit = limit
+
+        # (offsets, text map, meta map, rows on disk, pending rows),
+        # swapped as one tuple so readers always see a matching set;
+        # None once close() released the maps
+        self._mapped = None
+        self._state = self._map(pending=[])
+
+    @property
+    def _state(self):
+        state = self._mapped
+        if state is None:
+            # Re-mapped on first use after close()
+            state = self._mapped = self._map(pending=[])
+        return state
+
+    @_state.setter
+    def _state(self, state):
+        self._mapped = state
+
+    def _map(self, pending: List[Dict]):
+        offsets = np.empty((0, 2), dtype=_OFFSET_DTYPE)
+        if os.path.exists(self.idx_path):
+            rows = os.path.getsize(self.idx_path) // _ROW_BYTES
+            if self._limit is not None:
+                rows = min(rows, self._limit)
+            if rows:
+                offsets = np.memmap(
+                    self.idx_path, dtype=_OFFSET_DTYPE, mode="r", shape=(rows, 2)
+                )
+
+        return (
+            offsets,
+            _map_file(self.text_path),
+            _map_file(self.meta_path),
+            len(offsets),
+            pending,
+        )
+
+    @staticmethod
+    def exists(store_dir: str) -> bool:
+        return os.path.exists(os.path.join(store_dir, "chunks.idx"))
+
+    # -------------------------
+    # Reads
+    # -------------------------
+
+    def __len__(self) -> int:
+        _, _, _, on_disk, pending = self._state
+        return on_disk + len(pending)
+
+    def get(self, idx: int) -> Dict:
+        """Decodes one row (metadata, "text" and "id")."""
+        offsets, text_map, meta_map, on_disk, pending = self._state
+
+        if idx >= on_disk:
+            row = dict(pending[idx - on_disk])
+        else:
+            text_start, meta_start = offsets[idx - 1] if idx else (0, 0)
+            text_end, meta_end = offsets[idx]
+            row = json.loads(meta_map[meta_start:meta_end]) if meta_end > meta_start else {}
+            row["text"] = text_map[text_start:text_end].decode("utf-8") if text_end > text_start else ""
+
+        row["id"] = idx
+        return row
+
+    def get_meta(self, idx: int) -> Dict:
+        """Metadata of one row, without decoding its text."""
+        offsets, _, meta_map, on_disk, pending = self._state
+
+        if idx >= on_disk:
+            return {k: v for k, v in pending[idx - on_disk].items() if k != "text"}
+
+        meta_start = int(offsets[idx - 1][1]) if idx else 0
+        meta_end = int(offsets[idx][1])
+        return json.loads(meta_map[meta_start:meta_end]) if meta_end > meta_start else {}
+
+    def get_many(self, ids: Iterable[int]) -> List[Dict]:
+        return [self.get(int(i)) for i in ids]
+
+    def get_text(self, idx: int) -> str:
+        offsets, text_map, _, on_disk, pending = self._state
+
+        if idx >= on_disk:
+            return pending[idx - on_disk].get("text", "")
+
+        start = int(offsets[idx - 1][0]) if idx else 0
+        end = int(offsets[idx][0])
+        return text_map[start:end].decode("utf-8") if end > start else ""
+
+    def texts(self) -> List[str]:
+        return [self.get_text(i) for i in range(len(self))]
+
+    def all(self) -> List[Dict]:
+        return [self.get(i) for i in range(len(self))]
+
+    def resident_bytes(self) -> int:
+        """Private memory: pending rows only, mapped files live in the page cache."""
+        state = self._mapped
+        if state is None:
+            return 0
+        return sum(len(r.get("text", "")) for r in state[4])
+
+    def close(self) -> bool:
+        """
+        Releases the maps and their file descriptors. Reads already
+        running finish on the state they hold; the next read maps the
+        files again. Refused (False) while rows are pending.
+        """
+        state = self._mapped
+        if state is None:
+            return True
+        if state[4]:
+            return False
+        self._mapped = None
+        return True
+
+    # -------------------------
+    # Writes
+    # -------------------------
+
+    def append(self, rows: List[Dict]):
+        offsets, text_map, meta_map, on_disk, pending = self._state
+        self._state = (offsets, text_map, meta_map, on_disk, pending + list(rows))
+
+    def flush(self):
+        """Appends pending rows to the column files (fsynced)."""
+        offsets, _, _, on_disk, pending = self._state
+        if not pending:
+            return
+
+        text_start, meta_start = (int(v) for v in offsets[-1]) if on_disk else (0, 0)
+        text_end, meta_end = text_start, meta_start
+
+        text_parts = []
+        meta_parts = []
+        ends = np.empty((len(pending), 2), dtype=_OFFSET_DTYPE)
+
+        for i, row in enumerate(pending):
+            text = row.get("text", "").encode("utf-8")
+            meta = {k: v for k, v in row.items() if k not in ("text", "id")}
+            meta = json.dumps(meta, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+            text_end += len(text)
+            meta_end += len(meta)
+            ends[i] = (text_end, meta_end)
+            text_parts.append(text)
+            meta_parts.append(meta)
+
+        # Blobs first, offsets last: a crash leaves unreferenced bytes
+        # that the next flush overwrites.
+        _write_at(self.text_path, text_start, b"".join(text_parts))
+        _write_at(self.meta_path, meta_start, b"".join(meta_parts))
+        _write_at(self.idx_path, on_disk * _ROW_BYTES, ends.tobytes())
+
+        self._limit = on_disk + len(pending)
+        self._state = self._map(pending=[])
+
+    def write_compacted(self, keep: np.ndarray, suffix: str) -> List[Tuple[str, str]]:
+        """
+        Writes the saved rows listed in keep, renumbered densely, to new
+        column files named <file><suffix> (fsynced). Returns the
+        (written, final) path pairs; the caller renames them into place
+        and opens a new ChunkStore over them (readers of this one keep
+        the old files).
+        """
+        offsets, text_map, meta_map, on_disk, _ = self._state
+
+        ends = np.empty((len(keep), 2), dtype=_OFFSET_DTYPE)
+        renames = []
+
+        with open(self.text_path + suffix, "wb") as text_out, \
+                open(self.meta_path + suffix, "wb") as meta_out:
+            text_end = meta_end = 0
+
+            for i, idx in enumerate(keep.tolist()):
+                if idx >= on_disk:
+                    raise ValueError(f"Row {idx} is not saved")
+                text_start, meta_start = (int(v) for v in offsets[idx - 1]) if idx else (0, 0)
+                row_text_end, row_meta_end = (int(v) for v in offsets[idx])
+
+                # Raw bytes are copied, nothing is decoded
+                if row_text_end > text_start:
+                    text_out.write(text_map[text_start:row_text_end])
+                if row_meta_end > meta_start:
+                    meta_out.write(meta_map[meta_start:row_meta_end])
+
+                text_end += row_text_end - text_start
+                meta_end += row_meta_end - meta_start
+                ends[i] = (text_end, meta_end)
+
+            for f in (text_out, meta_out):
+                f.flush()
+                os.fsync(f.fileno())
+
+        with open(self.idx_path + suffix, "wb") as idx_out:
+            idx_out.write(ends.tobytes())
+            idx_out.flush()
+            os.fsync(idx_out.fileno())
+
+        for path in (self.text_path, self.meta_path, self.idx_path):
+            renames.append((path + suffix, path))
+        return renames
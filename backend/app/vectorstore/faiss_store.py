@@ -1,9 +1,72 @@
 import os
+import json
+import time
 import pickle
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional, Tuple, Sequence, NamedTuple
 
 import numpy as np
 
+from app.vectorstore.chunk_store import ChunkStore
+from app.core.config import (
+    VECTORSTORE_INDEX_TYPE,
+    VECTORSTORE_HNSW_MIN_CHUNKS,
+    VECTORSTORE_IVF_MIN_CHUNKS,
+    VECTORSTORE_IVF_NPROBE,
+    VECTORSTORE_HNSW_EF_SEARCH,
+    VECTORSTORE_COMPRESSION,
+    VECTORSTORE_PQ_M,
+    VECTORSTORE_RESCORE,
+    VECTORSTORE_RESCORE_FACTOR,
+    VECTORSTORE_FIRST_PASS_DIM,
+    VECTORSTORE_FIRST_PASS_FACTOR,
+    VECTORSTORE_MMAP,
+    VECTORSTORE_METRIC,
+    VECTORSTORE_DELTA_MAX_CHUNKS,
+    VECTORSTORE_DELTA_MAX_RATIO,
+    VECTORSTORE_TOMBSTONE_MAX_RATIO,
+)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+METRICS = ("l2", "cosine")
+COMPRESSIONS = ("none", "fp16", "sq8", "pq")
+
+HNSW_M = 32
+# faiss warns below ~39 training points per IVF list
+IVF_MIN_POINTS_PER_LIST = 39
+
+PQ_NBITS = 8
+# PQ k-means wants ~39 points per centroid (2**PQ_NBITS per sub-quantizer); smaller
+# stores asking for "pq" are encoded with sq8 until they grow.
+PQ_MIN_TRAIN_POINTS = IVF_MIN_POINTS_PER_LIST * 2 ** PQ_NBITS
+
+
+class EmbeddingMismatchError(ValueError):
+    """A store was built with another embedding provider, model or dimension."""
+
+
+# Stores saved before embeddings were recorded were all built with the
+# original Gemini setup, the only one there was
+LEGACY_EMBEDDING = {"provider": "gemini", "model": "models/gemini-embedding-001", "dim": 768}
+
+
+# _View.raw of a closed store: mapped again on next access
+_RELEASED = object()
+
+
+class _View(NamedTuple):
+    """
+    Everything a search reads, swapped as ONE object so readers always
+    see a matching set. Delta vectors are chunk ids index.ntotal
+    onwards, saved and unsaved alike.
+    """
+    index: object
+    raw: Optional[np.ndarray]  # mmap of embeddings.npy (base vectors)
+    delta: np.ndarray
+    dead: np.ndarray  # sorted tombstoned chunk ids
+    selector: object  # FAISS selector excluding dead, or None
+    chunks: ChunkStore
+
 
 # -------------------------
 # Lazy FAISS loader
@@ -17,29 +80,174 @@ class FAISSStore:
     """
     A document-scoped FAISS vector store.
     Each instance represents ONE document.
+
+    index_type is "flat", "hnsw", "ivf" or "auto". With "auto" the
+    index layout is re-chosen from the chunk count at save time.
+
+    compression is "none", "fp16", "sq8" or "pq". Every store also
+    keeps the float32 vectors of its base index in embeddings.npy (on
+    disk, read through mmap): compressed stores re-score candidates
+    against them exactly, and rebuild() regenerates index.faiss in any
+    layout from them without re-embedding anything.
+
+    metric is "l2" or "cosine". Cosine stores normalize vectors on add
+    and search an inner-product index, so hits carry true cosine
+    similarities. The metric is fixed once a store holds vectors.
+
+    These settings are recorded in store.json; explicit arguments win
+    over the recorded values, which win over the config defaults.
+
+    Saved flat and IVF indexes are mapped read-only (VECTORSTORE_MMAP).
+
+    Persistence is append-only: index.faiss holds the "base" vectors and
+    each save() writes only the vectors added since the previous one, as
+    a delta segment (delta_<start>.npy) listed in store.json. Deltas are
+    searched exactly next to the base. Once they grow past
+    VECTORSTORE_DELTA_MAX_CHUNKS / VECTORSTORE_DELTA_MAX_RATIO of the
+    base, a background compaction folds them into a new index.faiss.
+
+    Chunks are deleted by tombstoning their ids (tombstones.npy): they
+    stay on disk but are filtered out of every search. Replacing a
+    document tombstones its old chunks and appends the new ones. Once
+    tombstones pass VECTORSTORE_TOMBSTONE_MAX_RATIO, compaction rebuilds
+    the index and chunk files densely from the live rows only, which
+    renumbers chunk ids and bumps the store's epoch.
     """
 
-    def __init__(self, dim: int, store_dir: str):
+    def __init__(
+        self,
+        dim: int,
+        store_dir: str,
+        index_type: Optional[str] = None,
+        compression: Optional[str] = None,
+        rescore: Optional[bool] = None,
+        metric: Optional[str] = None,
+        embedding: Optional[Dict] = None,
+        first_pass_dim: Optional[int] = None,
+    ):
         self.dim = dim
         self.store_dir = store_dir
 
         os.makedirs(store_dir, exist_ok=True)
 
         self.index_path = os.path.join(store_dir, "index.faiss")
+        # Legacy pickled metadata, migrated to the chunk store on save
         self.meta_path = os.path.join(store_dir, "meta.pkl")
+        self.manifest_path = os.path.join(store_dir, "store.json")
+        self.raw_path = os.path.join(store_dir, "embeddings.npy")
+        self.tombstone_path = os.path.join(store_dir, "tombstones.npy")
+        self.journal_path = os.path.join(store_dir, "compaction.json")
+
+        # Finish a dense compaction interrupted mid-rename
+        self._replay_journal()
+
+        manifest = self._read_manifest()
+
+        # Vectors from another model or dimension are not comparable with
+        # the current queries: refuse the store instead of searching it
+        if manifest.get("dim", dim) != dim:
+            raise EmbeddingMismatchError(
+                f"Store {store_dir} holds {manifest['dim']}-dim vectors, expected {dim}"
+            )
+        recorded_embedding = manifest.get("embedding")
+        if recorded_embedding is None and embedding and os.path.exists(self.index_path):
+            recorded_embedding = LEGACY_EMBEDDING
+        if embedding and recorded_embedding and recorded_embedding != embedding:
+            raise EmbeddingMismatchError(
+                f"Store {store_dir} was built with {recorded_embedding}, "
+                f"current embeddings are {embedding}; re-ingest its documents"
+            )
+        self.embedding = recorded_embedding or embedding
+
+        self.index_policy = (
+            index_type or manifest.get("index_policy") or VECTORSTORE_INDEX_TYPE
+        ).lower()
+        if self.index_policy != "auto" and self.index_policy not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {self.index_policy}")
+
+        self.compression = (
+            compression or manifest.get("compression") or VECTORSTORE_COMPRESSION
+        ).lower()
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {self.compression}")
+
+        self.rescore = (
+            rescore if rescore is not None
+            else manifest.get("rescore", VECTORSTORE_RESCORE)
+        )
+
+        # Stores saved before metrics were recorded are L2
+        recorded_metric = manifest.get("metric", "l2" if manifest else None)
+        self.metric = (metric or recorded_metric or VECTORSTORE_METRIC).lower()
+        if self.metric not in METRICS:
+            raise ValueError(f"Unknown metric: {self.metric}")
+
+        self.first_pass_dim = self._check_first_pass_dim(
+            first_pass_dim if first_pass_dim is not None
+            else manifest.get("first_pass_dim", VECTORSTORE_FIRST_PASS_DIM)
+        )
 
         # 🔑 Load FAISS only when needed
         self.faiss = _load_faiss()
 
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
-            # Load existing index
-            self.index = self.faiss.read_index(self.index_path)
-            with open(self.meta_path, "rb") as f:
-                self.metadata: List[Dict] = pickle.load(f)
+        has_chunks = ChunkStore.exists(store_dir) or os.path.exists(self.meta_path)
+
+        # Delta segments persisted after the base: [{"start", "count"}]
+        self._segments: List[Dict] = []
+
+        if os.path.exists(self.index_path) and has_chunks:
+            # Load existing index; chunk rows are mapped, not decoded
+            index = self._read_index(manifest.get("index_type", "flat"))
+            delta = self._load_segments(manifest.get("segments", []), index.ntotal)
+            chunks = ChunkStore(store_dir, limit=index.ntotal + len(delta))
+            if not ChunkStore.exists(store_dir):
+                with open(self.meta_path, "rb") as f:
+                    chunks.append(pickle.load(f))
         else:
             # Create new index
-            self.index = self.faiss.IndexFlatL2(dim)
-            self.metadata: List[Dict] = []
+            index = self.faiss.IndexFlat(self._index_dim(), self._faiss_metric())
+            delta = np.empty((0, dim), dtype="float32")
+            self._mmapped = False
+            chunks = ChunkStore(store_dir, limit=0)
+
+        if index.ntotal and index.metric_type != self._faiss_metric():
+            raise ValueError(
+                f"Store {store_dir} was built with a different metric than '{self.metric}'"
+            )
+
+        self.index_type = self._index_kind(index)
+        # Read from the index itself: it is authoritative after a crash
+        # between replacing index.faiss and rewriting store.json
+        self.codec = self._index_codec(index)
+        self.version = manifest.get("version", 0)
+        # Bumped whenever chunk ids are renumbered
+        self.epoch = manifest.get("epoch", 0)
+
+        dead = self._load_tombstones(index.ntotal + len(delta))
+
+        # Serializes view swaps with re-mapping after close()
+        self._view_lock = threading.Lock()
+        self._view = _View(
+            index, self._open_raw(), delta, dead, self._selector(dead), chunks
+        )
+        # Chunk ids below this are persisted (base or segment)
+        self._saved_total = index.ntotal + len(delta)
+        self._tombstones_dirty = False
+
+        # Instances are shared across requests by the store cache:
+        # writers serialize on this lock, readers never take it.
+        self._write_lock = threading.Lock()
+        # One compaction at a time; it only takes _write_lock to commit
+        self._compact_lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+        # Background compaction state: whether a worker is running and
+        # whether a save asked for another pass while it ran
+        self._compaction_state_lock = threading.Lock()
+        self._compacting = False
+        self._compaction_requested = False
+
+        # Disk state this instance reflects (used by the store cache)
+        self._signature = self.file_signature()
 
     # -------------------------
     # Add embeddings
@@ -50,9 +258,21 @@ class FAISSStore:
         embeddings: List[List[float]],
         metadatas: List[Dict],
     ):
-        if not embeddings:
+        vectors = self._prepare(embeddings, metadatas)
+        if vectors is None:
             return
 
+        with self._write_lock:
+            self._apply(vectors, metadatas, [])
+
+    def _prepare(
+        self,
+        embeddings: List[List[float]],
+        metadatas: List[Dict],
+    ) -> Optional[np.ndarray]:
+        if len(embeddings) == 0:
+            return None
+
         if len(embeddings) != len(metadatas):
             raise ValueError("Embeddings and metadatas length mismatch")
 
@@ -63,54 +283,1245 @@ class FAISSStore:
                 f"Embedding dimension mismatch: expected {self.dim}, got {vectors.shape[1]}"
             )
 
-        start_id = len(self.metadata)
+        return self._normalize(vectors)
+
+    def _apply(
+        self,
+        vectors: Optional[np.ndarray],
+        metadatas: List[Dict],
+        delete_ids,
+    ) -> List[int]:
+        """
+        Appends chunks and tombstones ids in ONE view swap, so readers
+        never see a half-replaced document. Caller holds _write_lock.
+        Returns the ids given to the new chunks.
+        """
+        view = self._view
+        delta, dead, selector = view.delta, view.dead, view.selector
+        start_id = view.index.ntotal + len(delta)
 
         for i, meta in enumerate(metadatas):
             meta["id"] = start_id + i
 
-        self.index.add(vectors)
-        self.metadata.extend(metadatas)
+        if vectors is not None and len(vectors):
+            # New vectors only extend the delta; chunks are appended
+            # first so every visible id resolves.
+            view.chunks.append(metadatas)
+            delta = np.concatenate([delta, vectors])
+
+        delete_ids = np.asarray(list(delete_ids), dtype="int64")
+        if len(delete_ids):
+            if delete_ids.min() < 0 or delete_ids.max() >= start_id:
+                raise ValueError("Chunk id out of range")
+            merged = np.union1d(dead, delete_ids)
+            if len(merged) != len(dead):
+                dead, selector = merged, self._selector(merged)
+                self._tombstones_dirty = True
+
+        self._view = view._replace(delta=delta, dead=dead, selector=selector)
+        return list(range(start_id, start_id + len(metadatas)))
+
+    # -------------------------
+    # Delete / replace
+    # -------------------------
+
+    def delete(self, ids) -> int:
+        """Tombstones chunk ids; returns how many were live."""
+        with self._write_lock:
+            before = self.deleted_count
+            self._apply(None, [], ids)
+            return self.deleted_count - before
+
+    def _ids_of_source(self, source: str) -> List[int]:
+        """Live chunk ids of source; reads metadata only, never chunk text."""
+        view = self._view
+        live = np.setdiff1d(np.arange(len(view.chunks), dtype="int64"), view.dead)
+        return [
+            i for i in live.tolist()
+            if view.chunks.get_meta(i).get("source") == source
+        ]
+
+    def delete_document(self, source: str) -> int:
+        """Tombstones every live chunk whose metadata source is source."""
+        with self._write_lock:
+            ids = self._ids_of_source(source)
+            self._apply(None, [], ids)
+            return len(ids)
+
+    def replace_document(
+        self,
+        source: str,
+        embeddings: List[List[float]],
+        metadatas: List[Dict],
+    ) -> int:
+        """
+        Swaps the live chunks of source for new ones (re-upload of the
+        same file). Returns the number of chunks replaced.
+        """
+        vectors = self._prepare(embeddings, metadatas)
+        with self._write_lock:
+            ids = self._ids_of_source(source)
+            self._apply(vectors, metadatas, ids)
+            return len(ids)
+
+    def deleted_ids(self) -> np.ndarray:
+        return self._view.dead
+
+    @property
+    def deleted_count(self) -> int:
+        return len(self._view.dead)
+
+    @property
+    def live_count(self) -> int:
+        return self.ntotal - self.deleted_count
+
+    @staticmethod
+    def _is_dead(dead: np.ndarray, idx: int) -> bool:
+        pos = np.searchsorted(dead, idx)
+        return pos < len(dead) and dead[pos] == idx
+
+    def _selector(self, dead: np.ndarray):
+        if not len(dead):
+            return None
+        return self.faiss.IDSelectorNot(self.faiss.IDSelectorBatch(dead))
+
+    # -------------------------
+    # Base / delta views
+    # -------------------------
+
+    @property
+    def index(self):
+        """The base FAISS index (vectors not yet compacted live in the delta)."""
+        return self._view.index
+
+    @property
+    def chunks(self) -> ChunkStore:
+        return self._view.chunks
+
+    @property
+    def ntotal(self) -> int:
+        """Number of chunk ids in use (base and delta, tombstoned included)."""
+        view = self._view
+        return view.index.ntotal + len(view.delta)
+
+    @property
+    def delta_count(self) -> int:
+        return len(self._view.delta)
+
+    # -------------------------
+    # Metric helpers
+    # -------------------------
+
+    def _faiss_metric(self) -> int:
+        if self.metric == "cosine":
+            return self.faiss.METRIC_INNER_PRODUCT
+        return self.faiss.METRIC_L2
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        """Unit-length copy of vectors for cosine stores (zero rows stay zero)."""
+        if self.metric != "cosine":
+            return vectors
+        vectors = np.array(vectors, dtype="float32", copy=True)
+        self.faiss.normalize_L2(vectors)
+        return vectors
+
+    def _check_first_pass_dim(self, first_pass_dim: int) -> int:
+        if not 0 <= first_pass_dim < self.dim:
+            raise ValueError(
+                f"First-pass dimension must be within [0, {self.dim}), got {first_pass_dim}"
+            )
+        return first_pass_dim
+
+    def _index_dim(self) -> int:
+        """Dimension of the vectors new base indexes are built over."""
+        return self.first_pass_dim or self.dim
+
+    def _first_pass(self, vectors: np.ndarray, dim: int) -> np.ndarray:
+        """
+        Leading dim dimensions of stored / query vectors, renormalized
+        for cosine stores. Matryoshka models front-load information, so
+        the prefix ranks nearly like the full vector at a fraction of
+        the cost.
+        """
+        if dim == self.dim:
+            return vectors
+        return self._normalize(np.ascontiguousarray(vectors[:, :dim], dtype="float32"))
+
+    # -------------------------
+    # Index loading
+    # -------------------------
+
+    def _read_index(self, index_type: str):
+        """
+        Reads index.faiss, mapping it read-only when the layout supports
+        it: flat codes through IO_FLAG_MMAP_IFC, IVF lists through
+        IO_FLAG_MMAP. HNSW graphs are always read into memory.
+        """
+        flags = 0
+        if VECTORSTORE_MMAP and index_type == "flat":
+            flags = self.faiss.IO_FLAG_MMAP_IFC | self.faiss.IO_FLAG_READ_ONLY
+        elif VECTORSTORE_MMAP and index_type == "ivf":
+            flags = self.faiss.IO_FLAG_MMAP | self.faiss.IO_FLAG_READ_ONLY
+
+        self._mmapped = bool(flags)
+        return self.faiss.read_index(self.index_path, flags)
+
+    def _writable_copy(self, index):
+        """
+        A private copy of index that can be extended. Mapped indexes
+        are views of the file and must not be cloned or added to, so the
+        copy is read from disk instead.
+        """
+        if not self._mmapped:
+            return self.faiss.clone_index(index)
+
+        copy = self.faiss.read_index(self.index_path)
+        if copy.ntotal != index.ntotal:
+            raise RuntimeError(
+                f"{self.index_path} changed on disk while being extended"
+            )
+        return copy
+
+    # -------------------------
+    # Index layout
+    # -------------------------
+
+    def _index_kind(self, index) -> str:
+        if isinstance(index, self.faiss.IndexIVF):
+            return "ivf"
+        if isinstance(index, self.faiss.IndexHNSW):
+            return "hnsw"
+        return "flat"
+
+    def _index_codec(self, index) -> str:
+        if isinstance(index, self.faiss.IndexHNSW):
+            index = self.faiss.downcast_index(index.storage)
+        if isinstance(index, (self.faiss.IndexPQ, self.faiss.IndexIVFPQ)):
+            return "pq"
+        if isinstance(index, (self.faiss.IndexScalarQuantizer, self.faiss.IndexIVFScalarQuantizer)):
+            if index.sq.qtype == self.faiss.ScalarQuantizer.QT_fp16:
+                return "fp16"
+            return "sq8"
+        return "none"
+
+    def _select_index_type(self, ntotal: int) -> str:
+        if self.index_policy != "auto":
+            return self.index_policy
+        if ntotal >= VECTORSTORE_IVF_MIN_CHUNKS:
+            return "ivf"
+        if ntotal >= VECTORSTORE_HNSW_MIN_CHUNKS:
+            return "hnsw"
+        return "flat"
+
+    def _select_codec(self, ntotal: int) -> str:
+        if self.compression == "pq" and (
+            ntotal < PQ_MIN_TRAIN_POINTS or self._index_dim() % VECTORSTORE_PQ_M
+        ):
+            # PQ also needs the dimension split evenly into sub-quantizers
+            return "sq8"
+        return self.compression
+
+    def _target_layout(self, ntotal: int) -> Tuple[str, str]:
+        index_type = self._select_index_type(ntotal)
+        if index_type == "ivf" and ntotal < IVF_MIN_POINTS_PER_LIST:
+            # Too few points to train any inverted list
+            index_type = "flat"
+        return index_type, self._select_codec(ntotal)
+
+    def _factory_string(self, index_type: str, codec: str, ntotal: int) -> str:
+        encoding = {
+            "none": "Flat",
+            "fp16": "SQfp16",
+            "sq8": "SQ8",
+            "pq": f"PQ{VECTORSTORE_PQ_M}x{PQ_NBITS}",
+        }[codec]
+
+        if index_type == "ivf":
+            nlist = int(4 * np.sqrt(ntotal))
+            nlist = max(1, min(nlist, ntotal // IVF_MIN_POINTS_PER_LIST))
+            return f"IVF{nlist},{encoding}"
+        if index_type == "hnsw":
+            return f"HNSW{HNSW_M}" if codec == "none" else f"HNSW{HNSW_M},{encoding}"
+        return encoding
+
+    def _build_index(self, index_type: str, codec: str, vectors: np.ndarray):
+        """Creates, trains and fills a new index of the given layout."""
+        vectors = self._first_pass(vectors, self._index_dim())
+        index = self.faiss.index_factory(
+            self._index_dim(),
+            self._factory_string(index_type, codec, len(vectors)),
+            self._faiss_metric(),
+        )
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        if isinstance(index, self.faiss.IndexIVF):
+            # keeps reconstruct() / get_vectors() working
+            index.make_direct_map()
+        return index
+
+    def _search_params(
+        self,
+        index,
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        selector=None,
+    ):
+        extra = {"sel": selector} if selector is not None else {}
+        if isinstance(index, self.faiss.IndexIVF):
+            return self.faiss.SearchParametersIVF(
+                nprobe=nprobe or VECTORSTORE_IVF_NPROBE, **extra
+            )
+        if isinstance(index, self.faiss.IndexHNSW):
+            return self.faiss.SearchParametersHNSW(
+                efSearch=ef_search or VECTORSTORE_HNSW_EF_SEARCH, **extra
+            )
+        if selector is not None:
+            return self.faiss.SearchParameters(**extra)
+        return None
 
     # -------------------------
     # Search
     # -------------------------
 
-    def search(self, query_embedding: List[float], k: int = 5) -> List[Dict]:
-        if self.index.ntotal == 0:
-            return []
+    def search(
+        self,
+        query_embedding: List[float],
+        k: int = 5,
+        *,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        nprobe (IVF) and ef_search (HNSW) trade recall for latency;
+        they default to the configured values and are ignored by flat
+        indexes. Compressed and first-pass (truncated) stores over-fetch
+        and re-score exactly.
+        """
+        return self.search_batch(
+            [query_embedding], k, nprobe=nprobe, ef_search=ef_search
+        )[0]
 
-        query_vector = np.asarray(query_embedding, dtype="float32").reshape(1, -1)
+    def search_batch(
+        self,
+        query_matrix,
+        k: int = 5,
+        *,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> List[List[Dict]]:
+        """
+        Searches many queries (one per row) with a single FAISS call and
+        returns one hit list per query, in query order. Chunks returned
+        by several queries are decoded once.
+        """
+        query_matrix = np.asarray(query_matrix, dtype="float32")
+        if query_matrix.ndim == 1:
+            query_matrix = query_matrix.reshape(1, -1)
 
-        distances, indices = self.index.search(query_vector, k)
+        index, raw, delta, dead, selector, chunks = self._view
+        if index.ntotal + len(delta) == 0 or len(query_matrix) == 0:
+            return [[] for _ in range(len(query_matrix))]
 
-        results: List[Dict] = []
+        queries = self._normalize(np.ascontiguousarray(query_matrix))
 
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx == -1 or idx >= len(self.metadata):
-                continue
+        parts = []
 
-            item = dict(self.metadata[idx])
-            item["distance"] = float(dist)
-            item["confidence"] = round(1 / (1 + dist), 4)
-            results.append(item)
+        if index.ntotal:
+            # Truncated first-pass scores only shortlist: they are not
+            # comparable with the full-dimension delta scores
+            first_pass = index.d < self.dim
+            rescoring = first_pass or (
+                self.rescore and self.codec != "none" and raw is not None
+            )
+            if first_pass:
+                fetch_k = k * VECTORSTORE_FIRST_PASS_FACTOR
+            else:
+                fetch_k = k * VECTORSTORE_RESCORE_FACTOR if rescoring else k
+
+            scores, indices = index.search(
+                self._first_pass(queries, index.d),
+                fetch_k,
+                params=self._search_params(index, nprobe, ef_search, selector),
+            )
+
+            if rescoring:
+                scores, indices = self._rescore(queries, indices, raw)
+            parts.append((scores, indices))
+
+        if len(delta):
+            parts.append(self._search_delta(queries, delta, k, index.ntotal, dead))
+
+        scores, indices = self._top_k(parts, k)
+
+        decoded: Dict[int, Dict] = {}
+        results: List[List[Dict]] = []
+
+        for row_scores, row_ids in zip(scores, indices):
+            hits: List[Dict] = []
+            for score, idx in zip(row_scores.tolist(), row_ids.tolist()):
+                if idx < 0 or idx >= len(chunks):
+                    continue
+                row = decoded.get(idx)
+                if row is None:
+                    row = decoded[idx] = chunks.get(idx)
+                    hits.append(self._score_hit(row, score))
+                else:
+                    # only repeats across queries pay for a copy
+                    hits.append(self._score_hit(dict(row), score))
+            results.append(hits)
 
         return results
 
+    def _rescore(
+        self,
+        queries: np.ndarray,
+        indices: np.ndarray,
+        raw: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact scores for the over-fetched base candidates of every query."""
+        valid = indices >= 0
+        safe = np.where(valid, indices, 0)
+
+        unique_ids, inverse = np.unique(safe, return_inverse=True)
+        rows = np.asarray(raw[unique_ids], dtype="float32")[inverse.reshape(safe.shape)]
+
+        if self.metric == "cosine":
+            scores = np.einsum("qkd,qd->qk", rows, queries)
+        else:
+            diffs = rows - queries[:, None, :]
+            scores = np.einsum("qkd,qkd->qk", diffs, diffs)
+
+        return scores, np.where(valid, indices, -1)
+
+    def _search_delta(
+        self,
+        queries: np.ndarray,
+        delta: np.ndarray,
+        k: int,
+        base_n: int,
+        dead: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search of the (small) delta vectors, skipping tombstones."""
+        if self.metric == "cosine":
+            scores = queries @ delta.T
+            worst = -np.inf
+        else:
+            scores = (
+                np.einsum("ij,ij->i", queries, queries)[:, None]
+                - 2 * (queries @ delta.T)
+                + np.einsum("ij,ij->i", delta, delta)[None, :]
+            )
+            np.maximum(scores, 0, out=scores)
+            worst = np.inf
+
+        dead_rows = dead[dead >= base_n] - base_n
+        scores[:, dead_rows] = worst
+
+        k = min(k, len(delta))
+        ranking = -scores if self.metric == "cosine" else scores
+        indices = np.argpartition(ranking, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, indices, axis=1)
+
+        indices = np.where(np.isinf(scores), -1, indices + base_n)
+        return scores.astype("float32"), indices
+
+    def _top_k(
+        self,
+        parts: List[Tuple[np.ndarray, np.ndarray]],
+        k: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Merges per-query (scores, ids) blocks into the k best per query."""
+        scores = np.concatenate([p[0] for p in parts], axis=1)
+        indices = np.concatenate([p[1] for p in parts], axis=1)
+
+        if self.metric == "cosine":
+            scores = np.where(indices >= 0, scores, -np.inf)
+            order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        else:
+            scores = np.where(indices >= 0, scores, np.inf)
+            order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+
+        return (
+            np.take_along_axis(scores, order, axis=1),
+            np.take_along_axis(indices, order, axis=1),
+        )
+
+    def make_hit(self, idx: int, score: float) -> Optional[Dict]:
+        """
+        Builds a search hit for chunk idx, or None if idx is unknown.
+        score is the raw FAISS value: squared L2 distance, or cosine
+        similarity for cosine stores. Shared with searches that run
+        outside this store's own index.
+        """
+        view = self._view
+        if idx < 0 or idx >= len(view.chunks) or self._is_dead(view.dead, idx):
+            return None
+
+        return self._score_hit(view.chunks.get(idx), score)
+
+    def score_chunks(self, query_matrix, ids) -> List[Dict]:
+        """
+        Hits for chosen chunk ids (e.g. lexical candidates the vector
+        search did not return), each scored exactly against its best
+        matching query row. Unknown and tombstoned ids are skipped.
+        """
+        view = self._view
+        total = view.index.ntotal + len(view.delta)
+        ids = [
+            int(i) for i in ids
+            if 0 <= i < min(total, len(view.chunks)) and not self._is_dead(view.dead, int(i))
+        ]
+        if not ids:
+            return []
+
+        queries = np.asarray(query_matrix, dtype="float32")
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        queries = self._normalize(queries)
+
+        rows = self._rows_of(view, np.asarray(ids, dtype="int64"))
+
+        if self.metric == "cosine":
+            scores = (rows @ queries.T).max(axis=1)
+        else:
+            diffs = rows[:, None, :] - queries[None, :, :]
+            scores = np.einsum("nqd,nqd->nq", diffs, diffs).min(axis=1)
+
+        return [
+            self._score_hit(view.chunks.get(idx), score)
+            for idx, score in zip(ids, scores.tolist())
+        ]
+
+    def _score_hit(self, item: Dict, score: float) -> Dict:
+        if self.metric == "cosine":
+            item["similarity"] = round(score, 4)
+            item["distance"] = 1.0 - score
+            item["confidence"] = round(max(0.0, score), 4)
+        else:
+            item["distance"] = score
+            item["confidence"] = round(1 / (1 + score), 4)
+        return item
+
     # -------------------------
     # BM25 support helpers
     # -------------------------
 
     def get_all_texts(self) -> List[str]:
-        return [m.get("text", "") for m in self.metadata]
+        """Texts by chunk id; tombstoned chunks read as ""."""
+        view = self._view
+        texts = view.chunks.texts()
+        for idx in view.dead.tolist():
+            if idx < len(texts):
+                texts[idx] = ""
+        return texts
+
+    def get_texts(self, start: int, end: int) -> List[str]:
+        """Texts of chunk ids [start, end), tombstoned ones included."""
+        chunks = self.chunks
+        return [chunks.get_text(i) for i in range(start, min(end, len(chunks)))]
 
     def get_all_metadata(self) -> List[Dict]:
-        return list(self.metadata)
+        return self.chunks.all()
+
+    # -------------------------
+    # Vector access
+    # -------------------------
+
+    def _open_raw(self) -> Optional[np.ndarray]:
+        # Stores saved before raw vectors were always kept may lack it
+        if not os.path.exists(self.raw_path):
+            return None
+        return np.load(self.raw_path, mmap_mode="r")
+
+    @property
+    def _view(self) -> _View:
+        view = self._current_view
+        if view.raw is not _RELEASED:
+            return view
+        with self._view_lock:
+            view = self._current_view
+            if view.raw is _RELEASED:
+                view = self._current_view = view._replace(raw=self._open_raw())
+            return view
+
+    @_view.setter
+    def _view(self, view: _View):
+        with self._view_lock:
+            self._current_view = view
+
+    def close(self) -> bool:
+        """
+        Releases the mapped raw vectors and chunk columns, and their
+        file descriptors (the store cache calls this on eviction).
+        Searches already running finish on the view they hold; the next
+        access maps the files again, so the instance stays usable.
+        Skipped (False) while a write holds the store.
+        """
+        if not self._write_lock.acquire(blocking=False):
+            return False
+        try:
+            released = self.chunks.close()
+            with self._view_lock:
+                view = self._current_view
+                if view.raw is not None:
+                    self._current_view = view._replace(raw=_RELEASED)
+            return released
+        finally:
+            self._write_lock.release()
+
+    def get_vectors(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Stored vectors for chunk ids [start, end) as a float32 matrix."""
+        return self._vectors_of(self._view, start, end)
+
+    def _vectors_of(self, view: _View, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        index, raw, delta = view.index, view.raw, view.delta
+        base_n = index.ntotal
+        total = base_n + len(delta)
+        end = total if end is None else min(end, total)
+        if end <= start:
+            return np.empty((0, self.dim), dtype="float32")
+
+        parts = []
+        if start < base_n:
+            base_end = min(end, base_n)
+            if raw is not None:
+                # reconstruct() would return lossy decoded codes
+                parts.append(np.asarray(raw[start:base_end], dtype="float32"))
+            else:
+                parts.append(index.reconstruct_n(start, base_end - start))
+        if end > base_n:
+            parts.append(delta[max(start, base_n) - base_n:end - base_n])
+
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def get_vectors_by_ids(self, ids) -> np.ndarray:
+        """Stored vectors of arbitrary chunk ids, in the order given."""
+        view = self._view
+        ids = np.asarray(ids, dtype="int64").reshape(-1)
+        total = view.index.ntotal + len(view.delta)
+        if len(ids) and (ids.min() < 0 or ids.max() >= total):
+            raise ValueError(f"Chunk ids must be within [0, {total})")
+        return self._rows_of(view, ids)
+
+    def _rows_of(self, view: _View, ids: np.ndarray) -> np.ndarray:
+        base_n = view.index.ntotal
+        rows = np.empty((len(ids), self.dim), dtype="float32")
+
+        in_base = ids < base_n
+        if in_base.any():
+            if view.raw is not None:
+                rows[in_base] = view.raw[ids[in_base]]
+            else:
+                rows[in_base] = view.index.reconstruct_batch(ids[in_base])
+        if not in_base.all():
+            rows[~in_base] = view.delta[ids[~in_base] - base_n]
+
+        return rows
+
+    # -------------------------
+    # Cache support helpers
+    # -------------------------
+
+    def file_signature(self) -> Optional[Tuple]:
+        """
+        (mtime_ns, size) of the index, manifest and chunk offset files,
+        or None if the store has not been persisted yet.
+        """
+        chunks_path = (
+            self.chunks.idx_path
+            if os.path.exists(self.chunks.idx_path)
+            else self.meta_path
+        )
+        try:
+            index_stat = os.stat(self.index_path)
+            meta_stat = os.stat(chunks_path)
+        except FileNotFoundError:
+            return None
+
+        try:
+            # Every save rewrites store.json (legacy stores have none)
+            manifest_stat = os.stat(self.manifest_path)
+            manifest_sig = (manifest_stat.st_mtime_ns, manifest_stat.st_size)
+        except FileNotFoundError:
+            manifest_sig = None
+
+        return (
+            index_stat.st_mtime_ns,
+            index_stat.st_size,
+            meta_stat.st_mtime_ns,
+            meta_stat.st_size,
+            manifest_sig,
+        )
+
+    def is_stale(self) -> bool:
+        """True if the files on disk changed since this instance loaded them."""
+        return self.file_signature() != self._signature
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate private memory charged to the store cache: vector
+        codes and graph links read into memory, unsaved vectors and
+        chunk rows. Mapped files (flat / IVF codes, raw vectors, chunk
+        columns) live in the shared page cache and are not counted.
+        """
+        view = self._current_view
+        resident = (
+            view.delta.nbytes
+            + view.dead.nbytes
+            + view.chunks.resident_bytes()
+        )
+        if isinstance(view.raw, np.ndarray) and not isinstance(view.raw, np.memmap):
+            resident += view.raw.nbytes
+        if self._mmapped:
+            return resident
+
+        index_dim = view.index.d
+        per_vector = {
+            "none": index_dim * 4,
+            "fp16": index_dim * 2,
+            "sq8": index_dim,
+            "pq": VECTORSTORE_PQ_M,
+        }[self.codec]
+        if self.index_type == "hnsw":
+            # two link levels on average, 4-byte neighbour ids
+            per_vector += HNSW_M * 2 * 4
+        elif self.index_type == "ivf":
+            per_vector += 8  # list ids + direct map
+        return view.index.ntotal * per_vector + resident
+
+    # -------------------------
+    # Recall / latency report
+    # -------------------------
+
+    def evaluate_search_tradeoff(
+        self,
+        k: int = 10,
+        num_queries: int = 100,
+        nprobe_values: Sequence[int] = (1, 4, 8, 16, 32, 64, 128),
+        ef_values: Sequence[int] = (16, 32, 64, 128, 256),
+    ) -> List[Dict]:
+        """
+        Measures recall@k against exact search and mean latency per
+        query for each nprobe / efSearch setting of the current index.
+        Queries are sampled from the stored vectors. First-pass indexes
+        are measured before re-scoring. Each row names the index type,
+        codec and dimension it measured; the first is exact search.
+        """
+        view = self._view
+        index = view.index
+        # Only the base is approximate; delta segments are searched exactly
+        vectors = self._vectors_of(view, 0, index.ntotal)
+        if len(vectors) == 0:
+            return []
+
+        k = min(k, len(vectors))
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+        queries = vectors[picks]
+        probes = self._first_pass(queries, index.d)
+
+        exact = self.faiss.IndexFlat(self.dim, self._faiss_metric())
+        exact.add(vectors)
+
+        def timed(run):
+            start = time.perf_counter()
+            _, ids = run()
+            elapsed = time.perf_counter() - start
+            return ids, elapsed * 1000 / len(queries)
+
+        truth, exact_ms = timed(lambda: exact.search(queries, k))
+
+        def recall(ids) -> float:
+            hits = sum(
+                len(set(found[found >= 0]) & set(expected))
+                for found, expected in zip(ids, truth)
+            )
+            return round(hits / truth.size, 4)
+
+        report = [{
+            "index_type": "flat",
+            "codec": "none",
+            "dim": self.dim,
+            "param": None,
+            "value": None,
+            "recall_at_k": 1.0,
+            "latency_ms": round(exact_ms, 4),
+        }]
+
+        if self.index_type == "ivf":
+            param, values = "nprobe", [v for v in nprobe_values if v <= index.nlist]
+        elif self.index_type == "hnsw":
+            param, values = "efSearch", list(ef_values)
+        else:
+            if self.codec != "none" or index.d < self.dim:
+                ids, ms = timed(lambda: index.search(probes, k))
+                report.append({
+                    "index_type": "flat",
+                    "codec": self.codec,
+                    "dim": index.d,
+                    "param": None,
+                    "value": None,
+                    "recall_at_k": recall(ids),
+                    "latency_ms": round(ms, 4),
+                })
+            return report
+
+        for value in values:
+            params = self._search_params(
+                index,
+                nprobe=value if param == "nprobe" else None,
+                ef_search=value if param == "efSearch" else None,
+            )
+            ids, ms = timed(lambda: index.search(probes, k, params=params))
+            report.append({
+                "index_type": self.index_type,
+                "codec": self.codec,
+                "dim": index.d,
+                "param": param,
+                "value": value,
+                "recall_at_k": recall(ids),
+                "latency_ms": round(ms, 4),
+            })
+
+        return report
 
     # -------------------------
     # Persistence
     # -------------------------
 
+    def _segment_path(self, start: int) -> str:
+        return os.path.join(self.store_dir, f"delta_{start:012d}.npy")
+
+    def _load_segments(self, segments: List[Dict], base_n: int) -> np.ndarray:
+        """
+        Reads the delta segments listed in store.json. Segments already
+        folded into the base (a compaction that stopped before rewriting
+        store.json) are skipped.
+        """
+        parts = []
+        expected = base_n
+
+        for segment in segments:
+            if segment["start"] + segment["count"] <= base_n:
+                continue
+            if segment["start"] != expected:
+                raise RuntimeError(
+                    f"Store {self.store_dir} is missing vectors {expected}..{segment['start']}"
+                )
+            parts.append(np.load(self._segment_path(segment["start"])))
+            self._segments.append(segment)
+            expected += segment["count"]
+
+        if not parts:
+            return np.empty((0, self.dim), dtype="float32")
+        return np.concatenate(parts).astype("float32", copy=False)
+
+    def _write_atomic(self, path: str, write):
+        # Written aside and renamed: other workers may have the old file
+        # mapped, and truncating it under them would fault.
+        tmp_path = path + ".tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _load_tombstones(self, total: int) -> np.ndarray:
+        if not os.path.exists(self.tombstone_path):
+            return np.empty(0, dtype="int64")
+        dead = np.load(self.tombstone_path).astype("int64")
+        # ids past the loaded total belong to an interrupted save
+        return dead[dead < total]
+
+    def _save_tombstones(self, dead: np.ndarray):
+        def write(path):
+            with open(path, "wb") as f:
+                np.save(f, dead)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._write_atomic(self.tombstone_path, write)
+        self._tombstones_dirty = False
+
+    def _replay_journal(self):
+        """
+        A dense compaction replaces several files. It writes them aside,
+        then records the renames in compaction.json before applying
+        them; a journal left behind by a crash is re-applied here.
+        """
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                journal = json.load(f)
+        except FileNotFoundError:
+            return
+
+        # Another worker may be replaying the same journal
+        for written, final in journal["renames"]:
+            try:
+                os.replace(written, final)
+            except FileNotFoundError:
+                pass
+        for path in journal["deletes"]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+    def _read_manifest(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(data: Dict, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _manifest(self, index, deleted: int) -> Dict:
+        """Next version of store.json; called with _write_lock held."""
+        self.version += 1
+
+        manifest = {
+            "version": self.version,
+            "epoch": self.epoch,
+            "dim": self.dim,
+            "index_type": self.index_type,
+            "index_policy": self.index_policy,
+            "codec": self.codec,
+            "compression": self.compression,
+            "rescore": self.rescore,
+            "metric": self.metric,
+            "first_pass_dim": self.first_pass_dim,
+            "ntotal": self._saved_total,
+            "base_ntotal": index.ntotal,
+            "segments": self._segments,
+            "deleted": deleted,
+        }
+        if self.embedding:
+            manifest["embedding"] = self.embedding
+        if self.index_type == "ivf":
+            manifest["nlist"] = index.nlist
+        elif self.index_type == "hnsw":
+            manifest["hnsw_m"] = HNSW_M
+        if self.codec == "pq":
+            manifest["pq_m"] = VECTORSTORE_PQ_M
+        return manifest
+
+    def _write_manifest(self, index):
+        """Commits a save or compaction; called with _write_lock held."""
+        manifest = self._manifest(index, self.deleted_count)
+        self._write_atomic(
+            self.manifest_path, lambda path: self._write_json(manifest, path)
+        )
+
+    def _tombstones_over_limit(self) -> bool:
+        dead = self.deleted_count
+        return dead > 0 and dead >= VECTORSTORE_TOMBSTONE_MAX_RATIO * self.ntotal
+
+    def _needs_compaction(self) -> bool:
+        if self._tombstones_over_limit():
+            return True
+
+        view = self._view
+        index, delta = view.index, view.delta
+        if not len(delta):
+            return False
+        if index.ntotal == 0:
+            return True
+        if self._target_layout(index.ntotal + len(delta)) != (self.index_type, self.codec):
+            # configured mode changed or a size threshold was crossed
+            return True
+        return (
+            len(delta) >= VECTORSTORE_DELTA_MAX_CHUNKS
+            or len(delta) >= VECTORSTORE_DELTA_MAX_RATIO * index.ntotal
+        )
+
     def save(self):
-        self.faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        """
+        Persists vectors, chunks and deletions since the last save.
+        Costs time proportional to the new data: chunk rows are
+        appended, the new vectors become one delta segment and the
+        tombstone list is rewritten. A store without a base index is
+        compacted right away; otherwise compaction runs in the
+        background once deltas or tombstones are large enough.
+        """
+        with self._write_lock:
+            # Chunk rows first: rows past the recorded total are ignored on load
+            self.chunks.flush()
+            if os.path.exists(self.meta_path):
+                os.remove(self.meta_path)
+
+            view = self._view
+            index, delta = view.index, view.delta
+            total = index.ntotal + len(delta)
+            changed = False
+            compact_now = False
+
+            if index.ntotal == 0 and total > 0:
+                # No base yet: the new vectors become the base directly
+                self._saved_total = total
+                compact_now = True
+            elif total > self._saved_total:
+                start = self._saved_total
+                new_vectors = delta[start - index.ntotal:]
+
+                def write_segment(path):
+                    with open(path, "wb") as f:
+                        np.save(f, new_vectors)
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                self._write_atomic(self._segment_path(start), write_segment)
+                self._segments.append({"start": start, "count": len(new_vectors)})
+                self._saved_total = total
+                changed = True
+            elif not os.path.exists(self.index_path):
+                # Empty store: persist it so it can be listed and reloaded
+                self._write_atomic(
+                    self.index_path,
+                    lambda path: self.faiss.write_index(index, path),
+                )
+                changed = True
+
+            if self._tombstones_dirty:
+                self._save_tombstones(view.dead)
+                changed = True
+
+            if changed and not compact_now:
+                self._write_manifest(index)
+
+            self._signature = self.file_signature()
+            compact_later = not compact_now and self._needs_compaction()
+
+        if compact_now:
+            self.compact()
+        elif compact_later:
+            self._compact_in_background()
+
+    def _compact_in_background(self):
+        with self._compaction_state_lock:
+            self._compaction_requested = True
+            if self._compacting:
+                # The running worker checks the request before it exits
+                return
+            self._compacting = True
+            self._compaction = threading.Thread(
+                target=self._compaction_worker,
+                name=f"compact-{os.path.basename(self.store_dir)}",
+                daemon=True,
+            )
+            self._compaction.start()
+
+    def _compaction_worker(self):
+        """
+        Compacts until no save asks for more. A save landing during a
+        pass adds a delta the pass does not fold in; its request makes
+        the worker run again instead of waiting for another save.
+        """
+        try:
+            while True:
+                with self._compaction_state_lock:
+                    if not self._compaction_requested:
+                        self._compacting = False
+                        return
+                    self._compaction_requested = False
+
+                self.compact()
+        except BaseException:
+            with self._compaction_state_lock:
+                self._compacting = False
+            raise
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        running = self._compaction
+        if running is not None:
+            running.join(timeout)
+
+    def compact(self):
+        """
+        Folds every saved delta segment into a new base index.faiss.
+        The new base is built without holding the write lock, so adds
+        and saves continue meanwhile; only the final swap takes it.
+
+        Past the tombstone limit the store is instead rebuilt densely
+        from its live chunks (see _compact_dense).
+        """
+        with self._compact_lock:
+            if self._tombstones_over_limit():
+                with self._write_lock:
+                    self._compact_dense()
+                return
+
+            with self._write_lock:
+                view = self._view
+                index = view.index
+                base_n = index.ntotal
+                upto = self._saved_total
+                if upto <= base_n:
+                    return
+
+            layout = self._target_layout(upto)
+            new_vectors = self._vectors_of(view, base_n, upto)
+
+            vectors = None
+            if (
+                layout != (self.index_type, self.codec)
+                or base_n == 0
+                or index.d != self._index_dim()
+            ):
+                # New layout / codec / first-pass dim (or no base yet): build from scratch
+                vectors = self._vectors_of(view, 0, upto)
+                new_index = self._build_index(*layout, vectors)
+            else:
+                new_index = self._writable_copy(index)
+                new_index.add(self._first_pass(new_vectors, index.d))
+
+            index_type, codec = layout
+            if vectors is None:
+                vectors = self._vectors_of(view, 0, upto)
+            # Longer than the old base is harmless: rows are read by id
+            tmp_path = self.raw_path + ".tmp.npy"
+            np.save(tmp_path, np.ascontiguousarray(vectors, dtype="float32"))
+
+            with self._write_lock:
+                os.replace(tmp_path, self.raw_path)
+
+                # index.faiss before store.json: on load, segments the
+                # index already covers are skipped
+                self._write_atomic(
+                    self.index_path,
+                    lambda path: self.faiss.write_index(new_index, path),
+                )
+
+                self.index_type, self.codec = index_type, codec
+
+                merged = [s for s in self._segments if s["start"] < upto]
+                self._segments = [s for s in self._segments if s["start"] >= upto]
+
+                if VECTORSTORE_MMAP and index_type in ("flat", "ivf"):
+                    # Drop the private copy in favour of the shared mapping
+                    new_index = self._read_index(index_type)
+                else:
+                    self._mmapped = False
+
+                current = self._view
+                self._view = current._replace(
+                    index=new_index,
+                    raw=self._open_raw(),
+                    delta=current.delta[upto - base_n:],
+                )
+
+                self._write_manifest(new_index)
+                self._signature = self.file_signature()
+
+            for segment in merged:
+                path = self._segment_path(segment["start"])
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def rebuild(
+        self,
+        index_type: Optional[str] = None,
+        compression: Optional[str] = None,
+        first_pass_dim: Optional[int] = None,
+    ):
+        """
+        Regenerates index.faiss from the stored raw vectors, optionally
+        switching index type, compression and / or first-pass
+        dimension (0 = full vectors), and folds in every delta segment
+        and tombstone. Makes no embedding calls.
+        """
+        if index_type is not None:
+            index_type = index_type.lower()
+            if index_type != "auto" and index_type not in INDEX_TYPES:
+                raise ValueError(f"Unknown index type: {index_type}")
+        if compression is not None:
+            compression = compression.lower()
+            if compression not in COMPRESSIONS:
+                raise ValueError(f"Unknown compression: {compression}")
+        if first_pass_dim is not None:
+            first_pass_dim = self._check_first_pass_dim(first_pass_dim)
+
+        with self._compact_lock, self._write_lock:
+            self.index_policy = index_type or self.index_policy
+            self.compression = compression or self.compression
+            if first_pass_dim is not None:
+                self.first_pass_dim = first_pass_dim
+            self._compact_dense()
+
+    def _compact_dense(self):
+        """
+        Rebuilds index, raw vectors and chunk files from the live chunks
+        only, renumbering ids densely when some were deleted. Runs with
+        _write_lock held (adds wait, searches continue on the old view)
+        and commits through the compaction journal.
+        """
+        view = self._view
+        view.chunks.flush()
+        renumbered = len(view.dead) > 0
+
+        total = view.index.ntotal + len(view.delta)
+        keep = np.setdiff1d(np.arange(total, dtype="int64"), view.dead, assume_unique=True)
+        vectors = self._vectors_of(view, 0, total)[keep]
+
+        if len(keep):
+            index_type, codec = self._target_layout(len(keep))
+            new_index = self._build_index(index_type, codec, vectors)
+        else:
+            index_type, codec = "flat", "none"
+            new_index = self.faiss.IndexFlat(self._index_dim(), self._faiss_metric())
+
+        suffix = ".compact"
+        renames = view.chunks.write_compacted(keep, suffix) if renumbered else []
+
+        self.faiss.write_index(new_index, self.index_path + suffix)
+        renames.append((self.index_path + suffix, self.index_path))
+
+        deletes = [self.tombstone_path] + [
+            self._segment_path(segment["start"]) for segment in self._segments
+        ]
+        with open(self.raw_path + suffix, "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype="float32"))
+            f.flush()
+            os.fsync(f.fileno())
+        renames.append((self.raw_path + suffix, self.raw_path))
+
+        self.index_type, self.codec = index_type, codec
+        self._segments = []
+        self._saved_total = len(keep)
+        if renumbered:
+            self.epoch += 1
+
+        manifest = self._manifest(new_index, deleted=0)
+        self._write_json(manifest, self.manifest_path + suffix)
+        renames.append((self.manifest_path + suffix, self.manifest_path))
+
+        # Everything is on disk; the journal makes the renames all-or-nothing
+        self._write_atomic(
+            self.journal_path,
+            lambda path: self._write_json({"renames": renames, "deletes": deletes}, path),
+        )
+        self._replay_journal()
+
+        if VECTORSTORE_MMAP and index_type in ("flat", "ivf"):
+            new_index = self._read_index(index_type)
+        else:
+            self._mmapped = False
+
+        self._view = _View(
+            new_index,
+            self._open_raw(),
+            np.empty((0, self.dim), dtype="float32"),
+            np.empty(0, dtype="int64"),
+            None,
+            # a new instance: readers of the old view keep the old files
+            ChunkStore(self.store_dir, limit=len(keep)) if renumbered else view.chunks,
+        )
+        self._tombstones_dirty = False
+        self._signature = self.file_signature()
@@ -1,9 +1,25 @@
 import os
-from typing import Optional, List, Dict
+import shutil
+import logging
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Optional, List, Dict, Tuple
 
-from rank_bm25 import BM25Okapi
-from app.vectorstore.faiss_store import FAISSStore
-from app.core.config import VECTORSTORE_BASE_DIR, EMBED_DIM
+from app.vectorstore.faiss_store import FAISSStore, EmbeddingMismatchError
+from app.vectorstore.bm25_index import BM25Index, LexicalStats
+from app.utils.text_analyzer import ANALYZER_SIGNATURE
+from app.vectorstore.unified_store import UnifiedStore
+from app.services.embedding_providers import embedding_signature
+from app.core.config import (
+    VECTORSTORE_BASE_DIR,
+    EMBED_DIM,
+    VECTORSTORE_CACHE_MAX_MB,
+    VECTORSTORE_CACHE_MAX_STORES,
+    VECTORSTORE_LAYOUT,
+    VECTORSTORE_UNIFIED_SHARDS,
+    VECTORSTORE_METRIC,
+)
 
 # ---------------------------
 # Config (Linked to app/core/config.py)
@@ -12,39 +28,280 @@ from app.core.config import VECTORSTORE_BASE_DIR, EMBED_DIM
 BASE_STORE_DIR = VECTORSTORE_BASE_DIR
 # EMBED_DIM is imported directly from config (768)
 DEFAULT_STORE_ID = "__default__"
+UNIFIED_STORE_ID = "__unified__"
+USE_UNIFIED_INDEX = VECTORSTORE_LAYOUT == "unified"
+STORE_CACHE_MAX_BYTES = VECTORSTORE_CACHE_MAX_MB * 1024 * 1024
+# Worst case of a loaded store: chunk columns, raw vectors, index and
+# up to MAX_SEGMENTS BM25 segments of three arrays each
+FDS_PER_STORE = 32
+# Provider / model / dim recorded in every store; others fail to load
+EMBEDDING_SIGNATURE = embedding_signature()
+
+logger = logging.getLogger(__name__)
+
+
+def _fd_store_limit() -> int:
+    """
+    Stores the file descriptor limit allows, keeping half of it for
+    sockets and uploads. The soft limit is raised to the hard one
+    first. Unlimited (0) where the limit cannot be read.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = 65536 if hard == resource.RLIM_INFINITY else min(hard, 65536)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return 0
+    return max(1, soft // 2 // FDS_PER_STORE)
+
+
+STORE_CACHE_MAX_STORES = VECTORSTORE_CACHE_MAX_STORES or _fd_store_limit()
+
+# ---------------------------
+# 🔹 STORE CACHE
+# ---------------------------
+
+# Process-wide registry of loaded stores, least recently used first.
+_STORE_CACHE: "OrderedDict[str, FAISSStore]" = OrderedDict()
+_STORE_CACHE_LOCK = threading.Lock()
+# store_dir -> queries currently using it; pinned stores are not evicted
+_PINS: Counter = Counter()
+
+
+@contextmanager
+def pin_stores(store_dirs: Iterable[str]):
+    """
+    Keeps the stores of store_dirs cached while the block runs (one
+    query), so loading the last of them cannot evict the first.
+    """
+    store_dirs = list(store_dirs)
+    with _STORE_CACHE_LOCK:
+        _PINS.update(store_dirs)
+    try:
+        yield
+    finally:
+        with _STORE_CACHE_LOCK:
+            _PINS.subtract(store_dirs)
+            for store_dir in store_dirs:
+                if _PINS[store_dir] <= 0:
+                    del _PINS[store_dir]
+
+
+def _cached_bytes(store_dir: str) -> int:
+    """Footprint of a cached store and its BM25 index. Caller holds the lock."""
+    bm25 = _BM25_CACHE.get(store_dir)
+    return _STORE_CACHE[store_dir].memory_bytes() + (bm25.memory_bytes() if bm25 else 0)
+
+
+def _release(store: FAISSStore, bm25: Optional[BM25Index]):
+    """Closes the maps of an evicted store; in-flight searches keep theirs."""
+    store.close()
+    if bm25 is not None:
+        bm25.close()
+
+
+def _evict_over_budget(keep: str):
+    """
+    Drops least-recently-used stores until the cache fits the byte and
+    store-count budgets, closing their mapped files. The store just
+    requested and pinned stores are never evicted. Caller holds the lock.
+    """
+    total = sum(_cached_bytes(d) for d in _STORE_CACHE)
+    max_stores = STORE_CACHE_MAX_STORES or len(_STORE_CACHE)
+
+    for store_dir in list(_STORE_CACHE.keys()):
+        if total <= STORE_CACHE_MAX_BYTES and len(_STORE_CACHE) <= max_stores:
+            break
+        if store_dir == keep or store_dir in _PINS:
+            continue
+
+        total -= _cached_bytes(store_dir)
+        _release(_STORE_CACHE.pop(store_dir), _BM25_CACHE.pop(store_dir, None))
+
+
+def _load_store(store_dir: str) -> FAISSStore:
+    """
+    Returns the resident store for store_dir, loading it from disk
+    on a miss or when its index files changed since it was loaded.
+    """
+    with _STORE_CACHE_LOCK:
+        store = _STORE_CACHE.get(store_dir)
+        if store is not None and not store.is_stale():
+            _STORE_CACHE.move_to_end(store_dir)
+            return store
+
+    # Disk reads happen outside the lock so other stores stay available
+    fresh = FAISSStore(dim=EMBED_DIM, store_dir=store_dir, embedding=EMBEDDING_SIGNATURE)
+
+    with _STORE_CACHE_LOCK:
+        current = _STORE_CACHE.get(store_dir)
+        if current is not None and not current.is_stale():
+            # Another thread loaded it first
+            _STORE_CACHE.move_to_end(store_dir)
+            return current
+
+        if current is not None:
+            # Replaced by a newer load of the same directory
+            _release(current, _BM25_CACHE.pop(store_dir, None))
+        _STORE_CACHE[store_dir] = fresh
+        _STORE_CACHE.move_to_end(store_dir)
+        _evict_over_budget(keep=store_dir)
+
+    return fresh
+
+
+def invalidate_store(store_dir: str):
+    """Forgets a cached store, e.g. after its directory was removed."""
+    with _STORE_CACHE_LOCK:
+        store = _STORE_CACHE.pop(store_dir, None)
+        bm25 = _BM25_CACHE.pop(store_dir, None)
+        if store is not None:
+            _release(store, bm25)
+    _LEXICAL_STATS.remove(store_dir)
+
+
+def get_store_cache_stats() -> Dict:
+    with _STORE_CACHE_LOCK:
+        return {
+            "stores": len(_STORE_CACHE),
+            "max_stores": STORE_CACHE_MAX_STORES,
+            "pinned": len(_PINS),
+            "bytes": sum(_cached_bytes(d) for d in _STORE_CACHE),
+            "max_bytes": STORE_CACHE_MAX_BYTES,
+        }
+
 
 # ---------------------------
 # 🔹 BM25 CACHE
 # ---------------------------
 
-_BM25_CACHE: Dict[str, Dict] = {}
+_BM25_CACHE: Dict[str, BM25Index] = {}
+_BM25_LOCK = threading.Lock()
+_BM25_STORE_LOCKS: Dict[str, threading.Lock] = {}
+
+# Corpus-wide document frequencies / lengths over every store's BM25
+# index, kept current as stores' indexes grow
+_LEXICAL_STATS = LexicalStats()
+_LEXICAL_STATS_READY = False
 
 
-def get_bm25_for_store(store: FAISSStore) -> BM25Okapi:
+def _bm25_lock(store_id: str) -> threading.Lock:
     """
-    Returns cached BM25 index for a store.
-    Rebuilds only if metadata size changes.
+    Lock of one store's BM25 index: catching up one store never waits
+    for another.
     """
+    with _BM25_LOCK:
+        return _BM25_STORE_LOCKS.setdefault(store_id, threading.Lock())
+
+
+def _cached_bm25(store: FAISSStore) -> BM25Index:
+    """The store's BM25 index, opened on a miss. Caller holds its lock."""
     store_id = store.store_dir
-    texts = store.get_all_texts()
-    size = len(texts)
+    bm25 = _BM25_CACHE.get(store_id)
+    if bm25 is None:
+        bm25 = BM25Index(store_id)
+        # Cached only alongside its store, so the store cache budget
+        # bounds both (an evicted store's index is used and dropped)
+        if _STORE_CACHE.get(store_id) is store:
+            _BM25_CACHE[store_id] = bm25
+    return bm25
+
+
+def _catch_up_bm25(bm25: BM25Index, store: FAISSStore) -> Tuple[bool, bool]:
+    """
+    Indexes chunks the BM25 postings have not seen yet and mirrors the
+    store's tombstones into the statistics. Postings built before the
+    store renumbered its ids (or with another analyzer) are rebuilt.
+    Returns (changed, rebuilt). Caller holds the store's BM25 lock.
+    """
+    changed = rebuilt = False
+    if (
+        bm25.epoch != store.epoch
+        or bm25.analyzer != ANALYZER_SIGNATURE
+        or bm25.n_docs > store.ntotal
+    ):
+        bm25.reset(store.epoch)
+        changed = rebuilt = True
+
+    if bm25.n_docs < store.ntotal:
+        bm25.append(store.get_texts(bm25.n_docs, store.ntotal))
+        changed = True
 
-    cached = _BM25_CACHE.get(store_id)
-    if cached and cached["size"] == size:
-        return cached["bm25"]
+    if bm25.set_dead(store.deleted_ids()):
+        changed = True
 
-    # Use a slightly more robust tokenizer
-    tokenized = [t.lower().split() for t in texts]
-    bm25 = BM25Okapi(tokenized)
+    return changed, rebuilt
 
-    _BM25_CACHE[store_id] = {
-        "bm25": bm25,
-        "size": size,
-    }
+
+def get_bm25_for_store(store: FAISSStore) -> BM25Index:
+    """
+    Returns the BM25 index of a store: loaded from disk (mmapped) once
+    per process, then caught up in memory with chunks appended since
+    it was saved. A full rebuild (the store was compacted or the
+    analyzer changed) is saved right away, so it happens once rather
+    than after every restart.
+    """
+    store_id = store.store_dir
+
+    with _bm25_lock(store_id):
+        bm25 = _cached_bm25(store)
+        _, rebuilt = _catch_up_bm25(bm25, store)
+        if rebuilt:
+            bm25.save()
+        _LEXICAL_STATS.update(store_id, bm25)
 
     return bm25
 
 
+def sync_bm25_for_store(store: FAISSStore):
+    """
+    Brings the store's BM25 index on disk up to date. Called after
+    ingest, so only the new chunks are tokenized.
+    """
+    with _bm25_lock(store.store_dir):
+        bm25 = _cached_bm25(store)
+        changed, _ = _catch_up_bm25(bm25, store)
+        if changed or not BM25Index.exists(store.store_dir):
+            bm25.save()
+        _LEXICAL_STATS.update(store.store_dir, bm25)
+
+
+def get_lexical_stats() -> LexicalStats:
+    """
+    Corpus-wide BM25 statistics shared by every store's scoring.
+    Built once from the BM25 indexes saved on disk, then updated
+    incrementally whenever a store's index grows in this process.
+    """
+    global _LEXICAL_STATS_READY
+
+    if _LEXICAL_STATS_READY:
+        return _LEXICAL_STATS
+
+    with _BM25_LOCK:
+        if not _LEXICAL_STATS_READY:
+            names = os.listdir(BASE_STORE_DIR) if os.path.exists(BASE_STORE_DIR) else []
+            for name in names:
+                store_dir = _get_store_dir(name)
+                if name in (DEFAULT_STORE_ID, UNIFIED_STORE_ID) or not BM25Index.exists(store_dir):
+                    continue
+                bm25 = _BM25_CACHE.get(store_dir) or BM25Index(store_dir)
+                if bm25.analyzer == ANALYZER_SIGNATURE:
+                    # Others are counted once rebuilt by get_bm25_for_store
+                    _LEXICAL_STATS.update(store_dir, bm25)
+            _LEXICAL_STATS_READY = True
+
+    return _LEXICAL_STATS
+
+
 # ---------------------------
 # Store helpers
 # ---------------------------
@@ -59,14 +316,39 @@ def _get_store_dir(store_id: str) -> str:
     return os.path.join(BASE_STORE_DIR, store_id)
 
 
+def store_dir_for_document(doc_id: str) -> str:
+    return _get_store_dir(_sanitize_id(doc_id))
+
+
 def get_store_for_document(doc_id: str) -> FAISSStore:
     """
-    Returns a FAISS store for a specific document.
-    Does NOT load anything eagerly.
+    Returns the FAISS store for a specific document.
+    Served from the process-wide cache when already resident.
+    """
+    return _load_store(store_dir_for_document(doc_id))
+
+
+def reset_store_for_document(doc_id: str) -> FAISSStore:
+    """
+    Discards a document's store, BM25 postings and unified index
+    entries, and returns a new empty store in its place. Used when a
+    re-upload replaces a store built with other embeddings.
     """
-    safe_id = _sanitize_id(doc_id)
-    store_dir = _get_store_dir(safe_id)
-    return FAISSStore(dim=EMBED_DIM, store_dir=store_dir)
+    store_dir = store_dir_for_document(doc_id)
+    invalidate_store(store_dir)
+
+    unified = get_unified_store()
+    if unified is not None:
+        unified.remove_document(os.path.basename(store_dir))
+        unified.save()
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    return _load_store(store_dir)
+
+
+def get_store_by_key(key: str) -> FAISSStore:
+    """Returns the store identified by store_key()."""
+    return _load_store(_get_store_dir(key))
 
 
 def get_default_store() -> Optional[FAISSStore]:
@@ -77,7 +359,7 @@ def get_default_store() -> Optional[FAISSStore]:
     if not os.path.exists(store_dir):
         return None
 
-    return FAISSStore(dim=EMBED_DIM, store_dir=store_dir)
+    return _load_store(store_dir)
 
 
 def set_default_store_from_document(doc_id: str) -> FAISSStore:
@@ -91,7 +373,24 @@ def set_default_store_from_document(doc_id: str) -> FAISSStore:
     # Ensure source is saved before identifying it as default
     source_store.save()
 
-    return FAISSStore(dim=EMBED_DIM, store_dir=default_store_dir)
+    return _load_store(default_store_dir)
+
+
+def _is_document_store(store_dir: str) -> bool:
+    # Check for both index and metadata to ensure it's a valid store
+    return os.path.exists(os.path.join(store_dir, "index.faiss"))
+
+
+def _document_store_dirs() -> List[str]:
+    if not os.path.exists(BASE_STORE_DIR):
+        return []
+
+    return [
+        _get_store_dir(name)
+        for name in sorted(os.listdir(BASE_STORE_DIR))
+        if name not in (DEFAULT_STORE_ID, UNIFIED_STORE_ID)
+        and _is_document_store(_get_store_dir(name))
+    ]
 
 
 def list_all_document_stores() -> List[FAISSStore]:
@@ -100,18 +399,165 @@ def list_all_document_stores() -> List[FAISSStore]:
     """
     stores: List[FAISSStore] = []
 
-    if not os.path.exists(BASE_STORE_DIR):
-        return stores
+    for store_dir in _document_store_dirs():
+        try:
+            stores.append(_load_store(store_dir))
+        except EmbeddingMismatchError as e:
+            # One stale store must not take every global search down
+            logger.warning(f"Skipping store: {e}")
 
-    for name in os.listdir(BASE_STORE_DIR):
-        store_dir = _get_store_dir(name)
-        if not os.path.isdir(store_dir) or name == DEFAULT_STORE_ID:
-            continue
+    return stores
+
+
+# ---------------------------
+# 🔹 UNIFIED MULTI-DOCUMENT INDEX
+# ---------------------------
+
+_UNIFIED_STORE: Optional[UnifiedStore] = None
+_UNIFIED_LOCK = threading.Lock()
+
+
+def store_key(store: FAISSStore) -> str:
+    """Identifier of a document store inside the unified index."""
+    return os.path.basename(os.path.normpath(store.store_dir))
+
+
+def get_unified_store() -> Optional[UnifiedStore]:
+    """
+    Returns the shared multi-document index, or None when the
+    per-document layout is configured. A fresh unified index is
+    backfilled from every existing document store.
+    """
+    global _UNIFIED_STORE
+
+    if not USE_UNIFIED_INDEX:
+        return None
+
+    with _UNIFIED_LOCK:
+        if _UNIFIED_STORE is not None and not _UNIFIED_STORE.is_stale():
+            return _UNIFIED_STORE
 
-        # Check for both index and metadata to ensure it's a valid store
-        if os.path.exists(os.path.join(store_dir, "index.faiss")):
-            stores.append(
-                FAISSStore(dim=EMBED_DIM, store_dir=store_dir)
-            )
+        unified_dir = _get_store_dir(UNIFIED_STORE_ID)
+        is_new = not os.path.exists(os.path.join(unified_dir, "docs.json"))
 
-    return stores
\ No newline at end of file
+        try:
+            unified = _open_unified(unified_dir)
+        except EmbeddingMismatchError as e:
+            # Derived data only: rebuild it from the document stores
+            # that match the current embeddings
+            logger.warning(f"{e}; rebuilding it")
+            shutil.rmtree(unified_dir)
+            unified = _open_unified(unified_dir)
+            is_new = True
+
+        if is_new:
+            for store in list_all_document_stores():
+                _sync_into(unified, store)
+            unified.save()
+
+        _UNIFIED_STORE = unified
+        return unified
+
+
+def _open_unified(unified_dir: str) -> UnifiedStore:
+    return UnifiedStore(
+        dim=EMBED_DIM,
+        store_dir=unified_dir,
+        num_shards=VECTORSTORE_UNIFIED_SHARDS,
+        metric=VECTORSTORE_METRIC,
+        embedding=EMBEDDING_SIGNATURE,
+    )
+
+
+def _sync_into(unified: UnifiedStore, store: FAISSStore):
+    if store.metric != unified.metric:
+        # Scores would not be comparable; the store is searched on its own
+        return
+
+    key = store_key(store)
+    indexed = unified.indexed_count(key)
+    total = store.ntotal
+    renumbered = unified.indexed_epoch(key) not in (None, store.epoch)
+
+    if indexed > total or renumbered:
+        # Store shrank or was compacted densely: re-index it from scratch
+        unified.remove_document(key)
+        indexed = 0
+
+    if indexed < total:
+        unified.add_document_vectors(
+            key,
+            store.get_vectors(indexed, total),
+            start_id=indexed,
+            epoch=store.epoch,
+        )
+
+    unified.remove_chunks(key, store.deleted_ids())
+
+
+def sync_unified_store(store: FAISSStore):
+    """
+    Brings the unified index up to date with one document store.
+    Called after ingest; a no-op in the per-document layout.
+    """
+    unified = get_unified_store()
+    if unified is None:
+        return
+
+    _sync_into(unified, store)
+    unified.save()
+
+
+# ---------------------------
+# 🔹 OFFLINE REBUILDS
+# ---------------------------
+
+def document_store_dirs(document_ids: Optional[List[str]] = None) -> List[str]:
+    """
+    Store directories of the given documents, or of every document
+    store when none are given. Raises ValueError for documents that
+    have no store on disk, instead of creating an empty one.
+    """
+    if not document_ids:
+        return _document_store_dirs()
+
+    store_dirs = [store_dir_for_document(d) for d in document_ids]
+    unknown = [d for d, store_dir in zip(document_ids, store_dirs) if not _is_document_store(store_dir)]
+    if unknown:
+        raise ValueError(f"No vector store for document(s): {', '.join(unknown)}")
+    return store_dirs
+
+
+def rebuild_store(
+    store_dir: str,
+    index_type: Optional[str] = None,
+    compression: Optional[str] = None,
+    first_pass_dim: Optional[int] = None,
+) -> FAISSStore:
+    """
+    Regenerates the index of one store from its saved raw vectors, with
+    no embedding calls. The store is opened outside the cache, so this
+    can run in a worker process; sync_rebuilt_store then updates the
+    indexes derived from it.
+    """
+    if not _is_document_store(store_dir):
+        raise ValueError(f"No vector store in {store_dir}")
+
+    store = FAISSStore(dim=EMBED_DIM, store_dir=store_dir, embedding=EMBEDDING_SIGNATURE)
+    store.rebuild(
+        index_type=index_type,
+        compression=compression,
+        first_pass_dim=first_pass_dim,
+    )
+    return store
+
+
+def sync_rebuilt_store(store_dir: str) -> FAISSStore:
+    """
+    Reloads a rebuilt store and brings its BM25 postings and unified
+    index entries up to date (purging tombstones renumbers chunk ids).
+    """
+    store = _load_store(store_dir)
+    sync_bm25_for_store(store)
+    sync_unified_store(store)
+    return store
@@ -0,0 +1,401 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.vectorstore.faiss_store import _load_faiss, EmbeddingMismatchError, LEGACY_EMBEDDING
+
+
+# Chunk ids inside the unified index carry their document:
+#   faiss_id = (doc_num << DOC_ID_SHIFT) | chunk_id
+DOC_ID_SHIFT = 32
+
+
+class _ReadWriteLock:
+    """
+    Shared by searches, exclusive for writers. A waiting writer holds
+    back new searches, so a steady stream of queries cannot starve it.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class UnifiedStore:
+    """
+    One FAISS index, split over a few shards, holding the vectors of
+    EVERY document store.
+
+    Per-document FAISSStores stay the source of truth for chunk text and
+    metadata; this index only answers "which (document, chunk) pairs are
+    nearest", so a query over many documents is one vectorized search
+    per shard instead of one search per document.
+
+    metric matches the document stores it indexes: "l2", or "cosine"
+    for stores that hold normalized vectors in inner-product indexes.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        store_dir: str,
+        num_shards: int = 1,
+        metric: str = "l2",
+        embedding: Optional[Dict] = None,
+    ):
+        self.dim = dim
+        self.store_dir = store_dir
+
+        os.makedirs(store_dir, exist_ok=True)
+
+        self.docs_path = os.path.join(store_dir, "docs.json")
+        self.faiss = _load_faiss()
+
+        # store_id -> {"num": doc number, "count": chunk ids indexed,
+        #              "epoch": store id epoch, "deleted": tombstones applied}
+        self.docs: Dict[str, Dict] = {}
+
+        if os.path.exists(self.docs_path):
+            with open(self.docs_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            num_shards = state["num_shards"]
+            metric = state.get("metric", "l2")
+            self.docs = state["docs"]
+
+            recorded = state.get("embedding", LEGACY_EMBEDDING)
+            if embedding and recorded and recorded != embedding:
+                raise EmbeddingMismatchError(
+                    f"Unified index {store_dir} was built with {recorded}, "
+                    f"current embeddings are {embedding}"
+                )
+            embedding = recorded or embedding
+
+        self.embedding = embedding
+
+        self.metric = metric
+        faiss_metric = (
+            self.faiss.METRIC_INNER_PRODUCT if metric == "cosine"
+            else self.faiss.METRIC_L2
+        )
+
+        self.num_shards = max(1, num_shards)
+        self.shards = []
+
+        for i in range(self.num_shards):
+            path = self._shard_path(i)
+            if os.path.exists(path):
+                self.shards.append(self.faiss.read_index(path))
+            else:
+                self.shards.append(
+                    self.faiss.IndexIDMap2(self.faiss.IndexFlat(dim, faiss_metric))
+                )
+
+        # Writers mutate shards in place: searches share a shard's lock,
+        # a writer takes it alone only while it changes the shard.
+        # _write_lock orders writers, docs and saves.
+        self._shard_locks = [_ReadWriteLock() for _ in range(self.num_shards)]
+        self._write_lock = threading.Lock()
+        # Shards changed since the last save
+        self._dirty = set()
+        self._signature = self.file_signature()
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.store_dir, f"shard_{shard}.faiss")
+
+    def _shard_for(self, doc_num: int) -> int:
+        return doc_num % self.num_shards
+
+    # -------------------------
+    # Document bookkeeping
+    # -------------------------
+
+    def indexed_count(self, store_id: str) -> int:
+        doc = self.docs.get(store_id)
+        return doc["count"] if doc else 0
+
+    def indexed_epoch(self, store_id: str) -> Optional[int]:
+        doc = self.docs.get(store_id)
+        return doc.get("epoch", 0) if doc else None
+
+    def add_document_vectors(
+        self,
+        store_id: str,
+        vectors: np.ndarray,
+        start_id: int,
+        epoch: int = 0,
+    ):
+        """
+        Indexes vectors for chunk ids [start_id, start_id + len(vectors))
+        of one document store.
+        """
+        if len(vectors) == 0:
+            return
+
+        vectors = np.array(vectors, dtype="float32")
+        if self.metric == "cosine":
+            self.faiss.normalize_L2(vectors)
+
+        with self._write_lock:
+            doc = self.docs.get(store_id)
+            if doc is None:
+                next_num = max((d["num"] for d in self.docs.values()), default=-1) + 1
+                doc = {"num": next_num, "count": 0, "epoch": epoch, "deleted": 0}
+
+            if start_id != doc["count"]:
+                raise ValueError(
+                    f"Unified index for '{store_id}' holds {doc['count']} chunks, "
+                    f"cannot append at {start_id}"
+                )
+
+            ids = (np.int64(doc["num"]) << DOC_ID_SHIFT) + np.arange(
+                start_id, start_id + len(vectors), dtype="int64"
+            )
+
+            shard = self._shard_for(doc["num"])
+            with self._shard_locks[shard].write():
+                self.shards[shard].add_with_ids(vectors, ids)
+            self._dirty.add(shard)
+
+            doc["count"] = start_id + len(vectors)
+            self.docs[store_id] = doc
+
+    def remove_chunks(self, store_id: str, chunk_ids: np.ndarray):
+        """
+        Drops tombstoned chunks of one store. chunk_ids is the store's
+        full tombstone list, so repeated calls are harmless.
+        """
+        with self._write_lock:
+            doc = self.docs.get(store_id)
+            if doc is None or len(chunk_ids) <= doc.get("deleted", 0):
+                return
+
+            ids = (np.int64(doc["num"]) << DOC_ID_SHIFT) + np.asarray(chunk_ids, dtype="int64")
+
+            shard = self._shard_for(doc["num"])
+            with self._shard_locks[shard].write():
+                self.shards[shard].remove_ids(self.faiss.IDSelectorBatch(ids))
+            self._dirty.add(shard)
+
+            doc["deleted"] = len(chunk_ids)
+
+    def remove_document(self, store_id: str):
+        with self._write_lock:
+            doc = self.docs.pop(store_id, None)
+            if doc is None:
+                return
+
+            lo = doc["num"] << DOC_ID_SHIFT
+            hi = (doc["num"] + 1) << DOC_ID_SHIFT
+
+            shard = self._shard_for(doc["num"])
+            with self._shard_locks[shard].write():
+                self.shards[shard].remove_ids(self.faiss.IDSelectorRange(lo, hi))
+            self._dirty.add(shard)
+
+    # -------------------------
+    # Search
+    # -------------------------
+
+    def _selector_for(self, wanted: List[int], shard_nums: List[int]):
+        """
+        Selector of the wanted doc numbers among all doc numbers of a
+        shard (sorted), or None when every document is wanted. Wanted
+        documents adjacent in the shard share one id range; the smaller
+        of the wanted and unwanted range sets is used.
+        """
+        wanted_set = set(wanted)
+        if len(wanted_set) == len(shard_nums):
+            return None
+
+        # [first, last] runs of consecutive shard documents, per side
+        runs = {True: [], False: []}
+        previous = None
+        for num in shard_nums:
+            side = runs[num in wanted_set]
+            if side and side[-1][1] == previous:
+                side[-1][1] = num
+            else:
+                side.append([num, num])
+            previous = num
+
+        include = len(runs[True]) <= len(runs[False])
+        selector = None
+        for first, last in runs[include]:
+            part = self.faiss.IDSelectorRange(
+                first << DOC_ID_SHIFT, (last + 1) << DOC_ID_SHIFT
+            )
+            selector = part if selector is None else self.faiss.IDSelectorOr(selector, part)
+
+        return selector if include else self.faiss.IDSelectorNot(selector)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        store_ids: Optional[List[str]] = None,
+    ) -> List[Tuple[str, int, float]]:
+        """
+        Returns up to k (store_id, chunk_id, score) triples, best first,
+        restricted to store_ids when given. score is a squared L2
+        distance, or a cosine similarity for cosine indexes.
+        """
+        return self.search_batch([query_embedding], k, store_ids)[0]
+
+    def search_batch(
+        self,
+        query_matrix,
+        k: int,
+        store_ids: Optional[List[str]] = None,
+    ) -> List[List[Tuple[str, int, float]]]:
+        """search() for many queries at once: one FAISS call per shard."""
+        query_matrix = np.array(query_matrix, dtype="float32")
+        if query_matrix.ndim == 1:
+            query_matrix = query_matrix.reshape(1, -1)
+
+        wanted = store_ids if store_ids is not None else list(self.docs.keys())
+
+        # shard -> (doc numbers, chunk counts)
+        per_shard: Dict[int, Tuple[List[int], List[int]]] = {}
+        num_to_store: Dict[int, str] = {}
+
+        # shard -> every doc number it holds vectors of, sorted
+        shard_nums: Dict[int, List[int]] = {}
+        for doc in list(self.docs.values()):
+            if doc["count"]:
+                shard_nums.setdefault(self._shard_for(doc["num"]), []).append(doc["num"])
+        for nums in shard_nums.values():
+            nums.sort()
+
+        for store_id in wanted:
+            doc = self.docs.get(store_id)
+            if not doc or doc["count"] == 0:
+                continue
+            nums, counts = per_shard.setdefault(self._shard_for(doc["num"]), ([], []))
+            nums.append(doc["num"])
+            counts.append(doc["count"])
+            num_to_store[doc["num"]] = store_id
+
+        if not per_shard or len(query_matrix) == 0:
+            return [[] for _ in range(len(query_matrix))]
+
+        if self.metric == "cosine":
+            self.faiss.normalize_L2(query_matrix)
+
+        all_scores = []
+        all_ids = []
+
+        for shard, (nums, counts) in per_shard.items():
+            selector = self._selector_for(nums, shard_nums[shard])
+            params = self.faiss.SearchParameters(sel=selector) if selector is not None else None
+            with self._shard_locks[shard].read():
+                scores, ids = self.shards[shard].search(
+                    query_matrix, min(k, sum(counts)), params=params
+                )
+            all_scores.append(scores)
+            all_ids.append(ids)
+
+        scores = np.concatenate(all_scores, axis=1)
+        ids = np.concatenate(all_ids, axis=1)
+
+        if self.metric == "cosine":
+            scores = np.where(ids >= 0, scores, -np.inf)
+            order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        else:
+            scores = np.where(ids >= 0, scores, np.inf)
+            order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+
+        scores = np.take_along_axis(scores, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+
+        chunk_mask = (1 << DOC_ID_SHIFT) - 1
+        results: List[List[Tuple[str, int, float]]] = []
+
+        for row_scores, row_ids in zip(scores.tolist(), ids.tolist()):
+            # Unselected shards may hold vectors of a document being
+            # added or removed right now: only known documents are kept
+            results.append([
+                (num_to_store[faiss_id >> DOC_ID_SHIFT], faiss_id & chunk_mask, score)
+                for score, faiss_id in zip(row_scores, row_ids)
+                if faiss_id >= 0 and (faiss_id >> DOC_ID_SHIFT) in num_to_store
+            ])
+
+        return results
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+
+    def file_signature(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.docs_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def is_stale(self) -> bool:
+        return self.file_signature() != self._signature
+
+    def memory_bytes(self) -> int:
+        # vectors plus the int64 id map
+        return sum(s.ntotal for s in self.shards) * (self.dim * 4 + 8)
+
+    def save(self):
+        """
+        Writes the shards changed since the last save, then docs.json.
+        Holding _write_lock keeps the shards unchanged meanwhile, so no
+        shard lock is taken and searches carry on.
+        """
+        with self._write_lock:
+            for i in sorted(self._dirty):
+                path = self._shard_path(i)
+                self.faiss.write_index(self.shards[i], path + ".tmp")
+                os.replace(path + ".tmp", path)
+            self._dirty.clear()
+
+            # docs.json is written last: it marks the shards as complete
+            tmp_path = self.docs_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "num_shards": self.num_shards,
+                    "metric": self.metric,
+                    "embedding": self.embedding,
+                    "docs": self.docs,
+                }, f)
+            os.replace(tmp_path, self.docs_path)
+
+            self._signature = self.file_signature()
@@ -0,0 +1,115 @@
+"""
+Regenerates index.faiss of vector stores from their stored raw vectors
+(embeddings.npy + delta segments), optionally switching index type,
+compression or Matryoshka first-pass dimension. Runs offline: no
+embedding API calls. Stores are rebuilt in parallel, one process per
+store.
+
+Usage:
+    python -m scripts.rebuild_indexes [document_id ...]
+        [--index-type auto|flat|hnsw|ivf] [--compression none|fp16|sq8|pq]
+        [--first-pass-dim D] [--workers N]
+
+Without document ids every document store is rebuilt; an id without
+a store is an error.
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.vectorstore.faiss_store import (
+    EmbeddingMismatchError,
+    INDEX_TYPES,
+    COMPRESSIONS,
+)
+from app.vectorstore.store_manager import (
+    document_store_dirs,
+    rebuild_store,
+    sync_rebuilt_store,
+)
+
+
+def _rebuild(store_dir, index_type, compression, first_pass_dim, threads):
+    # Each worker gets its share of the cores instead of all of them
+    import faiss
+    faiss.omp_set_num_threads(threads)
+
+    start = time.perf_counter()
+    store = rebuild_store(
+        store_dir,
+        index_type=index_type,
+        compression=compression,
+        first_pass_dim=first_pass_dim,
+    )
+
+    return {
+        "store": os.path.basename(store_dir),
+        "chunks": store.ntotal,
+        "index_type": store.index_type,
+        "codec": store.codec,
+        "first_pass_dim": store.first_pass_dim,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("document_ids", nargs="*")
+    parser.add_argument("--index-type", choices=("auto",) + INDEX_TYPES)
+    parser.add_argument("--compression", choices=COMPRESSIONS)
+    parser.add_argument(
+        "--first-pass-dim", type=int,
+        help="leading dimensions indexed for the first pass (0 = full vectors)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    try:
+        store_dirs = document_store_dirs(args.document_ids)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if not store_dirs:
+        print("No vector stores to rebuild")
+        return
+
+    workers = max(1, min(args.workers, len(store_dirs)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _rebuild, d, args.index_type, args.compression, args.first_pass_dim, threads
+            ): d
+            for d in store_dirs
+        }
+
+        for future in as_completed(futures):
+            name = os.path.basename(futures[future])
+            try:
+                row = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{name:<32} FAILED: {e}")
+                continue
+            print(
+                f"{row['store']:<32}{row['chunks']:>10} chunks  "
+                f"{row['index_type']:<6}{row['codec']:<6}"
+                f"{row['first_pass_dim'] or '-':>5}{row['seconds']:>8}s"
+            )
+
+    # Rebuilds that purged tombstones renumbered chunk ids
+    for store_dir in store_dirs:
+        try:
+            sync_rebuilt_store(store_dir)
+        except EmbeddingMismatchError as e:
+            print(f"{os.path.basename(store_dir):<32} NOT SYNCED: {e}")
+
+    if failed:
+        raise SystemExit(f"{failed} store(s) failed to rebuild")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Prints the recall / latency tradeoff of a document's FAISS index
+for each nprobe (IVF) or efSearch (HNSW) setting.
+
+Usage:
+    python -m scripts.tune_index <document_id> [--k 10] [--queries 100]
+"""
+
+import argparse
+
+from app.vectorstore.store_manager import get_store_for_document
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("document_id")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    store = get_store_for_document(args.document_id)
+    report = store.evaluate_search_tradeoff(k=args.k, num_queries=args.queries)
+
+    if not report:
+        print(f"No vectors stored for {args.document_id}")
+        return
+
+    print(f"{args.document_id}: {store.ntotal} chunks, index={store.index_type}, codec={store.codec}")
+    print(
+        f"{'index':<8}{'codec':<8}{'dim':>6}  {'setting':<16}"
+        f"{'recall@' + str(args.k):>12}{'ms/query':>12}"
+    )
+
+    for row in report:
+        setting = "-" if row["param"] is None else f"{row['param']}={row['value']}"
+        print(
+            f"{row['index_type']:<8}{row['codec']:<8}{row['dim']:>6}  {setting:<16}"
+            f"{row['recall_at_k']:>12.4f}{row['latency_ms']:>12.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
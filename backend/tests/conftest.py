@@ -0,0 +1,38 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add the parent directory to sys.path to allow importing from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.vectorstore import store_manager
+from app.vectorstore.bm25_index import LexicalStats
+from app.vectorstore.faiss_store import FAISSStore
+
+DIM = store_manager.EMBED_DIM
+
+
+@pytest.fixture
+def stores_dir(tmp_path, monkeypatch):
+    """An empty vector store directory with fresh process-wide caches."""
+    monkeypatch.setattr(store_manager, "BASE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(store_manager, "_LEXICAL_STATS", LexicalStats())
+    monkeypatch.setattr(store_manager, "_LEXICAL_STATS_READY", False)
+    store_manager._STORE_CACHE.clear()
+    store_manager._BM25_CACHE.clear()
+    yield tmp_path
+    store_manager._STORE_CACHE.clear()
+    store_manager._BM25_CACHE.clear()
+
+
+def make_store(base, name, n=20, seed=0, texts=None):
+    """Saves a document store of n random vectors; returns the vectors."""
+    vectors = np.random.default_rng(seed).normal(size=(n, DIM)).astype("float32")
+    texts = texts or [f"{name} chunk {i}" for i in range(n)]
+    store = FAISSStore(DIM, os.path.join(str(base), name), embedding=store_manager.EMBEDDING_SIGNATURE)
+    store.add(vectors.tolist(), [{"text": t, "source": name} for t in texts])
+    store.save()
+    store.wait_for_compaction()
+    return vectors
@@ -0,0 +1,105 @@
+import os
+import random
+import sys
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+# Add the parent directory to sys.path to allow importing from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.text_analyzer import analyze
+from app.vectorstore.bm25_index import BM25Index, LexicalStats
+
+WORDS = [f"w{i}" for i in range(50)]
+QUERIES = [["w1", "w2"], ["w5", "unknown", "w5"], ["w49"], ["w0", "w7", "w13"]]
+
+
+def make_texts(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(1, 30))) for _ in range(n)]
+
+
+def reference(texts):
+    return BM25Okapi([analyze(t) for t in texts])
+
+
+def test_scores_match_rank_bm25_across_segments(tmp_path):
+    texts = make_texts(400)
+    bm25 = BM25Index(str(tmp_path))
+    bm25.append(texts[:150])
+    bm25.save()
+    bm25 = BM25Index(str(tmp_path))
+    bm25.append(texts[150:300])
+    bm25.append(texts[300:])
+
+    ref = reference(texts)
+    for query in QUERIES:
+        assert np.allclose(bm25.get_scores(query), ref.get_scores(query))
+
+    bm25.save()
+    reloaded = BM25Index(str(tmp_path))
+    assert reloaded.n_docs == 400
+    for query in QUERIES:
+        assert np.allclose(reloaded.get_scores(query), ref.get_scores(query))
+
+
+def test_top_k_and_exclude(tmp_path):
+    texts = make_texts(200, seed=1)
+    bm25 = BM25Index(str(tmp_path))
+    bm25.append(texts)
+    expected = reference(texts).get_scores(QUERIES[3])
+
+    ids, scores = bm25.top_k(QUERIES[3], 10)
+    assert np.allclose(scores, np.sort(expected)[::-1][:10])
+
+    exclude = np.sort(ids[:3])
+    ids, _ = bm25.top_k(QUERIES[3], 10, exclude=exclude)
+    assert not set(ids.tolist()) & set(exclude.tolist())
+
+
+def test_tombstoned_chunks_leave_the_statistics(tmp_path):
+    texts = make_texts(300, seed=2)
+    bm25 = BM25Index(str(tmp_path))
+    bm25.append(texts)
+    dead = np.array(sorted(random.Random(2).sample(range(300), 60)), dtype="int64")
+    assert bm25.set_dead(dead)
+
+    live = np.setdiff1d(np.arange(300), dead)
+    ref = reference([texts[i] for i in live])
+    for query in QUERIES:
+        assert np.allclose(bm25.get_scores(query)[live], ref.get_scores(query))
+
+    bm25.save()
+    reloaded = BM25Index(str(tmp_path))
+    for query in QUERIES:
+        assert np.allclose(reloaded.get_scores(query)[live], ref.get_scores(query))
+
+
+def test_lexical_stats_idf_matches_one_corpus(tmp_path):
+    texts = make_texts(360, seed=3)
+    parts = [texts[:100], texts[100:220], texts[220:]]
+
+    stats = LexicalStats()
+    indexes = []
+    for i, part in enumerate(parts):
+        bm25 = BM25Index(str(tmp_path / f"store{i}"))
+        bm25.append(part)
+        stats.update(f"store{i}", bm25)
+        indexes.append(bm25)
+
+    # Growing a store counts only the difference
+    indexes[0].append(texts[:40])
+    stats.update("store0", indexes[0])
+    corpus = texts + texts[:40]
+
+    ref = reference(corpus)
+    assert stats.n_docs == len(corpus)
+    assert np.isclose(stats.avgdl, ref.avgdl)
+    for word in WORDS:
+        assert np.isclose(stats.idf(word), ref.idf[word])
+
+    stats.remove("store2")
+    ref = reference(texts[:220] + texts[:40])
+    for word in WORDS:
+        assert np.isclose(stats.idf(word), ref.idf[word])
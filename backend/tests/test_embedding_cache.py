@@ -0,0 +1,72 @@
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache, cache_key
+
+DIM = 8
+
+
+def key_of(text, dtype="float32"):
+    return cache_key("model", "RETRIEVAL_DOCUMENT", DIM, dtype, text)
+
+
+def vector(seed):
+    return np.random.default_rng(seed).normal(size=DIM).astype("float32").tolist()
+
+
+def last_used(cache, key):
+    return cache._conn.execute(
+        "SELECT last_used FROM embeddings WHERE key = ?", (key,)
+    ).fetchone()[0]
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=1 << 20)
+    cache.put_many({key_of("a"): vector(0)})
+
+    found = cache.get_many([key_of("a"), key_of("b")], DIM)
+    assert list(found) == [key_of("a")]
+    assert np.allclose(found[key_of("a")], vector(0))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_dtype_switch_misses_instead_of_misreading(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    half = EmbeddingCache(path, max_bytes=1 << 20, dtype="float16")
+    half.put_many({key_of("a", "float16"): vector(0)})
+
+    full = EmbeddingCache(path, max_bytes=1 << 20, dtype="float32")
+    assert full.get_many([key_of("a", "float32")], DIM) == {}
+
+    # A row of the wrong length under the right key is not decoded either
+    full._conn.execute(
+        "INSERT INTO embeddings (key, vector, last_used) VALUES (?, ?, 0)",
+        (key_of("b"), np.zeros(DIM, dtype="float16").tobytes()),
+    )
+    assert full.get_many([key_of("b")], DIM) == {}
+
+
+def test_hits_are_stamped_in_batches(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=1 << 20)
+    cache.put_many({key_of("a"): vector(0)})
+    stamp = last_used(cache, key_of("a"))
+
+    cache.get_many([key_of("a")], DIM)
+    assert last_used(cache, key_of("a")) == stamp
+
+    # The next insert writes the pending stamps first
+    cache.put_many({key_of("b"): vector(1)})
+    assert last_used(cache, key_of("a")) > stamp
+
+
+def test_eviction_keeps_recent_hits(tmp_path):
+    row = DIM * 4
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=row * 10)
+    cache.put_many({key_of(f"old{i}"): vector(i) for i in range(5)})
+    cache.put_many({key_of(f"new{i}"): vector(i) for i in range(5)})
+    cache.get_many([key_of("old0")], DIM)
+
+    cache.put_many({key_of("over"): vector(99)})
+    assert key_of("old0") in cache.get_many([key_of("old0")], DIM)
+    # Evicted down to 90% of the budget from the unused old rows
+    left = cache.get_many([key_of(f"old{i}") for i in range(1, 5)], DIM)
+    assert len(left) == 2
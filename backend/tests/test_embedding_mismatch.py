@@ -0,0 +1,69 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.vectorstore import store_manager
+from app.vectorstore.faiss_store import FAISSStore, EmbeddingMismatchError, LEGACY_EMBEDDING
+
+from conftest import DIM
+
+OTHER_EMBEDDING = {"provider": "local", "model": "other-model", "dim": DIM}
+
+
+def save_store(store_dir, embedding, n=10):
+    vectors = np.random.default_rng(0).normal(size=(n, DIM)).astype("float32")
+    store = FAISSStore(DIM, store_dir, embedding=embedding)
+    store.add(vectors.tolist(), [{"text": f"chunk {i}", "source": "a.pdf"} for i in range(n)])
+    store.save()
+    store.wait_for_compaction()
+    return store
+
+
+def drop_recorded_embedding(store_dir):
+    manifest_path = os.path.join(store_dir, "store.json")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.pop("embedding")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def test_store_from_other_embeddings_is_refused(stores_dir):
+    save_store(store_manager.store_dir_for_document("a.pdf"), OTHER_EMBEDDING)
+
+    with pytest.raises(EmbeddingMismatchError):
+        store_manager.get_store_for_document("a.pdf")
+
+
+def test_reset_replaces_a_mismatched_store(stores_dir):
+    store_dir = store_manager.store_dir_for_document("a.pdf")
+    save_store(store_dir, OTHER_EMBEDDING)
+
+    store = store_manager.reset_store_for_document("a.pdf")
+    assert store.ntotal == 0
+    assert store.embedding == store_manager.EMBEDDING_SIGNATURE
+
+    vectors = np.random.default_rng(1).normal(size=(5, DIM)).astype("float32")
+    store.add(vectors.tolist(), [{"text": "new", "source": "a.pdf"}] * 5)
+    store.save()
+    store.wait_for_compaction()
+    store_manager.sync_bm25_for_store(store)
+
+    store_manager._STORE_CACHE.clear()
+    reloaded = store_manager.get_store_for_document("a.pdf")
+    assert reloaded.ntotal == 5
+    assert store_manager.get_bm25_for_store(reloaded).n_docs == 5
+
+
+def test_legacy_store_is_checked_against_the_original_embeddings(tmp_path):
+    store_dir = str(tmp_path / "a")
+    save_store(store_dir, OTHER_EMBEDDING)
+    drop_recorded_embedding(store_dir)
+
+    with pytest.raises(EmbeddingMismatchError):
+        FAISSStore(DIM, store_dir, embedding=OTHER_EMBEDDING)
+
+    store = FAISSStore(DIM, store_dir, embedding=LEGACY_EMBEDDING)
+    assert store.embedding == LEGACY_EMBEDDING
@@ -0,0 +1,74 @@
+import pytest
+
+from app.services import embedding_providers
+from app.services.embedding_providers import (
+    EMBEDDING_MAX_RETRIES,
+    EmbeddingError,
+    EmbeddingRejectedError,
+    GeminiProvider,
+)
+
+DIM = 4
+
+
+class APIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"status {code}")
+        self.code = code
+
+
+class NoLimit:
+    def acquire(self):
+        pass
+
+
+class ScriptedProvider(GeminiProvider):
+    """Fails with the scripted statuses, in order, then succeeds."""
+
+    def __init__(self, statuses):
+        super().__init__(DIM)
+        self._bucket = NoLimit()
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def _get_client(self):
+        return None
+
+    def _request(self, client, batch, task_type):
+        self.requests.append(list(batch))
+        if self.statuses:
+            raise APIError(self.statuses.pop(0))
+        return [[float(len(text))] * DIM for text in batch]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(embedding_providers.time, "sleep", lambda s: None)
+
+
+def test_transient_errors_are_retried():
+    provider = ScriptedProvider([503, 429])
+    assert provider.embed(["a", "bb"], "RETRIEVAL_DOCUMENT") == [[1.0] * DIM, [2.0] * DIM]
+    assert len(provider.requests) == 3
+
+
+def test_retries_are_bounded():
+    provider = ScriptedProvider([503] * (EMBEDDING_MAX_RETRIES + 5))
+    with pytest.raises(EmbeddingError):
+        provider.embed(["a"], "RETRIEVAL_DOCUMENT")
+    assert len(provider.requests) == EMBEDDING_MAX_RETRIES + 1
+
+
+def test_rejected_input_fails_at_once_without_splitting():
+    provider = ScriptedProvider([400])
+    with pytest.raises(EmbeddingRejectedError):
+        provider.embed(["a", "bb", "ccc", "dddd"], "RETRIEVAL_DOCUMENT")
+    assert provider.requests == [["a", "bb", "ccc", "dddd"]]
+
+
+def test_other_errors_are_not_retried():
+    provider = ScriptedProvider([401])
+    with pytest.raises(EmbeddingError) as raised:
+        provider.embed(["a"], "RETRIEVAL_DOCUMENT")
+    assert not isinstance(raised.value, EmbeddingRejectedError)
+    assert len(provider.requests) == 1
@@ -0,0 +1,196 @@
+import os
+import threading
+import sys
+
+import numpy as np
+import pytest
+
+# Add the parent directory to sys.path to allow importing from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.vectorstore.faiss_store import FAISSStore
+
+DIM = 16
+
+
+def make_vectors(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, DIM)).astype("float32")
+
+
+def chunks_of(source, start, n):
+    return [{"text": f"{source} chunk {i}", "source": source} for i in range(start, start + n)]
+
+
+def live_texts(store):
+    dead = set(store.deleted_ids().tolist())
+    return sorted(t for i, t in enumerate(store.get_all_texts()) if i not in dead)
+
+
+def test_add_save_reload(tmp_path):
+    vectors = make_vectors(60)
+    store = FAISSStore(DIM, str(tmp_path))
+    store.add(vectors[:40].tolist(), chunks_of("a.pdf", 0, 40))
+    store.save()
+    store.add(vectors[40:].tolist(), chunks_of("a.pdf", 40, 20))
+    store.save()
+    store.wait_for_compaction()
+
+    reloaded = FAISSStore(DIM, str(tmp_path))
+    assert reloaded.ntotal == 60
+    assert reloaded.get_all_texts() == store.get_all_texts()
+    assert np.allclose(reloaded.get_vectors(), store.get_vectors(), atol=1e-6)
+
+    hits = reloaded.search(vectors[45].tolist(), k=1)
+    assert hits[0]["text"] == "a.pdf chunk 45"
+
+
+def test_replace_document_tombstones_old_chunks(tmp_path):
+    vectors = make_vectors(70, seed=1)
+    store = FAISSStore(DIM, str(tmp_path))
+    store.add(vectors[:30].tolist(), chunks_of("a.pdf", 0, 30))
+    store.add(vectors[30:50].tolist(), chunks_of("b.pdf", 0, 20))
+    store.save()
+
+    replaced = store.replace_document("b.pdf", vectors[50:].tolist(), chunks_of("b.pdf", 100, 20))
+    assert replaced == 20
+    assert store.live_count == 50
+
+    store.save()
+    store.wait_for_compaction()
+    reloaded = FAISSStore(DIM, str(tmp_path))
+    assert live_texts(reloaded) == live_texts(store)
+    assert "b.pdf chunk 0" not in live_texts(reloaded)
+
+    hits = reloaded.search(vectors[30].tolist(), k=50)
+    assert all(hit["text"] != "b.pdf chunk 0" for hit in hits)
+
+
+def test_dense_compaction_renumbers_and_bumps_epoch(tmp_path):
+    vectors = make_vectors(50, seed=2)
+    store = FAISSStore(DIM, str(tmp_path))
+    store.add(vectors[:25].tolist(), chunks_of("a.pdf", 0, 25))
+    store.add(vectors[25:].tolist(), chunks_of("b.pdf", 0, 25))
+    store.save()
+    epoch = store.epoch
+
+    assert store.delete_document("a.pdf") == 25
+    store.save()
+    store.wait_for_compaction()
+    store.compact()
+
+    assert store.epoch == epoch + 1
+    assert store.ntotal == 25
+    assert store.deleted_count == 0
+    assert store.get_all_texts() == [c["text"] for c in chunks_of("b.pdf", 0, 25)]
+    assert not os.path.exists(store.journal_path)
+
+    reloaded = FAISSStore(DIM, str(tmp_path))
+    assert reloaded.epoch == epoch + 1
+    assert reloaded.ntotal == 25
+    hits = reloaded.search(vectors[30].tolist(), k=1)
+    assert hits[0]["text"] == "b.pdf chunk 5"
+
+
+def test_interrupted_compaction_is_replayed_on_load(tmp_path):
+    vectors = make_vectors(40, seed=3)
+    store = FAISSStore(DIM, str(tmp_path))
+    store.add(vectors[:20].tolist(), chunks_of("a.pdf", 0, 20))
+    store.add(vectors[20:].tolist(), chunks_of("b.pdf", 0, 20))
+    store.save()
+    store.delete_document("a.pdf")
+    store.save()
+    store.wait_for_compaction()
+
+    # Crash right after the journal is written, before any rename
+    original = FAISSStore._replay_journal
+    FAISSStore._replay_journal = lambda self: None
+    try:
+        with store._write_lock:
+            store._compact_dense()
+    except Exception:
+        pass
+    finally:
+        FAISSStore._replay_journal = original
+    assert os.path.exists(store.journal_path)
+
+    reloaded = FAISSStore(DIM, str(tmp_path))
+    assert not os.path.exists(reloaded.journal_path)
+    assert reloaded.ntotal == 20
+    assert reloaded.deleted_count == 0
+    assert reloaded.get_all_texts() == [c["text"] for c in chunks_of("b.pdf", 0, 20)]
+    hits = reloaded.search(vectors[25].tolist(), k=1)
+    assert hits[0]["text"] == "b.pdf chunk 5"
+
+
+def test_save_during_background_compaction_schedules_another(tmp_path, monkeypatch):
+    vectors = make_vectors(500, seed=4)
+    store = FAISSStore(DIM, str(tmp_path))
+    store.add(vectors[:100].tolist(), chunks_of("a.pdf", 0, 100))
+    store.save()
+
+    started = threading.Event()
+    release = threading.Event()
+    original = FAISSStore._vectors_of
+
+    def slow_vectors_of(self, *args, **kwargs):
+        # Holds the first pass after it has fixed which segments it folds
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(FAISSStore, "_vectors_of", slow_vectors_of)
+
+    store.add(vectors[100:300].tolist(), chunks_of("a.pdf", 100, 200))
+    store.save()
+    assert started.wait(5)
+
+    # Lands while the first pass is running
+    store.add(vectors[300:].tolist(), chunks_of("a.pdf", 300, 200))
+    store.save()
+    release.set()
+    store.wait_for_compaction(10)
+
+    assert store.delta_count == 0
+    assert not store._needs_compaction()
+    assert store.index.ntotal == 500
+
+
+def test_first_pass_search_rescores_with_full_vectors(tmp_path):
+    # Matryoshka-like: the leading dimensions carry most of the signal
+    vectors = make_vectors(300, seed=5) * np.where(np.arange(DIM) < 8, 1.0, 0.2)
+    queries = vectors[:10] + 0.05 * make_vectors(10, seed=6)
+
+    exact = FAISSStore(DIM, str(tmp_path / "exact"))
+    two_stage = FAISSStore(DIM, str(tmp_path / "two_stage"), first_pass_dim=8)
+    for store in (exact, two_stage):
+        store.add(vectors.tolist(), chunks_of("a.pdf", 0, 300))
+        store.save()
+        store.wait_for_compaction()
+
+    assert two_stage.index.d == 8
+    for expected, hits in zip(exact.search_batch(queries, k=3), two_stage.search_batch(queries, k=3)):
+        # Shortlisted on 8 dimensions, scored on all 16
+        assert [h["text"] for h in hits] == [h["text"] for h in expected]
+        assert np.allclose([h["distance"] for h in hits], [h["distance"] for h in expected], atol=1e-4)
+
+    reloaded = FAISSStore(DIM, str(tmp_path / "two_stage"))
+    assert reloaded.first_pass_dim == 8
+    assert reloaded.search(queries[0].tolist(), k=1)[0]["text"] == "a.pdf chunk 0"
+
+
+def test_rebuild_switches_the_first_pass_dimension(tmp_path):
+    vectors = make_vectors(100, seed=7)
+    store = FAISSStore(DIM, str(tmp_path))
+    store.add(vectors.tolist(), chunks_of("a.pdf", 0, 100))
+    store.save()
+    store.wait_for_compaction()
+    assert store.index.d == DIM
+
+    store.rebuild(first_pass_dim=4)
+    assert store.index.d == 4
+    assert store.search(vectors[42].tolist(), k=1)[0]["text"] == "a.pdf chunk 42"
+
+    with pytest.raises(ValueError):
+        store.rebuild(first_pass_dim=DIM)
@@ -0,0 +1,48 @@
+import itertools
+import os
+import sys
+
+import numpy as np
+
+# Add the parent directory to sys.path to allow importing from app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.retriever import _linear_assignment
+
+
+def brute_force_cost(cost):
+    """Lowest total cost of any one-to-one assignment of min(n, m) pairs."""
+    n, m = cost.shape
+    if n > m:
+        return brute_force_cost(cost.T)
+    return min(
+        sum(cost[row, col] for row, col in enumerate(cols))
+        for cols in itertools.permutations(range(m), n)
+    )
+
+
+def assignment_cost(cost, cols_of_rows):
+    assigned = [(row, col) for row, col in enumerate(cols_of_rows) if col >= 0]
+    return sum(cost[row, col] for row, col in assigned), assigned
+
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for n, m in [(1, 1), (3, 3), (4, 6), (6, 4), (5, 5), (2, 7)]:
+        for _ in range(20):
+            cost = rng.normal(size=(n, m))
+            cols_of_rows = _linear_assignment(cost)
+
+            total, assigned = assignment_cost(cost, cols_of_rows)
+            assert len(assigned) == min(n, m)
+            assert len({col for _, col in assigned}) == len(assigned)
+            assert np.isclose(total, brute_force_cost(cost))
+
+
+def test_ties_and_integer_costs():
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        cost = rng.integers(0, 3, size=(5, 5)).astype("float64")
+        total, assigned = assignment_cost(cost, _linear_assignment(cost))
+        assert len({col for _, col in assigned}) == 5
+        assert np.isclose(total, brute_force_cost(cost))
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from app.services.query_coalescer import QueryCoalescer
+
+
+class RecordingEmbedder:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self.lock:
+            self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("provider down")
+        return [[float(len(t))] for t in texts]
+
+
+def embed_concurrently(coalescer, texts):
+    results = [None] * len(texts)
+    start = threading.Barrier(len(texts))
+
+    def worker(i):
+        start.wait()
+        try:
+            results[i] = coalescer.embed(texts[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(texts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results
+
+
+def test_concurrent_texts_share_one_batch():
+    embedder = RecordingEmbedder()
+    coalescer = QueryCoalescer(embedder, window_s=0.2, max_batch=16)
+
+    texts = ["a", "bb", "a", "ccc"]
+    assert embed_concurrently(coalescer, texts) == [[1.0], [2.0], [1.0], [3.0]]
+    assert len(embedder.batches) == 1
+    assert sorted(embedder.batches[0]) == ["a", "bb", "ccc"]
+    assert coalescer.stats()["deduplicated"] == 1
+
+
+def test_batches_never_exceed_max_batch():
+    embedder = RecordingEmbedder()
+    coalescer = QueryCoalescer(embedder, window_s=0.2, max_batch=4)
+
+    texts = [f"text {i:02d}" for i in range(11)]
+    assert embed_concurrently(coalescer, texts) == [[float(len(t))] for t in texts]
+    assert all(len(batch) <= 4 for batch in embedder.batches)
+    assert sorted(t for batch in embedder.batches for t in batch) == texts
+
+
+def test_failures_reach_every_waiter():
+    coalescer = QueryCoalescer(RecordingEmbedder(fail=True), window_s=0.2, max_batch=16)
+
+    results = embed_concurrently(coalescer, ["a", "b", "c"])
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    with pytest.raises(RuntimeError):
+        coalescer.embed("d")
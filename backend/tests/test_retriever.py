@@ -0,0 +1,151 @@
+import importlib
+import threading
+
+import numpy as np
+import pytest
+
+from app.services import retriever
+from app.vectorstore import store_manager
+
+from conftest import make_store
+
+
+@pytest.fixture
+def corpus(stores_dir, monkeypatch):
+    """Three document stores and a query embedding equal to d1's chunk 3."""
+    vectors = {name: make_store(stores_dir, name, seed=i) for i, name in enumerate(("d1", "d2", "d3"))}
+    monkeypatch.setattr(retriever, "embed_query", lambda q: vectors["d1"][3].tolist())
+    monkeypatch.setattr(retriever, "RETRIEVAL_DEADLINE_MS", 0)
+    retriever._RESULT_CACHE.clear()
+    yield vectors
+    retriever._RESULT_CACHE.clear()
+
+
+@pytest.fixture
+def bm25_calls(monkeypatch):
+    calls = []
+    original = retriever.get_bm25_for_store
+
+    def counting(store):
+        calls.append(store.store_dir)
+        return original(store)
+
+    monkeypatch.setattr(retriever, "get_bm25_for_store", counting)
+    return calls
+
+
+def test_cache_hit_does_no_bm25_work(corpus, bm25_calls):
+    first = retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+    assert first[0]["text"] == "d1 chunk 3"
+    assert len(bm25_calls) == 3
+
+    second = retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+    assert [c["text"] for c in second] == [c["text"] for c in first]
+    assert len(bm25_calls) == 3
+
+
+def test_cached_chunks_are_copies(corpus):
+    first = retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+    first[0]["text"] = "changed by the caller"
+    second = retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+    assert second[0]["text"] == "d1 chunk 3"
+
+
+def test_store_changes_miss_the_cache(corpus, stores_dir):
+    retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+
+    store = store_manager.get_store_for_document("d2")
+    store.add([corpus["d1"][3].tolist()], [{"text": "d2 copy of d1 chunk 3", "source": "d2"}])
+    store.save()
+
+    texts = [c["text"] for c in retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])]
+    assert "d2 copy of d1 chunk 3" in texts
+
+
+def test_lexical_only_matches_join_the_candidates(corpus, stores_dir):
+    texts = [f"d4 chunk {i}" for i in range(20)]
+    texts[17] = "the zebra paragraph"
+    make_store(stores_dir, "d4", seed=9, texts=texts)
+
+    chunks = retriever.retrieve("zebra", 6, ["d1", "d4"])
+    assert "the zebra paragraph" in [c["text"] for c in chunks]
+
+
+def test_fusion_ranks_candidates_of_all_stores_together(monkeypatch):
+    semantic = np.array([0.9, 0.5, 0.7])
+    lexical = np.array([0.0, 4.0, 2.0])
+
+    monkeypatch.setattr(retriever, "HYBRID_FUSION", "weighted")
+    fused = retriever._fuse_scores(semantic, lexical, 0.8, 0.2)
+    assert np.allclose(fused, [0.72, 0.6, 0.66])
+
+    monkeypatch.setattr(retriever, "HYBRID_FUSION", "rrf")
+    fused = retriever._fuse_scores(semantic, lexical, 0.8, 0.2)
+    # Only chunks containing a query term get a lexical share
+    rrf_k = retriever.HYBRID_RRF_K
+    expected = np.array([
+        0.8 / (rrf_k + 1),
+        0.8 / (rrf_k + 3) + 0.2 / (rrf_k + 1),
+        0.8 / (rrf_k + 2) + 0.2 / (rrf_k + 2),
+    ]) * (rrf_k + 1)
+    assert np.allclose(fused, expected)
+
+
+@pytest.fixture
+def candidate_calls(monkeypatch):
+    """Records the stores searched; stores named in slow wait for release."""
+    calls = []
+    slow = set()
+    release = threading.Event()
+    original = retriever._hybrid_candidates
+
+    def tracked(store, *args):
+        key = store_manager.store_key(store)
+        calls.append(key)
+        if key in slow:
+            release.wait(5)
+        return original(store, *args)
+
+    monkeypatch.setattr(retriever, "_hybrid_candidates", tracked)
+    yield calls, slow
+    release.set()
+
+
+def test_stores_are_searched_concurrently(corpus, monkeypatch):
+    all_inside = threading.Barrier(3, timeout=5)
+    original = retriever._hybrid_candidates
+
+    def overlapping(*args):
+        all_inside.wait()
+        return original(*args)
+
+    monkeypatch.setattr(retriever, "_hybrid_candidates", overlapping)
+    chunks = retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+    assert chunks[0]["text"] == "d1 chunk 3"
+
+
+def test_stores_past_the_deadline_are_skipped(corpus, candidate_calls, monkeypatch):
+    calls, slow = candidate_calls
+    slow.add("d1")
+    monkeypatch.setattr(retriever, "RETRIEVAL_DEADLINE_MS", 200)
+
+    chunks = retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+    assert chunks
+    assert all(c["_skipped_stores"] == ["d1"] for c in chunks)
+    assert not any(c["text"].startswith("d1 ") for c in chunks)
+
+    # Partial results are not cached
+    retriever.retrieve("d1 chunk", 4, ["d1", "d2", "d3"])
+    assert sorted(calls) == ["d1", "d1", "d2", "d2", "d3", "d3"]
+
+
+def test_unknown_fusion_mode_is_rejected(monkeypatch):
+    from app.core import config
+
+    monkeypatch.setenv("HYBRID_FUSION", "borda")
+    try:
+        with pytest.raises(ValueError):
+            importlib.reload(config)
+    finally:
+        monkeypatch.delenv("HYBRID_FUSION")
+        importlib.reload(config)
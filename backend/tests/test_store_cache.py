@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from app.vectorstore import store_manager
+from app.vectorstore.faiss_store import FAISSStore
+
+from conftest import DIM, make_store
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Counts stores read from disk by the cache."""
+    counter = {"n": 0}
+
+    class CountingStore(FAISSStore):
+        def __init__(self, *args, **kwargs):
+            counter["n"] += 1
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(store_manager, "FAISSStore", CountingStore)
+    return counter
+
+
+def test_hits_are_served_without_reloading(stores_dir, loads):
+    make_store(stores_dir, "a")
+    first = store_manager.get_store_for_document("a")
+    assert store_manager.get_store_for_document("a") is first
+    assert loads["n"] == 1
+
+
+def test_changed_files_reload_the_store(stores_dir, loads):
+    vectors = make_store(stores_dir, "a")
+    first = store_manager.get_store_for_document("a")
+
+    writer = FAISSStore(DIM, os.path.join(str(stores_dir), "a"))
+    writer.add(vectors[:5].tolist(), [{"text": "more", "source": "a"}] * 5)
+    writer.save()
+    writer.wait_for_compaction()
+
+    second = store_manager.get_store_for_document("a")
+    assert second is not first
+    assert second.ntotal == 25
+    assert loads["n"] == 2
+
+
+def test_count_budget_evicts_least_recently_used(stores_dir, loads, monkeypatch):
+    monkeypatch.setattr(store_manager, "STORE_CACHE_MAX_STORES", 2)
+    for name in "abc":
+        make_store(stores_dir, name)
+
+    for name in "abc":
+        store_manager.get_store_for_document(name)
+
+    cached = [os.path.basename(d) for d in store_manager._STORE_CACHE]
+    assert cached == ["b", "c"]
+
+
+def test_pinned_stores_survive_a_query_larger_than_the_budget(stores_dir, loads, monkeypatch):
+    monkeypatch.setattr(store_manager, "STORE_CACHE_MAX_STORES", 4)
+    names = [f"doc{i}" for i in range(6)]
+    for i, name in enumerate(names):
+        make_store(stores_dir, name, seed=i)
+
+    store_dirs = store_manager.document_store_dirs(names)
+    for _ in range(3):
+        with store_manager.pin_stores(store_dirs):
+            for name in names:
+                store_manager.get_store_for_document(name)
+
+    # Loaded once each: later queries found every store still cached
+    assert loads["n"] == len(names)
+
+
+def test_mapped_files_do_not_count_against_the_budget(stores_dir):
+    make_store(stores_dir, "a", n=200)
+    store = store_manager.get_store_for_document("a")
+    if not store._mmapped:
+        pytest.skip("store is not memory-mapped in this configuration")
+
+    assert store.memory_bytes() < 200 * DIM * 4
@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+
+from app.vectorstore.unified_store import UnifiedStore
+
+DIM = 16
+
+
+def make_unified(tmp_path, num_shards=1):
+    rng = np.random.default_rng(0)
+    unified = UnifiedStore(DIM, str(tmp_path / "unified"), num_shards=num_shards)
+    vectors = {name: rng.normal(size=(10, DIM)).astype("float32") for name in ("a", "b")}
+    for name, v in vectors.items():
+        unified.add_document_vectors(name, v, start_id=0)
+    return unified, vectors
+
+
+def test_search_is_restricted_to_the_given_stores(tmp_path):
+    unified, vectors = make_unified(tmp_path)
+
+    hits = unified.search(vectors["a"][3], k=1)
+    assert hits[0][:2] == ("a", 3)
+
+    hits = unified.search(vectors["a"][3], k=5, store_ids=["b"])
+    assert {store_id for store_id, _, _ in hits} == {"b"}
+
+
+def test_searches_of_one_shard_run_concurrently(tmp_path):
+    unified, vectors = make_unified(tmp_path)
+    shard = unified.shards[0]
+    both_inside = threading.Barrier(2, timeout=5)
+
+    class Overlapping:
+        # Each search waits until the other one is inside the shard too
+        def search(self, *args, **kwargs):
+            both_inside.wait()
+            return shard.search(*args, **kwargs)
+
+    unified.shards[0] = Overlapping()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(unified.search(vectors["b"][1], k=1)))
+        for _ in range(2)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [hits[0][:2] for hits in results] == [("b", 1), ("b", 1)]
+
+
+def test_save_does_not_block_searches(tmp_path, monkeypatch):
+    unified, vectors = make_unified(tmp_path)
+    writing = threading.Event()
+    searched = threading.Event()
+    waited_out = []
+    write_index = unified.faiss.write_index
+
+    def slow_write_index(index, path):
+        writing.set()
+        # The search below must finish while the shard is being written
+        waited_out.append(not searched.wait(2))
+        write_index(index, path)
+
+    monkeypatch.setattr(unified.faiss, "write_index", slow_write_index)
+    saver = threading.Thread(target=unified.save)
+    saver.start()
+    assert writing.wait(5)
+
+    hits = unified.search(vectors["a"][7], k=1)
+    searched.set()
+    saver.join()
+
+    assert hits[0][:2] == ("a", 7)
+    assert waited_out == [False]
+    reloaded = UnifiedStore(DIM, str(tmp_path / "unified"))
+    assert reloaded.indexed_count("a") == 10